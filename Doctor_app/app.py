@@ -1,23 +1,47 @@
 from fastapi import FastAPI, Depends, Request, HTTPException, Form, UploadFile, File
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from db import get_db,SessionLocal
-from models import Doctor, Notification, Patient
-from passlib.context import CryptContext
-from fastapi.responses import RedirectResponse, StreamingResponse, HTMLResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db,SessionLocal, get_async_db, AsyncSessionLocal
+from models import Doctor, Notification, FinalReport, ReportDraft, Patient
+from features import columns
+from report_store import ReportStore
+from parkinson_common.uploads import UploadStore, UploadError, tus_headers, header_int, parse_metadata
+from parkinson_common.service_auth import ServiceAuth
+from parkinson_common.file_responses import ConditionalStaticFiles, file_response, etag_matches
+from extraction_cache import ExtractionCache, content_hash
+from feature_extractor import low_confidence
+from pdf_pool import PdfPool, PoolBusy, JobTimeout, BrokenProcessPool
+from report_render import render_final_report
+from report_catalog import record_report, list_reports, report_filename
+import report_gc
+from parkinson_common.pagination import keyset_page
+from report_search import ReportSearch
+from feature_store import FeatureStore
+from sessions import make_session_store
+from auth import Authenticator, ProfileCache, DoctorProfile
+from parkinson_common.service_client import ServiceClient, CircuitOpen
+from parkinson_common.broker import LocalBroker, last_event_id
+from parkinson_common.passwords import PasswordHasher, HasherBusy
+from job_queue import JobQueue
+from inference import MicroBatcher
+from bulk_scoring import DuplexStreamingResponse, iter_lines, csv_row_parser, parse_jsonl_row, score_rows
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache
+from parkinson_common.metrics import MetricsMiddleware, registry, sample_debug, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from fastapi.responses import RedirectResponse, StreamingResponse, HTMLResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from starlette.status import HTTP_303_SEE_OTHER
-from fastapi.staticfiles import StaticFiles
 from io import BytesIO
 from datetime import datetime
 import os
+import json
+import hashlib
 import pickle
 import logging
-from fpdf import FPDF
 import numpy as np
-import requests
-from PyPDF2 import PdfReader
-import re
-from flask import Flask, request, render_template, redirect, url_for, flash
+import httpx
 
 app = FastAPI()
 from fastapi.middleware.cors import CORSMiddleware
@@ -29,37 +53,101 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-route latency, status and database use, served at /metrics
+app.add_middleware(MetricsMiddleware)
 # Secret key for session management
 SECRET_KEY = "your_super_secret_key"
 
 # Configure templates and static files
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def login_state(request: Request):
+    # Navbar login state. Only reads the doctor the route's auth dependency
+    # resolved (in the threadpool), as this runs on the event loop for async routes.
+    return {"logged_in": getattr(request.state, "doctor", None) is not None}
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+templates = Jinja2Templates(directory="templates", context_processors=[login_state])
+app.mount("/static", ConditionalStaticFiles(directory="static"), name="static")
 
-# In-memory session storage (simulated)
-active_sessions = {}
+# Password hashing on its own threads, off the shared threadpool
+password_hasher = PasswordHasher()
 
-# Hash password
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# Logged-in sessions, shared by all worker processes (see sessions.py)
+session_store = make_session_store()
 
-# Verify password
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# The logged-in doctor of each request, with profiles cached per worker
+auth = Authenticator(session_store, ProfileCache().listen())
 
-# Check login status
-def is_logged_in(request: Request) -> bool:
-    return request.cookies.get("session_id") in active_sessions
+# Routes only Patient_app calls require its service token
+service_auth = ServiceAuth()
 
-# Middleware to check if user is logged in and pass it to templates
-@app.middleware("http")
-async def add_logged_in_status(request: Request, call_next):
-    request.state.logged_in = is_logged_in(request)
-    response = await call_next(request)
-    return response
+# Received report PDFs, stored on disk by content hash
+report_store = ReportStore()
+
+# Resumable report uploads from Patient_app, assembled next to the store so
+# finished ones are moved into it without a copy
+uploads = UploadStore(os.path.join(report_store.root, "uploads"))
+
+# Worker processes for PDF parsing and rendering, kept off the event loop
+pdf_pool = PdfPool()
+
+# Text and features extracted from report PDFs, keyed by content hash
+extraction_cache = ExtractionCache(pdf_pool)
+
+# Received reports waiting for report_worker.py to extract their features and
+# draft a prediction; its depth and lag are exported on /metrics
+report_jobs = JobQueue()
+registry.on_collect(report_jobs.observe)
+
+# Full-text index of received reports, for /search
+report_search = ReportSearch()
+
+# Every scored visit's features and result, per patient, for /patients/trends
+feature_store = FeatureStore()
+
+@app.exception_handler(PoolBusy)
+async def pdf_pool_busy(request: Request, exc: PoolBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server is busy processing reports, please retry shortly."}, headers={"Retry-After": "5"})
+
+@app.exception_handler(BrokenProcessPool)
+async def pdf_pool_broken(request: Request, exc: BrokenProcessPool):
+    # The job's worker died twice (see PdfPool.run), e.g. a PDF that crashes the parser
+    return JSONResponse(status_code=503, content={"detail": "Server could not process the report, please retry shortly."}, headers={"Retry-After": "5"})
+
+@app.exception_handler(JobTimeout)
+async def pdf_job_timeout(request: Request, exc: JobTimeout):
+    return JSONResponse(status_code=504, content={"detail": "Processing the PDF took too long."})
+
+@app.exception_handler(UploadError)
+async def upload_error(request: Request, exc: UploadError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers={**tus_headers(), **exc.headers})
+
+@app.exception_handler(HasherBusy)
+async def password_hasher_busy(request: Request, exc: HasherBusy):
+    return JSONResponse(status_code=503, content={"detail": "Too many logins at once, please retry shortly."}, headers={"Retry-After": "2"})
+
+@app.on_event("shutdown")
+def stop_pdf_pool():
+    pdf_pool.shutdown()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+# Pooled async client for calls to Patient_app
+PATIENT_APP_URL = os.getenv("PATIENT_APP_URL", "http://localhost:5002")
+patient_app = ServiceClient(PATIENT_APP_URL)
+
+@app.on_event("shutdown")
+async def close_service_clients():
+    await patient_app.aclose()
+
+# Live notification streams of the doctors connected to this worker
+broker = LocalBroker()
+# Missed notifications sent to a reconnecting stream, newest kept
+STREAM_REPLAY_LIMIT = 100
+
+# Doctors per page of the /doctors directory API
+DOCTORS_PAGE_SIZE = 100
+DOCTORS_MAX_PAGE_SIZE = 500
 
 # Root Page
 @app.get("/", response_class=RedirectResponse)
@@ -67,26 +155,26 @@ def root():
     return RedirectResponse(url="/home", status_code=HTTP_303_SEE_OTHER)
 
 # Home Page
-@app.get("/home")
+@app.get("/home", dependencies=[Depends(auth.optional)])
 def home_page(request: Request):
     return templates.TemplateResponse("home.html", {"request": request})
 
 # Signup Page
-@app.get("/signup")
+@app.get("/signup", dependencies=[Depends(auth.optional)])
 def signup_page(request: Request):
     return templates.TemplateResponse("signup.html", {"request": request})
 
 @app.post("/signup")
-def signup(
+async def signup(
     username: str = Form(...),
     password: str = Form(...),
     name: str = Form(...),
     email: str = Form(...),
     qualification: str = Form(...),
     position: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    hashed_password = hash_password(password)
+    hashed_password = await password_hasher.hash(password)
     new_doctor = Doctor(
         username=username,
         password=hashed_password,
@@ -96,78 +184,190 @@ def signup(
         position=position
     )
     db.add(new_doctor)
-    db.commit()
-    db.refresh(new_doctor)
+    await db.commit()
     return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
 # Login Page
-@app.get("/login")
+@app.get("/login", dependencies=[Depends(auth.optional)])
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
-@app.post("/login")
-def login(
+def save_password_hash(db, doctor_id, password_hash):
+    db.query(Doctor).filter(Doctor.id == doctor_id).update({"password": password_hash})
+    db.commit()
+
+@app.post("/login", dependencies=[Depends(auth.optional)])
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    doctor = db.query(Doctor).filter(Doctor.username == username).first()
-    if not doctor or not verify_password(password, doctor.password):
+    doctor = (await db.execute(select(Doctor.id, Doctor.password).where(Doctor.username == username))).first()
+    matches, new_hash = await password_hasher.verify(password, doctor.password) if doctor else (False, None)
+    if not matches:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid credentials"})
+    if new_hash:
+        # Stored with an old cost; keep the hash made with the current one
+        await db.run_sync(save_password_hash, doctor.id, new_hash)
 
-    session_id = str(doctor.id)
-    active_sessions[session_id] = doctor.id  # Store doctor ID in session
+    session_id = await run_in_threadpool(session_store.create, doctor.id)  # Random token for this login
     response = RedirectResponse(url="/dashboard", status_code=HTTP_303_SEE_OTHER)
-    response.set_cookie(key="session_id", value=session_id)  # Set cookie for session management
+    response.set_cookie(
+        key="session_id", value=session_id, max_age=session_store.ttl, httponly=True, samesite="lax"
+    )  # Set cookie for session management
     return response
 
 # Logout Route
 @app.get("/logout")
 def logout(request: Request):
-    session_id = request.cookies.get("session_id")
-    if session_id in active_sessions:
-        del active_sessions[session_id]
+    session_store.revoke(request.cookies.get("session_id"))
     response = RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
     response.delete_cookie("session_id")  # Remove session cookie
     return response
 
 # Dashboard Page
 @app.get("/dashboard")
-def dashboard(request: Request, db: Session = Depends(get_db)):
-    if not is_logged_in(request):
+def dashboard(
+    request: Request,
+    before: int = None,
+    doctor: DoctorProfile = Depends(auth.optional),
+    db: Session = Depends(get_db)
+):
+    if doctor is None:
         return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
-    session_id = request.cookies.get("session_id")
-    doctor_id = active_sessions.get(session_id)
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
-    notifications = db.query(Notification).filter(Notification.doctor_id == doctor_id).all()
+    # Newest first, one page at a time, served by ix_notifications_doctor_date
+    notifications, next_before = keyset_page(
+        db.query(Notification).filter(Notification.doctor_id == doctor.id),
+        Notification.date, Notification.id, before
+    )
+
+    # The first page listens for new notifications past the newest one shown
+    stream_after = max((n.id for n in notifications), default=0) if before is None else None
+
+    return templates.TemplateResponse("dashboard.html", {"request": request, "doctor": doctor, "notifications": notifications, "next_before": next_before, "stream_after": stream_after})
+
+def notification_event(notification_id, patient_name, date):
+    # What a dashboard needs to show a new notification card
+    return notification_id, "notification", {"id": notification_id, "patient_name": patient_name, "date": date}
+
+def missed_notifications(db, doctor_id, after):
+    rows = db.query(Notification.id, Notification.patient_name, Notification.date).filter(
+        Notification.doctor_id == doctor_id, Notification.id > after
+    ).order_by(Notification.id.desc()).limit(STREAM_REPLAY_LIMIT).all()
+    return [notification_event(*row) for row in reversed(rows)]
+
+# Live notifications for the logged-in doctor, as Server-Sent Events. Resumes
+# after the Last-Event-ID header on reconnect, or after `last_id` on first connect.
+@app.get("/notifications/stream")
+async def notification_stream(request: Request, last_id: int = 0, doctor: DoctorProfile = Depends(auth.required)):
+    after = last_event_id(request, last_id)
+
+    async def replay():
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(missed_notifications, doctor.id, after)
 
-    return templates.TemplateResponse("dashboard.html", {"request": request, "doctor": doctor, "notifications": notifications})
+    return StreamingResponse(
+        broker.stream(f"doctor:{doctor.id}", replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Profile Page
 @app.get("/profile")
-def profile(request: Request, db: Session = Depends(get_db)):
-    if not is_logged_in(request):
+def profile(request: Request, doctor: DoctorProfile = Depends(auth.optional)):
+    if doctor is None:
         return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
-    session_id = request.cookies.get("session_id")
-    doctor_id = active_sessions.get(session_id)
-    doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
     return templates.TemplateResponse("profile.html", {"request": request, "doctor": doctor})
 
-# API to fetch list of doctors
-@app.get("/doctors")
-def get_doctors(db: Session = Depends(get_db)):
-    return db.query(Doctor).all()
+# A doctor's profile picture
+@app.get("/doctors/{doctor_id}/profile-pic")
+def doctor_profile_pic(doctor_id: int, db: Session = Depends(get_db)):
+    picture = db.query(Doctor.profile_pic).filter(Doctor.id == doctor_id).scalar()
+    if not picture:
+        raise HTTPException(status_code=404, detail="No profile picture")
+    return Response(picture, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=300"})
 
-# API to receive reports from patients
-@app.post("/receive-report")
+# API to fetch list of doctors: public profile fields only, paged by id
+# (next page in the Link header), with an ETag so an unchanged page costs a 304
+@app.get("/doctors")
+def get_doctors(request: Request, after: int = 0, limit: int = DOCTORS_PAGE_SIZE, db: Session = Depends(get_db)):
+    limit = max(1, min(limit, DOCTORS_MAX_PAGE_SIZE))
+    rows = db.query(
+        Doctor.id, Doctor.name, Doctor.email, Doctor.qualification, Doctor.position,
+        Doctor.profile_pic.isnot(None)
+    ).filter(Doctor.id > after).order_by(Doctor.id).limit(limit + 1).all()
+
+    doctors = [
+        {
+            "id": doctor_id,
+            "name": name,
+            "email": email,
+            "qualification": qualification,
+            "position": position,
+            "profile_pic": str(request.url_for("doctor_profile_pic", doctor_id=doctor_id)) if has_picture else None,
+        }
+        for doctor_id, name, email, qualification, position, has_picture in rows[:limit]
+    ]
+    body = json.dumps(doctors).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if len(rows) > limit:
+        headers["Link"] = f'</doctors?after={doctors[-1]["id"]}&limit={limit}>; rel="next"'
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Resumable uploads (tus 1.0 subset, see uploads.py) of reports that are
+# then passed to /receive-report as upload_id. Only Patient_app sends them,
+# each counted against the quota of the patient it names as the owner.
+@app.options("/uploads")
+def upload_capabilities():
+    return Response(status_code=204, headers=uploads.capabilities())
+
+@app.post("/uploads", dependencies=[Depends(service_auth)])
+def create_upload(request: Request):
+    owner = parse_metadata(request.headers.get("upload-metadata")).get("owner")
+    upload_id = uploads.create(header_int(request, "upload-length"), owner=owner)
+    return Response(status_code=201, headers=tus_headers(Location=f"/uploads/{upload_id}"))
+
+@app.head("/uploads/{upload_id}", dependencies=[Depends(service_auth)])
+def upload_offset(upload_id: str):
+    info = uploads.info(upload_id)
+    return Response(headers=tus_headers(Upload_Offset=info["offset"], Upload_Length=info["length"], Cache_Control="no-store"))
+
+@app.patch("/uploads/{upload_id}", dependencies=[Depends(service_auth)])
+async def upload_chunk(request: Request, upload_id: str):
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise UploadError(415, "Chunks must be sent as application/offset+octet-stream")
+    offset = await uploads.append(
+        upload_id, header_int(request, "upload-offset"), request.stream(), request.headers.get("upload-checksum")
+    )
+    return Response(status_code=204, headers=tus_headers(Upload_Offset=offset))
+
+@app.delete("/uploads/{upload_id}", dependencies=[Depends(service_auth)])
+def delete_upload(upload_id: str):
+    uploads.info(upload_id)
+    uploads.delete(upload_id)
+    return Response(status_code=204, headers=tus_headers())
+
+# Resumable upload counters
+@app.get("/uploads/stats")
+def upload_stats():
+    return uploads.stats()
+
+# API to receive reports from patients, sent either as the `report` file or
+# as the `upload_id` of a finished upload; only Patient_app may call it
+@app.post("/receive-report", dependencies=[Depends(service_auth)])
 def receive_report(
     doctor_id: int = Form(...),
     patient_name: str = Form(...),
     date: str = Form(...),
-    report: UploadFile = File(...),
+    report: UploadFile = File(None),
+    upload_id: str = Form(None),
     db: Session = Depends(get_db)
 ):
     doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
@@ -175,29 +375,53 @@ def receive_report(
         raise HTTPException(status_code=404, detail="Doctor not found")
 
     # Save the report and create a notification
-    file_content = report.file.read()
+    if upload_id is not None:
+        report_hash, report_size = report_store.save_file(uploads.completed_path(upload_id))
+        uploads.delete(upload_id)
+    elif report is not None:
+        report_hash, report_size = report_store.save(report.file)
+    else:
+        raise HTTPException(status_code=400, detail="Send the report file or an upload_id")
     notification = Notification(
         doctor_id=doctor_id,
         patient_name=patient_name,
         date=datetime.fromisoformat(date),
-        report=file_content
+        report_hash=report_hash,
+        report_size=report_size
     )
     db.add(notification)
+    db.flush()
+    # Pre-processed in the background; queued in the same transaction, so no
+    # received report is left without its job
+    report_jobs.enqueue(db, notification.id, report_hash)
+    # Searchable by name and date right away, by its text once extracted
+    report_search.add(db, notification)
     db.commit()
 
+    # Push it to the doctor's open dashboards
+    broker.publish(f"doctor:{doctor_id}", *notification_event(notification.id, patient_name, notification.date))
+
     return {"message": "Report received successfully"}
 
 # Download Report API
 @app.get("/download-report")
-def download_report(notification_id: int, db: Session = Depends(get_db)):
+def download_report(request: Request, notification_id: int, db: Session = Depends(get_db)):
     notification = db.query(Notification).filter(Notification.id == notification_id).first()
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
 
-    return StreamingResponse(
-        BytesIO(notification.report),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=report_{notification_id}.pdf"}
+    headers = {"Content-Disposition": f"attachment; filename=report_{notification_id}.pdf"}
+    if not notification.report_hash:
+        # Not yet moved out of the database by migrate_reports.py
+        return StreamingResponse(BytesIO(notification.report), media_type="application/pdf", headers=headers)
+
+    # Stored reports never change, so their content hash is a strong ETag
+    return file_response(
+        request,
+        report_store.path(notification.report_hash),
+        f'"{notification.report_hash}"',
+        "application/pdf",
+        headers
     )
 
 # Delete Notification API
@@ -207,97 +431,240 @@ def delete_notification(notification_id: int = Form(...), db: Session = Depends(
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
 
+    report_hash = notification.report_hash
     db.delete(notification)
     db.commit()
+    report_search.remove(db, notification_id)
+
+    # Identical reports share one stored file; remove it once nothing points at it
+    report_gc.collect(db, report_store, [report_hash])
 
     return RedirectResponse(url="/dashboard", status_code=HTTP_303_SEE_OTHER)
 
 
 
-columns = [
-    "MDVP:Fo(Hz)", "MDVP:Fhi(Hz)", "MDVP:Flo(Hz)", "MDVP:Jitter(%)", "MDVP:Jitter(Abs)",
-    "MDVP:RAP", "MDVP:PPQ", "Jitter:DDP", "MDVP:Shimmer", "MDVP:Shimmer(dB)",
-    "Shimmer:APQ3", "Shimmer:APQ5", "MDVP:APQ", "Shimmer:DDA", "NHR", "HNR",
-    "RPDE", "DFA", "spread1", "spread2", "D2", "PPE"
-]
+def requeue_report(db, notification_id, digest):
+    # Queue a stored report to be pre-processed again, unless it already is
+    job = report_jobs.latest(db, notification_id)
+    if job is None or job.status not in ("queued", "running"):
+        report_jobs.enqueue(db, notification_id, digest)
+        db.commit()
 
-@app.post("/detect-text", response_class=HTMLResponse)
+async def current_draft(db, digest, notification_id=None):
+    # The report's draft prediction, unless a model since replaced made it;
+    # the report is then queued to be redone with the current model
+    draft = await db.get(ReportDraft, digest)
+    if draft is None:
+        return None
+    await run_in_threadpool(model_registry.get)
+    if draft.model_version == model_registry.version:
+        return draft
+    if notification_id is not None:
+        await db.run_sync(requeue_report, notification_id, digest)
+    return None
+
+@app.post("/detect-text", response_class=HTMLResponse, dependencies=[Depends(auth.optional)])
 async def detect_text(
     request: Request,
     notification_id: int = Form(...),
     pdf_file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    detected_data = {col: "" for col in columns}
-
     if pdf_file.content_type != 'application/pdf':
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF files are accepted.")
 
     try:
         pdf_content = await pdf_file.read()
-        pdf_io = BytesIO(pdf_content)
-        pdf_reader = PdfReader(pdf_io)
-        text = ""
-
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text
-
-        text = text.replace('\n', ' ').strip()
-        text = re.sub(r'\s+', ' ', text)
-
-        # Log the extracted text for debugging
-        logging.info(f"Extracted text: {text}")
-
-        for column in columns:
-            # Updated regex pattern to be more flexible
-            pattern = rf"{re.escape(column)}\s*[:]*\s*([-+]?\d*\.\d+|\d+)"
-            match = re.search(pattern, text)
-            if match:
-                detected_data[column] = match.group(1)
+        # Re-uploads of a report we've already parsed skip PDF parsing
+        digest = await run_in_threadpool(content_hash, pdf_content)
+        text, detected_data, confidence = await extraction_cache.get_or_extract(db, digest, pdf_content)
+        draft = await current_draft(db, digest)
+        # Make the notification findable by the text, unless it already is.
+        # Only if this is the report stored for it: the form is open to anyone,
+        # and any other PDF would let them rewrite what the notification is found by.
+        report_hash = await db.scalar(select(Notification.report_hash).where(Notification.id == notification_id))
+        if report_hash == digest:
+            await db.run_sync(report_search.set_text, notification_id, text)
+
+        # Log the extracted text of a sample of reports, for debugging
+        if sample_debug():
+            logging.info("Extracted text: %s", text)
 
         return templates.TemplateResponse(
             "analyze_report.html",
             {
                 "request": request,
                 "notification_id": notification_id,
-                "detected_data": detected_data
+                "detected_data": detected_data,
+                "low_confidence": low_confidence(confidence),
+                "draft": draft
             }
         )
 
+    except (PoolBusy, JobTimeout, BrokenProcessPool):
+        raise
     except Exception as e:
         logging.error(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while processing the PDF file.")
 # Analyze Report Route
-@app.post("/analyze-report", response_class=HTMLResponse)
+@app.post("/analyze-report", response_class=HTMLResponse, dependencies=[Depends(auth.optional)])
 async def analyze_report(
     request: Request,
     notification_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Fetch the notification from the database
-    notification = db.query(Notification).filter(Notification.id == notification_id).first()
+    notification = await db.get(Notification, notification_id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
 
-    # Use PyPDF2 to extract text from the report
-    pdf_reader = PdfReader(BytesIO(notification.report))
-    detected_text = ""
-    for page in pdf_reader.pages:
-        detected_text += page.extract_text() + "\n"
+    # Extract text and features from the report, once per distinct PDF.
+    # report_worker.py has usually done it by now, making this a lookup.
+    if notification.report_hash:
+        digest, source = notification.report_hash, report_store.path(notification.report_hash)
+    else:
+        # Legacy inline report; the column is deferred, so load it explicitly
+        report = await db.scalar(select(Notification.report).where(Notification.id == notification_id))
+        digest, source = content_hash(report), report
+    text, detected_data, confidence = await extraction_cache.get_or_extract(db, digest, source)
+    # Only stored reports can be queued; legacy inline ones are not pre-processed
+    draft = await current_draft(db, digest, notification_id if notification.report_hash else None)
+    await db.run_sync(report_search.set_text, notification_id, text)
 
     return templates.TemplateResponse(
         "analyze_report.html",
         {
             "request": request,
             "notification_id": notification_id,
-            "detected_data": detected_text
+            "detected_data": detected_data,
+            "low_confidence": low_confidence(confidence),
+            "draft": draft
+        }
+    )
+
+# The logged-in doctor's received reports matching `q` (patient name, date or
+# report text), best first with highlighted snippets; format=json for the API
+@app.get("/search")
+def search_reports(
+    request: Request,
+    q: str = "",
+    page: int = 1,
+    format: str = None,
+    doctor: DoctorProfile = Depends(auth.optional),
+    db: Session = Depends(get_db)
+):
+    if doctor is None:
+        if format == "json":
+            raise HTTPException(status_code=403, detail="User not logged in")
+        return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
+    if not report_search.enabled:
+        raise HTTPException(status_code=501, detail="Search needs an SQLite database")
+
+    results, has_next, truncated = report_search.search(db, doctor.id, q, page)
+    if format == "json":
+        return {
+            "query": q,
+            "page": page,
+            "next_page": page + 1 if has_next else None,
+            "truncated": truncated,
+            "results": [{**result, "patient_name": str(result["patient_name"]), "snippet": str(result["snippet"])} for result in results]
         }
+    return templates.TemplateResponse("search.html", {
+        "request": request,
+        "q": q,
+        "page": page,
+        "results": results,
+        "has_next": has_next,
+        "truncated": truncated,
+        "rank_window": report_search.rank_window
+    })
+
+# Pre-processing state of a received report
+@app.get("/notifications/{notification_id}/job")
+def notification_job(notification_id: int, db: Session = Depends(get_db)):
+    job = report_jobs.latest(db, notification_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No pre-processing job for this notification")
+    return {
+        "id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+# Report pre-processing queue depth and lag
+@app.get("/report-jobs/stats")
+def report_jobs_stats(db: Session = Depends(get_db)):
+    return report_jobs.stats(db)
+
+# Extraction cache hit/miss counters
+@app.get("/extraction-cache/stats")
+def extraction_cache_stats():
+    return extraction_cache.stats()
+
+# Loaded on first prediction and hot-reloaded when model.pkl changes
+model_registry = ModelRegistry()
+# Concurrent final reports share one vectorized model.predict call
+batcher = MicroBatcher(model_registry.predict)
+# Predictions and rendered reports of feature vectors already scored, dropped
+# when the model changes
+prediction_cache = PredictionCache(model_registry, report_store)
+
+# PDF worker pool queue, timeout and duration stats
+@app.get("/pdf-pool/stats")
+def pdf_pool_stats():
+    return pdf_pool.stats()
+
+# Inference batching stats
+@app.get("/inference/stats")
+def inference_stats():
+    return batcher.stats()
+
+# Prediction and rendered report cache hit rates
+@app.get("/prediction-cache/stats")
+def prediction_cache_stats():
+    return prediction_cache.stats()
+
+# Currently loaded model version
+@app.get("/model/status")
+def model_status():
+    return model_registry.stats()
+
+# Bulk scoring of a streamed CSV (UCI-parkinsons columns) or JSON-lines upload
+@app.post("/batch-predict")
+async def batch_predict(request: Request, format: str = None, doctor: DoctorProfile = Depends(auth.required)):
+    content_type = request.headers.get("content-type", "")
+    input_format = format or ("jsonl" if "json" in content_type else "csv")
+    lines = iter_lines(request.stream())
+
+    if input_format == "csv":
+        header = None
+        async for line in lines:
+            if line is None:
+                raise HTTPException(status_code=400, detail="CSV header is too long")
+            if line.strip():
+                header = line
+                break
+        if header is None:
+            raise HTTPException(status_code=400, detail="Empty CSV upload")
+        try:
+            parse_row = csv_row_parser(header)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif input_format == "jsonl":
+        parse_row = parse_jsonl_row
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported format. Use csv or jsonl.")
+
+    return DuplexStreamingResponse(
+        score_rows(lines, parse_row, model_registry.predict),
+        media_type="application/x-ndjson"
     )
 
-import joblib
-model = joblib.load('model.pkl')
 # Final Report Generation
 @app.post("/final-report")
 async def final_report(
@@ -325,25 +692,15 @@ async def final_report(
     spread2: float = Form(...),
     d2: float = Form(...),
     ppe: float = Form(...),
-    db: Session = Depends(get_db)
+    doctor: DoctorProfile = Depends(auth.required),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Get session ID and doctor ID
-    session_id = request.cookies.get("session_id")
-    doctor_id = active_sessions.get(session_id)
-
-    if not doctor_id:
-        raise HTTPException(status_code=403, detail="User not logged in")
-
     # Retrieve notification to get patient name and ID
-    notification = db.query(Notification).filter(Notification.id == notification_id).first()
+    notification = await db.get(Notification, notification_id)
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
 
     patient_name = notification.patient_name
-    patient_id = notification.id  # Assuming you have this in the Notification model
-    doctor_name = db.query(Doctor).filter(Doctor.id == doctor_id).first().name  # Retrieve doctor name
-    report_filename = f"{patient_name.replace(' ', '_')}_parkinsons_report.pdf"
-    report_path = f"static/final_reports/{report_filename}"
 
     # Prepare input for prediction
     input_features = np.array([[mdvp_fo, mdvp_fhi, mdvp_flo, mdvp_jitter, mdvp_jitter_abs,
@@ -352,119 +709,138 @@ async def final_report(
                                 mdvp_apq, shimmer_dda, nhr, hnr, rpde, dfa,
                                 spread1, spread2, d2, ppe]])
 
-    # Perform prediction
-    prediction = model.predict(input_features)
-    prediction_result = "Positive" if prediction[0] == 1 else "Negative"
-
-    # Generate and save report
-    # Generate and save report
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-
-    # Center the title
-    pdf.cell(0, 10, "Parkinson Disease Detection Report", ln=True, align='C')
-    pdf.ln(10)  # Add a line break for spacing
-
-    # Add patient name
-    pdf.cell(0, 10, f"Patient Name: {patient_name}", ln=True)
-    pdf.cell(0, 10, f"Prediction Result: {prediction_result}", ln=True)
-    pdf.cell(0, 10, f"Report by: Dr. {doctor_name}", ln=True, align='R')
-    pdf.ln(10)  # Line break for spacing
-
-    # Add input feature values
-    pdf.cell(0, 10, f"MDVP:Fo(Hz): {mdvp_fo}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Fhi(Hz): {mdvp_fhi}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Flo(Hz): {mdvp_flo}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Jitter(%): {mdvp_jitter}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Jitter(Abs): {mdvp_jitter_abs}", ln=True)
-    pdf.cell(0, 10, f"MDVP:RAP: {mdvp_rap}", ln=True)
-    pdf.cell(0, 10, f"MDVP:PPQ: {mdvp_ppq}", ln=True)
-    pdf.cell(0, 10, f"Jitter:DDP: {jitter_ddp}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Shimmer: {mdvp_shimmer}", ln=True)
-    pdf.cell(0, 10, f"MDVP:Shimmer(dB): {mdvp_shimmer_db}", ln=True)
-    pdf.cell(0, 10, f"Shimmer:APQ3: {shimmer_apq3}", ln=True)
-    pdf.cell(0, 10, f"Shimmer:APQ5: {shimmer_apq5}", ln=True)
-    pdf.cell(0, 10, f"MDVP:APQ: {mdvp_apq}", ln=True)
-    pdf.cell(0, 10, f"Shimmer:DDA: {shimmer_dda}", ln=True)
-    pdf.cell(0, 10, f"NHR: {nhr}", ln=True)
-    pdf.cell(0, 10, f"HNR: {hnr}", ln=True)
-    pdf.cell(0, 10, f"RPDE: {rpde}", ln=True)
-    pdf.cell(0, 10, f"DFA: {dfa}", ln=True)
-    pdf.cell(0, 10, f"Spread1: {spread1}", ln=True)
-    pdf.cell(0, 10, f"Spread2: {spread2}", ln=True)
-    pdf.cell(0, 10, f"D2: {d2}", ln=True)
-    pdf.cell(0, 10, f"PPE: {ppe}", ln=True)
-    # Save the PDF to the specified path
-    pdf.output(report_path)
-
-    # Here you can store the report info in the database if needed
-
-    # Prepare the list of generated reports
-    reports = [f for f in os.listdir("static/final_reports") if f.endswith(".pdf")]
-
-    # Render the final report HTML page
+    # Perform prediction; a re-submission of the same values reuses the
+    # model's earlier answer
+    values = input_features[0].tolist()
+    prediction = await prediction_cache.predict(db, values, batcher.predict)
+    prediction_result = "Positive" if prediction == 1 else "Negative"
+    # Kept per patient for their trends and the cohort's; scoring the same
+    # notification again replaces its visit
+    await db.run_sync(feature_store.record, patient_name, values, prediction, notification_id)
+
+    # Render the report in a worker process and keep it in the report store,
+    # unless the same report was rendered before; record it in the catalog
+    async def render():
+        pdf_bytes = await pdf_pool.run(render_final_report, patient_name, prediction_result, doctor.name, values)
+        return await run_in_threadpool(report_store.save_bytes, pdf_bytes)
+
+    report_hash, report_size = await prediction_cache.render(
+        db, values, prediction_result, patient_name, doctor.name, render
+    )
+    replaced = await db.run_sync(record_report, doctor.id, notification_id, patient_name, prediction_result, report_hash, report_size)
+    if replaced != report_hash:
+        await db.run_sync(report_gc.collect, report_store, [replaced])
+
+    # Render the final report HTML page with the doctor's latest reports
+    reports, next_before = await db.run_sync(list_reports, doctor.id)
     return templates.TemplateResponse("final_report.html", {
         "request": request,
         "patient": {"name": patient_name},
         "prediction": prediction_result,
-        "reports": reports
+        "reports": reports,
+        "next_before": next_before
     })
 
-# PATIENT_APP_URL = "http://localhost:5002/receive_report"  # Patient app URL
-
-@app.route('/send_to_patient', methods=['POST'])
-def send_to_patient():
-    # Accessing form data from the request
-    patient_username = request.form.get('patient_username')
-    selected_report = request.form.get('report')
-
-    if not patient_username or not selected_report:
-        flash("Patient username and selected report must be provided.", "danger")
-        return redirect(url_for('final_report', username=patient_username))
-
-    report_path = f"static/final_reports/{selected_report}"
-
-    if not os.path.isfile(report_path):
-        flash("The selected report file does not exist.", "danger")
-        return redirect(url_for('final_report', username=patient_username))
+# Feature trends of the patient called `name`: their visits, latest values,
+# change since the previous visit and per day, and cohort percentiles of
+# those. Without `name`, percentiles of the same across all patients.
+@app.get("/patients/trends")
+def patient_trends(name: str = None, doctor: DoctorProfile = Depends(auth.required), db: Session = Depends(get_db)):
+    cohort = feature_store.load(db)
+    if name is None:
+        return feature_store.cohort_summary(cohort)
+    patient = db.query(Patient.id).filter(Patient.name == name).first()
+    trends = feature_store.patient_trends(cohort, patient.id) if patient else None
+    if trends is None:
+        raise HTTPException(status_code=404, detail="No scored visits for this patient")
+    return trends
+
+# Generated reports of the logged-in doctor, one page at a time
+@app.get("/final-reports", response_class=HTMLResponse)
+def final_reports(
+    request: Request,
+    before: int = None,
+    sent: str = None,
+    doctor: DoctorProfile = Depends(auth.required),
+    db: Session = Depends(get_db)
+):
+    reports, next_before = list_reports(db, doctor.id, before)
+    return templates.TemplateResponse("final_report.html", {
+        "request": request,
+        "reports": reports,
+        "next_before": next_before,
+        "sent": sent
+    })
 
-    patient_api_url = "http://localhost:5002/patient/receive_report"
+# Download a generated report
+@app.get("/final-reports/{report_id}")
+def download_final_report(
+    request: Request,
+    report_id: int,
+    doctor: DoctorProfile = Depends(auth.required),
+    db: Session = Depends(get_db)
+):
+    report = db.query(FinalReport).filter(FinalReport.id == report_id, FinalReport.doctor_id == doctor.id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    return file_response(
+        request,
+        report_store.path(report.report_hash),
+        f'"{report.report_hash}"',
+        "application/pdf",
+        {"Content-Disposition": f"inline; filename={report_filename(report)}"}
+    )
 
-    with open(report_path, 'rb') as report_file:
-        files = {'report': report_file}
-        data = {
-            'patient_username': patient_username,
-            'report_filename': selected_report
-        }
+# Send a generated report to the patient's app
+@app.post("/send_to_patient")
+async def send_to_patient(
+    report: int = Form(...),
+    doctor: DoctorProfile = Depends(auth.required),
+    db: AsyncSession = Depends(get_async_db)
+):
+    final_report = await db.scalar(select(FinalReport).where(FinalReport.id == report, FinalReport.doctor_id == doctor.id))
+    if not final_report or not report_store.exists(final_report.report_hash):
+        raise HTTPException(status_code=404, detail="The selected report does not exist.")
+
+    # Always to the patient the report was written for; notifications carry
+    # the patient's username as patient_name
+    patient_username = final_report.patient_name
+    filename = report_filename(final_report)
+    # The file is streamed as the multipart body, not read into memory
+    with open(report_store.path(final_report.report_hash), "rb") as report_file:
         try:
-            response = requests.post(patient_api_url, files=files, data=data)
-            if response.status_code == 200:
-                flash("Report sent to patient successfully!", "success")
-                
-                # Create notification after successfully sending the report
-                create_notification(patient_username, selected_report)
-                
-            else:
-                flash("Failed to send report to patient.", "danger")
-        except requests.exceptions.RequestException as e:
-            flash(f"An error occurred while sending the report: {e}", "danger")
-
-    return redirect(url_for('final_report', username=patient_username))
-
-def create_notification(patient_username, report_filename):
-    # Assuming you have access to the database session here
-    db: Session = SessionLocal()
-    
-    # Find the patient by username
-    patient = db.query(Patient).filter(Patient.name == patient_username).first()
-    if patient:
-        notification = Notification(
-            doctor_id=None,  # Set this if you have doctor ID available
-            patient_id=patient.id,
-            patient_name=patient.username,
-            date=datetime.now(),
-            report=report_filename.encode()  # Store the filename as the report content
-        )
-        db.add(notification)
-        db.commit()
+            response = await patient_app.post(
+                "/patient/receive_report",
+                data={"patient_username": patient_username, "report_filename": filename},
+                files={"report": (filename, report_file, "application/pdf")}
+            )
+            status = "sent" if response.status_code == 200 and "error" not in response.json() else "failed"
+        except (httpx.HTTPError, ValueError) as e:
+            logging.error(f"Sending report {report} to patient failed: {e!r}")
+            status = "failed"
+        except CircuitOpen:
+            status = "unavailable"
+
+    return RedirectResponse(url=f"/final-reports?sent={status}", status_code=HTTP_303_SEE_OTHER)
+
+# Patient_app client connection and circuit breaker stats
+@app.get("/service-client/stats")
+def service_client_stats():
+    return patient_app.stats()
+
+# Open notification streams and events pushed by this worker
+@app.get("/broker/stats")
+def broker_stats():
+    return broker.stats()
+
+# Password hashing queue and rehash counts
+@app.get("/password-hasher/stats")
+def password_hasher_stats():
+    return password_hasher.stats()
+
+# Prometheus metrics of this worker: request latency, database use, PDF
+# jobs, model inference and calls to Patient_app
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
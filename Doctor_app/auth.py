@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+
+from db import SessionLocal
+from models import Doctor
+
+# Seconds a worker reuses a doctor's profile before reading it again
+PROFILE_CACHE_SECONDS = float(os.getenv("PROFILE_CACHE_SECONDS", "30"))
+
+# What pages need of the logged-in doctor; leaves out the password hash and
+# the profile picture blob (profile_pic is its URL, or None)
+DoctorProfile = namedtuple(
+    "DoctorProfile", ["id", "username", "name", "email", "qualification", "position", "profile_pic"]
+)
+
+_UNRESOLVED = object()
+
+
+def load_profile(db, doctor_id):
+    row = db.query(
+        Doctor.id, Doctor.username, Doctor.name, Doctor.email, Doctor.qualification, Doctor.position,
+        Doctor.profile_pic.isnot(None)
+    ).filter(Doctor.id == doctor_id).first()
+    if row is None:
+        return None
+    *fields, has_picture = row
+    return DoctorProfile(*fields, f"/doctors/{doctor_id}/profile-pic" if has_picture else None)
+
+
+class ProfileCache:
+    """Doctor profiles by id, each kept for `ttl` seconds.
+
+    Updates to a Doctor through the ORM drop its entry in this process at
+    once; other workers see the change within `ttl`.
+    """
+
+    def __init__(self, ttl=PROFILE_CACHE_SECONDS, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, doctor_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._profiles.get(doctor_id)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+        self.misses += 1
+        with self.session_factory() as db:
+            profile = load_profile(db, doctor_id)
+        if profile is not None:
+            with self._lock:
+                self._profiles[doctor_id] = (profile, now + self.ttl)
+        return profile
+
+    def invalidate(self, doctor_id):
+        with self._lock:
+            self._profiles.pop(doctor_id, None)
+
+    def listen(self):
+        # Drop a doctor's profile whenever the row is updated or deleted
+        def invalidate(mapper, connection, target):
+            self.invalidate(target.id)
+        event.listen(Doctor, "after_update", invalidate)
+        event.listen(Doctor, "after_delete", invalidate)
+        return self
+
+
+class Authenticator:
+    # Resolves the logged-in doctor once per request, into request.state.doctor
+    def __init__(self, session_store, profiles):
+        self.session_store = session_store
+        self.profiles = profiles
+
+    def resolve(self, request):
+        if getattr(request.state, "doctor", _UNRESOLVED) is _UNRESOLVED:
+            doctor_id = self.session_store.get(request.cookies.get("session_id"))
+            request.state.doctor = self.profiles.get(doctor_id) if doctor_id is not None else None
+        return request.state.doctor
+
+    def optional(self, request: Request):
+        # Dependency: the DoctorProfile, or None when not logged in
+        return self.resolve(request)
+
+    def required(self, request: Request):
+        # Dependency: the DoctorProfile; 403 when not logged in
+        doctor = self.resolve(request)
+        if doctor is None:
+            raise HTTPException(status_code=403, detail="User not logged in")
+        return doctor
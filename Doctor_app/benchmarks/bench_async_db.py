@@ -0,0 +1,122 @@
+"""Database access from async endpoints under concurrency: a sync Session on the event loop vs db.AsyncSessionLocal.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_async_db.py [rows] [concurrency] [requests]
+
+Builds a throwaway notifications table like bench_notifications.py (default
+100000 rows) and runs `requests` dashboard-style lookups (a notification
+by id, then the first keyset page), `concurrency` at a time (default 32 and
+2000): first the old way, a sync Session called straight from the
+coroutine, then with each ASYNC_DB_DRIVER. Meanwhile a ticker measures how
+late a 5 ms sleep on the event loop wakes up, which is the delay every
+other request on the worker sees.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from bench_notifications import DOCTOR_ID, build  # noqa: E402
+from db import ThreadpoolSession  # noqa: E402
+from models import Notification  # noqa: E402
+from parkinson_common.pagination import keyset_page  # noqa: E402
+
+TICK = 0.005
+
+
+def first_page(db):
+    return keyset_page(
+        db.query(Notification).filter(Notification.doctor_id == DOCTOR_ID), Notification.date, Notification.id
+    )
+
+
+def blocking_lookup(session_factory):
+    # What the async endpoints did before: sync queries inside the coroutine
+    async def lookup(notification_id):
+        with session_factory() as db:
+            db.get(Notification, notification_id)
+            first_page(db)
+    return lookup
+
+
+def async_lookup(session_factory):
+    async def lookup(notification_id):
+        async with session_factory() as db:
+            await db.get(Notification, notification_id)
+            await db.run_sync(first_page)
+    return lookup
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+async def measure(lookup, ids, concurrency, requests):
+    latencies, lags = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = asyncio.Event()
+
+    async def request(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await lookup(ids[i % len(ids)])
+            latencies.append(time.perf_counter() - start)
+
+    async def ticker():
+        while not finished.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    finished.set()
+    await ticking
+    return elapsed, latencies, lags
+
+
+async def main(rows, concurrency, requests):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        build(engine, rows, 64)
+        BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        with BenchSession() as db:
+            ids = [row.id for row in db.query(Notification.id).limit(1000)]
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+        modes = (
+            ("sync on loop (before)", blocking_lookup(BenchSession)),
+            ("aiosqlite", async_lookup(async_sessionmaker(async_engine, expire_on_commit=False))),
+            ("threadpool", async_lookup(lambda: ThreadpoolSession(BenchSession))),
+        )
+        print(f"{rows} rows, {requests} lookups, {concurrency} concurrent")
+        print(f"{'':22} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'loop lag p99 ms':>16} {'max ms':>8}")
+        for label, lookup in modes:
+            # One untimed pass warms the connection pools and SQLite's page cache
+            await measure(lookup, ids, concurrency, concurrency)
+            elapsed, latencies, lags = await measure(lookup, ids, concurrency, requests)
+            print(
+                f"{label:22} {requests / elapsed:7.0f} {percentile(latencies, 0.5) * 1000:8.2f} "
+                f"{percentile(latencies, 0.99) * 1000:8.2f} {percentile(lags, 0.99) * 1000:16.2f} "
+                f"{max(lags) * 1000:8.2f}"
+            )
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    asyncio.run(main(rows, concurrency, requests))
@@ -0,0 +1,70 @@
+"""Feature parsing benchmark: per-column regex scans vs the single-pass extractor.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_feature_extractor.py [pages]
+
+Builds a long synthetic multi-page report (prose filler with the feature
+table on the last page), then times the legacy path (two whitespace
+normalisation passes plus one re.search per column) against
+normalize_text + FeatureExtractor, and checks both find the same values.
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_extractor import extractor  # noqa: E402
+from features import columns  # noqa: E402
+from report_text import normalize_text  # noqa: E402
+
+REPEATS = 20
+FILLER = (
+    "The patient was asked to sustain the vowel for as long as possible.\n"
+    "Recording  conditions were   quiet and the microphone was kept at 8 cm.\n"
+)
+
+
+def build_report(pages, seed=0):
+    rng = random.Random(seed)
+    body = [FILLER * 40 for _ in range(pages - 1)]
+    table = "\n".join(f"{column}: {rng.uniform(0.001, 200):.6f}" for column in columns)
+    return "\n".join(body + [table])
+
+
+def legacy_parse(text):
+    text = text.replace('\n', ' ')
+    text = re.sub(r'\s+', ' ', text)
+    detected = {}
+    for column in columns:
+        match = re.search(rf"{re.escape(column)}\s*[:]*\s*([-+]?\d*\.\d+|\d+)", text)
+        detected[column] = match.group(1) if match else ""
+    return detected
+
+
+def single_pass_parse(text):
+    normalize_text(text)
+    return extractor.parse(text)[0]
+
+
+def _time(fn, text):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = fn(text)
+    return (time.perf_counter() - start) / REPEATS, result
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    text = build_report(pages)
+    legacy_seconds, legacy = _time(legacy_parse, text)
+    new_seconds, new = _time(single_pass_parse, text)
+
+    mismatches = [column for column in columns if float(legacy[column]) != float(new[column])]
+    print(f"report: {pages} pages, {len(text) / 1024:.0f} KiB")
+    print(f"legacy:      {legacy_seconds * 1000:8.2f} ms")
+    print(f"single pass: {new_seconds * 1000:8.2f} ms  ({legacy_seconds / new_seconds:.1f}x)")
+    print(f"mismatches:  {len(mismatches)} {mismatches if mismatches else ''}")
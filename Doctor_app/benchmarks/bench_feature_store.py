@@ -0,0 +1,111 @@
+"""Patient trend analytics over packed per-patient arrays against one ORM row per visit.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_feature_store.py [patients] [visits]
+
+Uses a throwaway SQLite database with `patients` (default 5000) patients of
+`visits` (default 6) scored visits each. Times what /patients/trends does:
+loading the cohort from patient_features and computing the cohort summary,
+and one patient's trends. Compares the load against reading the same visits
+as ORM objects of a row-per-visit table, the layout the arrays replace, and
+times recording one visit.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_feature_store.db"
+
+from sqlalchemy import Column, DateTime, Float, Integer  # noqa: E402
+from sqlalchemy.orm import declarative_base  # noqa: E402
+
+from db import Base, SessionLocal, engine  # noqa: E402
+from feature_store import FeatureStore, pack_visit  # noqa: E402
+from features import columns  # noqa: E402
+from models import Patient, PatientFeatures  # noqa: E402
+
+VisitBase = declarative_base()
+
+
+# One row per visit with a column per feature
+Visit = type("Visit", (VisitBase,), {
+    "__tablename__": "bench_visits",
+    "id": Column(Integer, primary_key=True),
+    "patient_id": Column(Integer, index=True),
+    "scored_at": Column(DateTime),
+    "prediction": Column(Integer),
+    **{f"f{j}": Column(Float) for j in range(len(columns))},
+})
+
+
+def populate(patients, visits):
+    rng = np.random.default_rng(7)
+    Base.metadata.create_all(engine)
+    VisitBase.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        patient_rows, feature_rows, visit_rows = [], [], []
+        for patient_id in range(1, patients + 1):
+            base = rng.uniform(0.01, 200, len(columns))
+            packed = [b"", b"", b"", b""]
+            for visit in range(visits):
+                features = base * rng.normal(1, 0.05, len(columns))
+                scored_at = start + timedelta(days=30 * visit + int(rng.integers(0, 10)))
+                prediction = int(rng.integers(0, 2))
+                notification_id = (patient_id - 1) * visits + visit + 1
+                packed = [a + b for a, b in zip(packed, pack_visit(features, scored_at, prediction, notification_id))]
+                visit_rows.append({"patient_id": patient_id, "scored_at": scored_at, "prediction": prediction,
+                                   **{f"f{j}": float(value) for j, value in enumerate(features)}})
+            patient_rows.append({"id": patient_id, "name": f"Patient {patient_id}"})
+            feature_rows.append({"patient_id": patient_id, "visits": visits, "features": packed[0],
+                                 "scored_at": packed[1], "predictions": packed[2], "notification_ids": packed[3],
+                                 "updated_at": start})
+        conn.execute(Patient.__table__.insert(), patient_rows)
+        conn.execute(PatientFeatures.__table__.insert(), feature_rows)
+        conn.execute(Visit.__table__.insert(), visit_rows)
+
+
+def per_call(fn, runs):
+    fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+
+def main(patients, visits):
+    populate(patients, visits)
+    store = FeatureStore()
+    with SessionLocal() as db:
+        cohort = store.load(db)
+        load = per_call(lambda: store.load(db), 10)
+        summary = per_call(lambda: store.cohort_summary(cohort), 10)
+        one = per_call(lambda: store.patient_trends(cohort, patients // 2), 10)
+
+        def orm_load():
+            db.expunge_all()
+            rows = db.query(Visit).order_by(Visit.patient_id, Visit.scored_at).all()
+            return np.array([[getattr(row, f"f{j}") for j in range(len(columns))] for row in rows])
+
+        orm = per_call(orm_load, 3)
+
+        start = time.perf_counter()
+        store.record(db, f"Patient {patients // 2}", np.ones(len(columns)), 1)
+        record = time.perf_counter() - start
+
+    print(f"{patients} patients x {visits} visits")
+    print(f"load cohort, packed arrays      {load * 1000:8.2f} ms")
+    print(f"load cohort, ORM row per visit  {orm * 1000:8.2f} ms  ({orm / load:.0f}x)")
+    print(f"cohort summary                  {summary * 1000:8.2f} ms")
+    print(f"one patient's trends            {one * 1000:8.2f} ms")
+    print(f"record one visit                {record * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 6)
@@ -0,0 +1,88 @@
+"""Cost of the request instrumentation, and of logging a report's whole text.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_metrics.py [requests]
+
+Sends `requests` requests (default 5000) over ASGI to a sync endpoint that
+runs two queries on an in-memory SQLite database, with:
+- no middleware,
+- an @app.middleware("http") like the old add_logged_in_status (passing
+  the request on, without its session lookup), and
+- MetricsMiddleware, whose engine listeners also time every query.
+Then times building the old "Extracted text: ..." message for a 20 KB text
+against the sample_debug() check that now gates it.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from parkinson_common.metrics import MetricsMiddleware, instrument_engine, sample_debug  # noqa: E402
+
+
+def build_app(middleware):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    if middleware == "metrics":
+        instrument_engine(engine)
+    app = FastAPI()
+
+    if middleware == "http":
+        @app.middleware("http")
+        async def pass_through(request: Request, call_next):
+            return await call_next(request)
+    elif middleware == "metrics":
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1")).all()
+            return {"id": item_id, "value": conn.execute(text("SELECT :id"), {"id": item_id}).scalar()}
+
+    return app
+
+
+async def measure(app, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(50):
+            await client.get(f"/items/{i}")
+        start = time.perf_counter()
+        for i in range(requests):
+            await client.get(f"/items/{i}")
+        return (time.perf_counter() - start) / requests
+
+
+def main(requests):
+    print(f"{requests} requests, one at a time")
+    baseline = None
+    for label, middleware in (
+        ("no middleware", None),
+        ('@app.middleware("http")', "http"),
+        ("MetricsMiddleware", "metrics"),
+    ):
+        per_request = asyncio.run(measure(build_app(middleware), requests))
+        baseline = baseline or per_request
+        print(f"{label:26} {per_request * 1e6:8.1f} us/request  (+{(per_request - baseline) * 1e6:.1f} us)")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report_text = "MDVP:Fo(Hz) 119.992 " * 1000
+    runs = 20000
+    old = timeit.timeit(lambda: logging.info(f"Extracted text: {report_text}"), number=runs) / runs
+    new = timeit.timeit(lambda: sample_debug() and logging.info("Extracted text: %s", report_text), number=runs) / runs
+    print(f"log full text (f-string)   {old * 1e6:8.2f} us/report")
+    print(f"sample_debug() gate        {new * 1e6:8.2f} us/report")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
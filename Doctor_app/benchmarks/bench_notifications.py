@@ -0,0 +1,92 @@
+"""Dashboard query benchmark: loading every notification vs one keyset page.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_notifications.py [rows] [report_bytes]
+
+Builds a throwaway SQLite database with `rows` notifications (default
+100000) for one doctor, plus 10% for another doctor, each with an inline legacy report of
+`report_bytes` bytes, and times the old dashboard query (every row with
+its report) against the first, a middle and the last keyset page.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker, undefer  # noqa: E402
+
+from db import Base  # noqa: E402
+from models import Notification  # noqa: E402
+from parkinson_common.pagination import keyset_page  # noqa: E402
+
+DOCTOR_ID = 1
+INSERT_BATCH = 5000
+
+
+def build(engine, rows, report_bytes):
+    Base.metadata.create_all(bind=engine)
+    report = "x" * report_bytes
+    start = datetime(2024, 1, 1)
+    # Every 11th row belongs to a second doctor, so the filter matters
+    total = rows + rows // 10
+    with engine.begin() as conn:
+        for offset in range(0, total, INSERT_BATCH):
+            conn.execute(text(
+                "INSERT INTO notifications (doctor_id, patient_name, date, report) "
+                "VALUES (:doctor_id, :patient_name, :date, :report)"
+            ), [
+                {
+                    "doctor_id": DOCTOR_ID + 1 if i % 11 == 10 else DOCTOR_ID,
+                    "patient_name": f"patient {i}",
+                    "date": start + timedelta(minutes=i),
+                    "report": report,
+                }
+                for i in range(offset, min(offset + INSERT_BATCH, total))
+            ])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    report_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        build(engine, rows, report_bytes)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+
+        def doctor_notifications():
+            return db.query(Notification).filter(Notification.doctor_id == DOCTOR_ID)
+
+        seconds, everything = timed(lambda: doctor_notifications().options(undefer(Notification.report)).all())
+        print(f"{len(everything)} notifications for the doctor, {report_bytes} byte reports")
+        print(f"load all (old dashboard): {seconds * 1000:9.1f} ms  {len(everything)} rows")
+        middle_id = everything[len(everything) // 2].id
+        last_id = min(n.id for n in everything) + 1
+        del everything
+        db.expunge_all()
+
+        for label, before in (("first page", None), ("middle page", middle_id), ("last page", last_id)):
+            seconds, (page, _) = timed(
+                lambda: keyset_page(doctor_notifications(), Notification.date, Notification.id, before)
+            )
+            db.expunge_all()
+            print(f"keyset {label + ':':13}        {seconds * 1000:9.1f} ms  {len(page)} rows")
+
+        plan = db.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM notifications WHERE doctor_id = 1 "
+            "AND (date, id) < ('2024-06-01', 1) ORDER BY date DESC, id DESC LIMIT 21"
+        )).fetchall()
+        print("plan:", "; ".join(row[-1] for row in plan))
+        db.close()
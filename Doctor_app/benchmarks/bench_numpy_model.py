@@ -0,0 +1,94 @@
+"""Parity and latency/memory benchmark: scikit-learn model.pkl vs exported model.npz.
+
+Run from the Doctor_app directory:
+
+    python numpy_model.py model.pkl model.npz
+    python benchmarks/bench_numpy_model.py model.pkl model.npz
+
+Each backend is measured in a fresh interpreter so import cost and peak RSS
+are not shared between them.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+N_FEATURES = 22
+SINGLE_CALLS = 2000
+BATCH_ROWS = 1024
+PARITY_ROWS = 20000
+
+
+def _samples(n, seed):
+    import numpy as np
+
+    return np.random.default_rng(seed).normal(loc=1.0, scale=2.0, size=(n, N_FEATURES))
+
+
+def _load(path):
+    if path.endswith(".npz"):
+        from numpy_model import NumpyModel
+
+        return NumpyModel.load(path)
+    import joblib
+
+    return joblib.load(path)
+
+
+def worker(path):
+    started = time.perf_counter()
+    model = _load(path)
+    model.predict(_samples(1, 0))
+    cold_start = time.perf_counter() - started
+
+    rows = _samples(SINGLE_CALLS, 1)
+    latencies = []
+    for i in range(SINGLE_CALLS):
+        t = time.perf_counter()
+        model.predict(rows[i:i + 1])
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+
+    batch = _samples(BATCH_ROWS, 2)
+    t = time.perf_counter()
+    model.predict(batch)
+    batch_seconds = time.perf_counter() - t
+
+    parity = _samples(PARITY_ROWS, 3)
+    print(json.dumps({
+        "path": path,
+        "cold_start_ms": cold_start * 1000,
+        "single_p50_us": latencies[len(latencies) // 2] * 1e6,
+        "single_p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "batch_rows_per_second": BATCH_ROWS / batch_seconds,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "sklearn_imported": "sklearn" in sys.modules,
+        "predictions": model.predict(parity).tolist(),
+    }))
+
+
+def main(pkl_path, npz_path):
+    results = []
+    for path in (pkl_path, npz_path):
+        out = subprocess.run([sys.executable, "-W", "ignore", __file__, "--worker", path],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out))
+
+    mismatches = sum(a != b for a, b in zip(results[0]["predictions"], results[1]["predictions"]))
+    for result in results:
+        result.pop("predictions")
+        print(json.dumps(result))
+    print(f"parity: {mismatches} mismatches on {PARITY_ROWS} samples")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+        worker(sys.argv[2])
+    else:
+        args = sys.argv[1:]
+        sys.exit(main(args[0] if args else "model.pkl", args[1] if len(args) > 1 else "model.npz"))
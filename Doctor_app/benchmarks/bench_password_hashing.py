@@ -0,0 +1,116 @@
+"""Login bursts: bcrypt in the shared threadpool vs the PasswordHasher executor.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_password_hashing.py [logins] [concurrency] [rounds]
+
+Sends `logins` login requests (default 200), `concurrency` at a time
+(default 64), to a small app over ASGI, hashing at cost `rounds` (default
+10). Meanwhile 8 clients keep requesting a sync "dashboard" endpoint that
+does 2 ms of blocking work, as the app's sync endpoints do. It reports
+logins per second and dashboard latency, for:
+- verify inline in a sync endpoint (the old login), and
+- the async login awaiting PasswordHasher, with a queue that fits the
+  burst and with the default HASH_MAX_QUEUED. With the default, the
+  overflow is answered 503.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Form  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from parkinson_common.passwords import HASH_MAX_QUEUED, HASH_WORKERS, HasherBusy, PasswordHasher  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+DASHBOARD_CLIENTS = 8
+DASHBOARD_WORK = 0.002
+
+
+def build_app(hasher):
+    app = FastAPI()
+    password_hash = hasher.context.hash(PASSWORD)
+
+    @app.exception_handler(HasherBusy)
+    async def busy(request, exc):
+        return JSONResponse(status_code=503, content={})
+
+    @app.post("/login-inline")
+    def login_inline(password: str = Form(...)):
+        return {"ok": hasher.context.verify(password, password_hash)}
+
+    @app.post("/login")
+    async def login(password: str = Form(...)):
+        matches, _ = await hasher.verify(password, password_hash)
+        return {"ok": matches}
+
+    @app.get("/dashboard")
+    def dashboard():
+        # Stands in for a sync endpoint's queries
+        time.sleep(DASHBOARD_WORK)
+        return {}
+
+    return app
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))] if values else 0.0
+
+
+async def measure(app, path, logins, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        statuses, latencies = [], []
+        finished = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                response = await client.post(path, data={"password": PASSWORD})
+                statuses.append(response.status_code)
+
+        async def dashboard_client():
+            while not finished.is_set():
+                start = time.perf_counter()
+                await client.get("/dashboard")
+                latencies.append(time.perf_counter() - start)
+
+        dashboards = [asyncio.create_task(dashboard_client()) for _ in range(DASHBOARD_CLIENTS)]
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        finished.set()
+        await asyncio.gather(*dashboards)
+    return elapsed, statuses, latencies
+
+
+async def main(logins, concurrency, rounds):
+    print(f"{logins} logins, {concurrency} concurrent, bcrypt cost {rounds}, "
+          f"{HASH_WORKERS} hash workers, {os.cpu_count()} CPUs")
+    print(f"{'':30} {'logins/s':>9} {'503s':>5} {'dashboard p50 ms':>17} {'p99 ms':>8}")
+    modes = (
+        ("inline in threadpool (before)", "/login-inline", PasswordHasher(rounds, max_queued=concurrency)),
+        ("hasher, queue fits burst", "/login", PasswordHasher(rounds, max_queued=concurrency)),
+        (f"hasher, max_queued={HASH_MAX_QUEUED}", "/login", PasswordHasher(rounds)),
+    )
+    for label, path, hasher in modes:
+        elapsed, statuses, latencies = await measure(build_app(hasher), path, logins, concurrency)
+        ok = statuses.count(200)
+        print(
+            f"{label:30} {ok / elapsed:9.1f} {statuses.count(503):5} "
+            f"{percentile(latencies, 0.5) * 1000:17.1f} {percentile(latencies, 0.99) * 1000:8.1f}"
+        )
+        hasher.shutdown()
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    asyncio.run(main(logins, concurrency, rounds))
@@ -0,0 +1,80 @@
+"""Re-submitting /final-report with unchanged values, with and without the prediction cache.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_prediction_cache.py [runs]
+
+Uses a throwaway SQLite database and report store. Times what final_report
+pays for the prediction and the PDF, the way it runs them: the model through
+the MicroBatcher and the rendering in the PdfPool, as every re-submission did
+before, against a hit in the in-process LRU and a hit in the database tier
+(a worker that hasn't seen the values).
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+root = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{root}/bench_prediction_cache.db"
+
+from db import AsyncSessionLocal, Base, engine  # noqa: E402
+from inference import MicroBatcher  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+from pdf_pool import PdfPool  # noqa: E402
+from prediction_cache import PredictionCache  # noqa: E402
+from report_render import render_final_report  # noqa: E402
+from report_store import ReportStore  # noqa: E402
+
+VALUES = [119.992, 157.302, 74.997, 0.00784, 0.00007, 0.0037, 0.00554, 0.01109, 0.04374, 0.426, 0.02182,
+          0.0313, 0.02971, 0.06545, 0.02211, 21.033, 0.414783, 0.815285, -4.813031, 0.266482, 2.301442, 0.284654]
+
+
+async def main(runs):
+    Base.metadata.create_all(engine)
+    model_registry = ModelRegistry(cache_dir=os.path.join(root, "model_cache"))
+    report_store = ReportStore(os.path.join(root, "report_store"))
+    batcher = MicroBatcher(model_registry.predict)
+    pdf_pool = PdfPool()
+    predict = batcher.predict
+
+    async def render():
+        pdf_bytes = await pdf_pool.run(render_final_report, "Akhil", "Positive", "Rao", VALUES)
+        return report_store.save_bytes(pdf_bytes)
+
+    async def uncached():
+        await predict(VALUES)
+        return await render()
+
+    async def cached(cache):
+        async with AsyncSessionLocal() as db:
+            await cache.predict(db, VALUES, predict)
+            return await cache.render(db, VALUES, "Positive", "Akhil", "Rao", render)
+
+    async def per_call(fn, *args):
+        await fn(*args)
+        start = time.perf_counter()
+        for _ in range(runs):
+            await fn(*args)
+        return (time.perf_counter() - start) / runs
+
+    model_registry.get()
+    cache = PredictionCache(model_registry, report_store)
+    miss = await per_call(uncached)
+    memory = await per_call(cached, cache)
+
+    async def fresh_worker():
+        # A worker that hasn't seen the values: misses memory, hits the tables
+        await cached(PredictionCache(model_registry, report_store))
+
+    database = await per_call(fresh_worker)
+    pdf_pool.shutdown()
+    print(f"predict + render + store    {miss * 1000:8.2f} ms")
+    print(f"cache hit, memory           {memory * 1000:8.2f} ms  ({miss / memory:.0f}x)")
+    print(f"cache hit, database         {database * 1000:8.2f} ms  ({miss / database:.0f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
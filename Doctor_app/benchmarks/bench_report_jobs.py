@@ -0,0 +1,85 @@
+"""Opening a report with and without background pre-processing, and the job queue's own cost.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_report_jobs.py [jobs]
+
+Uses a throwaway SQLite database. Times what /analyze-report pays for
+report_1.pdf when nothing has run yet (parse the PDF, as before) against
+what it pays once report_worker.py has (read the stored extraction and
+draft). Then enqueues `jobs` jobs (default 2000) and claims and completes
+them all from one worker, which is the queue's overhead per report.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_report_jobs.db"
+
+from db import Base, SessionLocal, engine  # noqa: E402
+from extraction_cache import ExtractionCache, content_hash  # noqa: E402
+from job_queue import JobQueue  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+from models import ReportDraft  # noqa: E402
+from report_text import extract_report  # noqa: E402
+from report_worker import draft_prediction  # noqa: E402
+from datetime import datetime  # noqa: E402
+
+REPORT = "report_1.pdf"
+
+
+def per_call(fn, runs):
+    fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+
+def main(jobs):
+    Base.metadata.create_all(engine)
+    with open(REPORT, "rb") as f:
+        digest = content_hash(f.read())
+
+    text, features, confidence = extract_report(REPORT)
+    model_registry = ModelRegistry()
+    with SessionLocal() as db:
+        ExtractionCache(pool=None).put(db, digest, text, features, confidence)
+        prediction = draft_prediction(features, model_registry)
+        db.add(ReportDraft(content_hash=digest, prediction=prediction or "Negative",
+                           model_version=model_registry.version or "", created_at=datetime.now()))
+        db.commit()
+
+    def lookup():
+        # A fresh cache each time, so the extraction comes from the database
+        with SessionLocal() as db:
+            ExtractionCache(pool=None).load(db, digest)
+            db.get(ReportDraft, digest)
+
+    cold = per_call(lambda: extract_report(REPORT), 20)
+    warm = per_call(lookup, 500)
+    print(f"open report, parse on request    {cold * 1000:8.2f} ms")
+    print(f"open report, pre-processed       {warm * 1000:8.2f} ms  ({cold / warm:.0f}x)")
+
+    queue = JobQueue()
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        for i in range(jobs):
+            queue.enqueue(db, i, digest)
+            db.commit()
+    enqueued = time.perf_counter() - start
+
+    start = time.perf_counter()
+    done = 0
+    while (job := queue.claim("bench")) is not None:
+        queue.complete(job, "bench")
+        done += 1
+    drained = time.perf_counter() - start
+    print(f"enqueue (own commit)             {enqueued / jobs * 1000:8.2f} ms/job")
+    print(f"claim + complete                 {drained / done * 1000:8.2f} ms/job  ({done} jobs)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,115 @@
+"""Report search latency at a large number of received reports.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_report_search.py [reports]
+
+Uses a throwaway SQLite database with `reports` (default 300000) synthetic
+notifications, each with report text shaped like report_1.pdf's: a fifth
+belong to doctor 1, the rest are spread over 200 doctors. Times
+ReportSearch.search for doctor 1 and an average doctor with a patient's
+name, a word in every report, a date, a prefix and a deep page, against a
+LIKE scan over the same text, and indexing one received report.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_report_search.db"
+
+from sqlalchemy import text  # noqa: E402
+
+from db import Base, SessionLocal, engine  # noqa: E402
+from features import columns  # noqa: E402
+from models import Notification  # noqa: E402
+from report_search import INSERT, ReportSearch, index_row  # noqa: E402
+
+DOCTORS = 200
+NAMES = ["Akhil", "Varaprasad", "Priya", "Ravi", "Anjali", "Suresh", "Meera", "Kiran", "Lakshmi", "Arjun",
+         "Deepa", "Manoj", "Sita", "Vikram", "Nisha", "Rahul", "Kavya", "Ajay", "Divya", "Gopal"]
+SURNAMES = ["Reddy", "Rao", "Sharma", "Naidu", "Kumar", "Iyer", "Patel", "Gupta", "Menon", "Das"]
+
+
+def report_text(rng, name):
+    values = " ".join(f"{column}: {rng.uniform(0, 200):.5f}" for column in columns)
+    outcome = rng.choice(["has Parkinson's disease", "does not have Parkinson's disease"])
+    return f"Parkinson's Disease Detection Report Patient Name: {name} Prediction: This person {outcome}. {values}"
+
+
+def populate(reports):
+    rng = random.Random(7)
+    start = datetime(2020, 1, 1)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for first in range(1, reports + 1, 5000):
+            notifications, rows = [], []
+            for i in range(first, min(first + 5000, reports + 1)):
+                name = f"{rng.choice(NAMES)} {rng.choice(SURNAMES)}"
+                doctor_id = 1 if rng.random() < 0.2 else rng.randint(2, DOCTORS)
+                date = start + timedelta(minutes=i * 10)
+                notifications.append({"id": i, "doctor_id": doctor_id, "patient_name": name, "date": date})
+                rows.append(index_row(i, doctor_id, name, date, report_text(rng, name)))
+            conn.execute(Notification.__table__.insert(), notifications)
+            conn.execute(INSERT, rows)
+        conn.execute(text("CREATE TABLE plain_text (id INTEGER PRIMARY KEY, doctor_id INTEGER, body TEXT)"))
+        conn.execute(text("CREATE INDEX ix_plain_text_doctor ON plain_text (doctor_id)"))
+        conn.execute(text("""
+            INSERT INTO plain_text SELECT n.id, n.doctor_id, s.patient_name || ' ' || s.body
+            FROM notifications n JOIN report_search s ON s.rowid = n.id
+        """))
+        conn.execute(text("INSERT INTO report_search (report_search) VALUES ('optimize')"))
+
+
+def per_call(fn, runs):
+    fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+
+def main(reports):
+    start = time.perf_counter()
+    populate(reports)
+    print(f"{reports} reports indexed in {time.perf_counter() - start:.1f} s")
+
+    search = ReportSearch()
+    with SessionLocal() as db:
+        for doctor_id in (1, 17):
+            count = db.query(Notification).filter(Notification.doctor_id == doctor_id).count()
+            print(f"doctor {doctor_id}, {count} reports")
+            for label, query, page in [
+                ("patient name", "Priya Reddy", 1),
+                ("absent name", "Fernandes", 1),
+                ("common word", "shimmer", 1),
+                ("date", "2023-06", 1),
+                ("prefix", "vik*", 1),
+                ("page 20", "parkinson", 20),
+            ]:
+                seconds = per_call(lambda: search.search(db, doctor_id, query, page), 20)
+                print(f"  search {label:14} {seconds * 1000:8.2f} ms")
+            for label, query in [("patient name", "Priya Reddy"), ("absent name", "Fernandes")]:
+                like = per_call(lambda: db.execute(
+                    text("SELECT id FROM plain_text WHERE doctor_id = :doctor AND body LIKE :pattern LIMIT 21"),
+                    {"doctor": doctor_id, "pattern": f"%{query}%"}
+                ).all(), 5)
+                print(f"  LIKE {label:16} {like * 1000:8.2f} ms  (unranked, no snippets)")
+
+        doctor_id = 17
+        new_id = reports + 1
+        notification = Notification(id=new_id, doctor_id=doctor_id, patient_name="Nisha Iyer", date=datetime.now())
+        db.add(notification)
+        db.flush()
+        start = time.perf_counter()
+        search.add(db, notification)
+        db.commit()
+        search.set_text(db, new_id, report_text(random.Random(1), "Nisha Iyer"))
+        print(f"index one report        {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300000)
@@ -0,0 +1,69 @@
+"""Memory and throughput of a chunked upload against reading the report whole.
+
+Run from the Doctor_app directory:
+
+    python benchmarks/bench_uploads.py [megabytes]
+
+Uses a throwaway directory. Receives a `megabytes` MiB (default 64) file
+through UploadStore.append in UPLOAD_CHUNK_SIZE chunks, each with its
+checksum, the way /uploads/{id} does, and compares peak Python memory with
+holding the whole file in memory as the multipart /receive-report does.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parkinson_common.uploads import UPLOAD_CHUNK_SIZE, UploadStore, checksum_header  # noqa: E402
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(megabytes):
+    root = tempfile.mkdtemp()
+    source = os.path.join(root, "scan.bin")
+    length = megabytes * 1024 * 1024
+    with open(source, "wb") as f:
+        for _ in range(megabytes):
+            f.write(os.urandom(1024 * 1024))
+
+    def whole():
+        with open(source, "rb") as f:
+            return len(f.read())
+
+    store = UploadStore(os.path.join(root, "uploads"), max_size=length)
+
+    async def body(chunk):
+        yield chunk
+
+    async def upload():
+        upload_id = store.create(length)
+        offset = 0
+        with open(source, "rb") as f:
+            while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                offset = await store.append(upload_id, offset, body(chunk), checksum_header(chunk))
+        return offset
+
+    _, whole_seconds, whole_peak = measure(whole)
+    received, chunked_seconds, chunked_peak = measure(lambda: asyncio.run(upload()))
+    assert received == length
+    print(f"{megabytes} MiB report")
+    print(f"read whole          peak {whole_peak / 2**20:8.1f} MiB  {whole_seconds * 1000:8.1f} ms")
+    print(f"chunked upload      peak {chunked_peak / 2**20:8.1f} MiB  {chunked_seconds * 1000:8.1f} ms"
+          f"  ({megabytes / chunked_seconds:.0f} MiB/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
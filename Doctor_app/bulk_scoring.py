@@ -0,0 +1,170 @@
+import csv
+import json
+import math
+import os
+import time
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+from features import columns
+
+# Rows scored per vectorized model.predict call
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "1024"))
+# Longest input line accepted, in bytes; a row of the 22 features is far shorter
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(64 * 1024)))
+
+
+def _decode(line):
+    # Undecodable bytes become U+FFFD, so the row fails to parse on its own
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def iter_lines(byte_stream, max_line=BULK_MAX_LINE_BYTES):
+    # Split an async byte stream into text lines without buffering the whole
+    # body. A line longer than max_line bytes is dropped as it arrives and
+    # yielded as None.
+    pending = b""
+    overlong = False
+    async for chunk in byte_stream:
+        if not chunk:
+            continue
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if overlong:
+                # The end of the line being dropped
+                overlong = False
+                yield None
+            else:
+                yield _decode(line) if len(line) <= max_line else None
+        if len(pending) > max_line:
+            overlong = True
+            pending = b""
+    if overlong:
+        yield None
+    elif pending:
+        yield _decode(pending)
+
+
+def feature_values(raw):
+    # The 22 feature values, in columns order, as floats; ValueError for one
+    # that isn't a finite number
+    values = []
+    for column, value in zip(columns, raw):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column} is not a number: {value!r}")
+        if not math.isfinite(value):
+            raise ValueError(f"{column} must be a finite number, got {value!r}")
+        values.append(value)
+    return values
+
+
+def csv_row_parser(header_line):
+    # Build a row parser from a UCI-parkinsons style CSV header
+    header = next(csv.reader([header_line]))
+    header = [name.strip().lstrip("\ufeff") for name in header]
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+
+    indexes = [header.index(column) for column in columns]
+    name_index = header.index("name") if "name" in header else None
+
+    def parse(line):
+        fields = next(csv.reader([line]))
+        if len(fields) != len(header):
+            raise ValueError(f"Expected {len(header)} fields, got {len(fields)}")
+        name = fields[name_index] if name_index is not None else None
+        return name, feature_values(fields[i] for i in indexes)
+
+    return parse
+
+
+def parse_jsonl_row(line):
+    # One JSON object per line, keyed by the feature column names
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object")
+    missing = [column for column in columns if column not in record]
+    if missing:
+        raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+    return record.get("name"), feature_values(record[column] for column in columns)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    # Results stream out while the upload is still being read, so the response
+    # must not consume receive() messages looking for a client disconnect
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _encode(record):
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+async def score_rows(lines, parse_row, predict_fn, chunk_rows=BULK_CHUNK_ROWS):
+    # Parse rows into fixed-size chunks, score each chunk in one call and
+    # stream one NDJSON result line per input row, then a summary line
+    started = time.perf_counter()
+    row_number = 0
+    scored = 0
+    errors = 0
+    chunks = 0
+    pending = []
+
+    async def flush():
+        nonlocal scored, chunks
+        inputs = np.asarray([values for _, _, values in pending], dtype=float)
+        predictions = await run_in_threadpool(predict_fn, inputs)
+        chunks += 1
+        scored += len(pending)
+        out = b"".join(
+            _encode({
+                "row": number,
+                "name": name,
+                "prediction": int(prediction),
+                "result": "Positive" if prediction == 1 else "Negative",
+            })
+            for (number, name, _), prediction in zip(pending, predictions)
+        )
+        pending.clear()
+        return out
+
+    async for line in lines:
+        if line is not None and not line.strip():
+            continue
+        row_number += 1
+        if line is None:
+            errors += 1
+            yield _encode({"row": row_number, "error": "Line is too long"})
+            continue
+        try:
+            name, values = parse_row(line)
+        except (ValueError, TypeError) as e:
+            errors += 1
+            yield _encode({"row": row_number, "error": str(e)})
+            continue
+        pending.append((row_number, name, values))
+        if len(pending) >= chunk_rows:
+            yield await flush()
+
+    if pending:
+        yield await flush()
+
+    elapsed = time.perf_counter() - started
+    yield _encode({
+        "summary": {
+            "rows": row_number,
+            "scored": scored,
+            "errors": errors,
+            "chunks": chunks,
+            "seconds": round(elapsed, 6),
+            "rows_per_second": round(scored / elapsed, 2) if elapsed > 0 else None,
+        }
+    })
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import ReportExtraction
+from report_text import extract_report
+
+# Number of extractions kept in memory per worker; the database keeps all of them
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "256"))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """Extracted report text and parsed features, keyed by the PDF's content hash.
+
+    Lookups go to an in-process LRU first, then to the report_extractions
+    table; only a miss in both parses the PDF.
+    """
+
+    def __init__(self, pool, max_entries=EXTRACTION_CACHE_SIZE):
+        # PdfPool that runs the PDF parsing on a miss
+        self.pool = pool
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, digest, entry):
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def recall(self, digest):
+        # The entry if it is in memory, else None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.memory_hits += 1
+            return entry
+
+    def load(self, db, digest):
+        # The stored entry, or None; db is a sync Session
+        row = db.query(ReportExtraction).filter(ReportExtraction.content_hash == digest).first()
+        if row is None:
+            return None
+        entry = (row.text, json.loads(row.features), json.loads(row.confidence or "{}"))
+        self.db_hits += 1
+        self._remember(digest, entry)
+        return entry
+
+    def put(self, db, digest, text, features, confidence):
+        # merge selects then inserts, so a concurrent put of the same PDF (a
+        # second doctor, report_worker.py) can insert between the two
+        db.merge(ReportExtraction(
+            content_hash=digest,
+            text=text,
+            features=json.dumps(features),
+            confidence=json.dumps(confidence),
+            created_at=datetime.now()
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same PDF's extraction first
+            db.rollback()
+        self._remember(digest, (text, features, confidence))
+
+    async def get_or_extract(self, db, digest, source):
+        # Returns (text, features, confidence); source is the PDF as bytes or a
+        # file path, db an async session (see db.AsyncSessionLocal)
+        entry = self.recall(digest) or await db.run_sync(self.load, digest)
+        if entry is not None:
+            return entry
+        self.misses += 1
+        text, features, confidence = await self.pool.run(extract_report, source)
+        await db.run_sync(self.put, digest, text, features, confidence)
+        return text, features, confidence
+
+    def stats(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,167 @@
+import re
+
+from features import columns
+
+# Descriptive names that some report templates print instead of the UCI labels
+ALIASES = {
+    "MDVP:Fo(Hz)": ["Average vocal fundamental frequency"],
+    "MDVP:Fhi(Hz)": ["Maximum vocal fundamental frequency"],
+    "MDVP:Flo(Hz)": ["Minimum vocal fundamental frequency"],
+    "NHR": ["Noise-to-harmonics ratio"],
+    "HNR": ["Harmonics-to-noise ratio"],
+    "RPDE": ["Recurrence period density entropy"],
+    "DFA": ["Detrended fluctuation analysis"],
+    "D2": ["Correlation dimension"],
+    "PPE": ["Pitch period entropy"],
+}
+
+# Units a value may be followed by, as (column unit family, factor to the model's unit)
+UNITS = {
+    "Hz": ("frequency", 1.0),
+    "kHz": ("frequency", 1000.0),
+    "%": ("percent", 1.0),
+    "dB": ("decibel", 1.0),
+    "s": ("seconds", 1.0),
+    "ms": ("seconds", 1e-3),
+    "us": ("seconds", 1e-6),
+    "µs": ("seconds", 1e-6),
+}
+EXPECTED_UNITS = {
+    "MDVP:Fo(Hz)": "frequency",
+    "MDVP:Fhi(Hz)": "frequency",
+    "MDVP:Flo(Hz)": "frequency",
+    "MDVP:Jitter(%)": "percent",
+    "MDVP:Jitter(Abs)": "seconds",
+    "MDVP:Shimmer(dB)": "decibel",
+    "HNR": "decibel",
+}
+# Qualifiers in parentheses that only restate the unit and may be left out
+OPTIONAL_QUALIFIERS = {"Hz"}
+
+EXACT, VARIANT, ALIAS = 1.0, 0.85, 0.7
+# Values below this are flagged for the doctor to double-check
+LOW_CONFIDENCE = 0.8
+
+LABEL_PARTS = re.compile(r"^(?:(?P<prefix>[A-Za-z]+):)?(?P<name>[A-Za-z0-9]+)(?:\((?P<qualifier>[^)]+)\))?$")
+SEPARATOR = r"\s*[:_\-]?\s*"
+VALUE = r"(?P<value>[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)"
+
+
+def _forms(text):
+    # As written, capitalised and upper case. Labels are deliberately not
+    # matched case-insensitively: every alternative must start with a literal
+    # character so the regex engine can skip ahead to candidate positions
+    return dict.fromkeys([text, text[:1].upper() + text[1:], text.upper()])
+
+
+def label_key(label):
+    # Spelling-independent key: "MDVP Fo (Hz)", "mdvp_fo(hz)" -> "MDVPFOHZ"
+    return re.sub(r"[^0-9A-Za-z%]", "", label).upper()
+
+
+def _label_variants(column):
+    # Yields (regex, keys, confidence, ends_in_qualifier) for each way the label may be written
+    parts = LABEL_PARTS.match(column)
+    prefix, name, qualifier = parts.group("prefix"), parts.group("name"), parts.group("qualifier")
+
+    qualifier_pattern = ""
+    qualifier_keys = [""]
+    if qualifier:
+        qualifier_pattern = r"\s*\(\s*" + re.escape(qualifier) + r"\s*\)"
+        qualifier_keys = [label_key(qualifier)]
+        if qualifier in OPTIONAL_QUALIFIERS:
+            qualifier_pattern = f"(?:{qualifier_pattern})?"
+            qualifier_keys.append("")
+    has_qualifier = bool(qualifier)
+
+    for name_form in _forms(name):
+        name_pattern = re.escape(name_form) + qualifier_pattern
+        yield name_pattern, [label_key(name) + q for q in qualifier_keys], VARIANT, has_qualifier
+        if prefix:
+            for prefix_form in _forms(prefix):
+                keys = [label_key(prefix + name) + q for q in qualifier_keys]
+                yield re.escape(prefix_form) + SEPARATOR + name_pattern, keys, VARIANT, has_qualifier
+
+    for alias in ALIASES.get(column, []):
+        for alias_form in _forms(alias):
+            words = re.split(r"[\s\-]+", alias_form)
+            yield r"[\s\-]+".join(re.escape(word) for word in words), [label_key(alias)], ALIAS, False
+
+
+class FeatureExtractor:
+    """Finds all feature labels and their values in one scan of the report text.
+
+    Every spelling of every label is compiled into a single regular
+    expression, so the text is scanned once instead of once per column and
+    needs no whitespace normalisation first. The matched label is mapped back
+    to its column through a spelling-independent key.
+    """
+
+    def __init__(self, feature_columns=columns):
+        self.columns = list(feature_columns)
+        self._labels = {}
+        variants = []
+        for column in self.columns:
+            for pattern, keys, confidence, has_qualifier in _label_variants(column):
+                for key in keys:
+                    self._labels.setdefault(key, (column, confidence))
+                # Labels that don't end in ")" need a real separator before
+                # the value, otherwise "APQ3" would read as "APQ" = 3
+                separator = r"\s*[:=]?\s*" if has_qualifier else r"(?:\s*[:=]\s*|\s+)"
+                variants.append(pattern + separator)
+
+        # Longer labels first so "MDVP:Shimmer(dB)" wins over "MDVP:Shimmer"
+        variants = sorted(dict.fromkeys(variants), key=len, reverse=True)
+        units = "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+        self.pattern = re.compile(
+            "(?P<label>" + "|".join(variants) + ")" + VALUE
+            + rf"(?:\s*(?P<unit>{units})(?![A-Za-z]))?"
+        )
+        self._separator = re.compile(r"[\s:=]*$")
+
+    def extract(self, text):
+        # Returns {column: {"value", "confidence", "label", "unit"}} for each column found
+        found = {}
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            if start and text[start - 1].isalnum():
+                # Label embedded in a longer word
+                continue
+            label = self._separator.sub("", match.group("label"))
+            column, confidence = self._labels[label_key(label)]
+            if label == column:
+                confidence = EXACT
+
+            value = match.group("value")
+            unit = match.group("unit")
+            if unit:
+                family, factor = UNITS[unit]
+                if family != EXPECTED_UNITS.get(column):
+                    confidence *= 0.5
+                elif factor != 1.0:
+                    value = f"{float(value) * factor:.10g}"
+
+            previous = found.get(column)
+            if previous is None or confidence > previous["confidence"]:
+                found[column] = {
+                    "value": value,
+                    "confidence": confidence,
+                    "label": label,
+                    "unit": unit,
+                }
+        return found
+
+    def parse(self, text):
+        # Value strings ("" when missing) and confidences (0.0 when missing) per column
+        found = self.extract(text)
+        values = {column: found[column]["value"] if column in found else "" for column in self.columns}
+        confidence = {column: found[column]["confidence"] if column in found else 0.0 for column in self.columns}
+        return values, confidence
+
+
+def low_confidence(confidence):
+    # Columns that were missing or detected with low confidence
+    return [column for column, value in confidence.items() if value < LOW_CONFIDENCE]
+
+
+extractor = FeatureExtractor()
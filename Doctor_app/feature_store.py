@@ -0,0 +1,278 @@
+import math
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from features import columns
+from models import Patient, PatientFeatures
+
+# On-disk layout of PatientFeatures' arrays; fixed little-endian so a database
+# can move between machines
+FEATURE_DTYPE = np.dtype("<f8")
+TIME_DTYPE = np.dtype("<f8")
+PREDICTION_DTYPE = np.dtype("i1")
+# 0 for a visit recorded without its notification
+NOTIFICATION_DTYPE = np.dtype("<i8")
+# Cohort percentiles reported for each feature
+COHORT_PERCENTILES = [10, 25, 50, 75, 90]
+# Times a visit is re-appended after losing a race with a concurrent one
+FEATURE_STORE_RETRIES = int(os.getenv("FEATURE_STORE_RETRIES", "5"))
+
+SECONDS_PER_DAY = 86400.0
+# Least change of updated_at per write, so every write changes it
+UPDATE_STEP = timedelta(microseconds=1)
+
+
+class StoreConflict(Exception):
+    pass
+
+
+def pack_visit(features, scored_at, prediction, notification_id=None):
+    return (
+        np.asarray(features, dtype=FEATURE_DTYPE).tobytes(),
+        np.asarray([scored_at.timestamp()], dtype=TIME_DTYPE).tobytes(),
+        np.asarray([prediction], dtype=PREDICTION_DTYPE).tobytes(),
+        np.asarray([notification_id or 0], dtype=NOTIFICATION_DTYPE).tobytes(),
+    )
+
+
+def replace_item(packed, index, item):
+    # packed (bytes of equal-sized items) with item `index` replaced by item
+    start = index * len(item)
+    return packed[:start] + item + packed[start + len(item):]
+
+
+class Cohort:
+    """Every patient's visits as flat arrays, loaded in one query.
+
+    Visits are rows of `features` (visits x 22), grouped by patient and
+    oldest first within a patient; patient i's are rows starts[i] to
+    starts[i] + counts[i].
+    """
+
+    def __init__(self, patient_ids, names, counts, features, scored_at, predictions, notification_ids):
+        self.patient_ids = patient_ids
+        self.names = names
+        self.counts = counts
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+        self.features = features
+        self.scored_at = scored_at
+        self.predictions = predictions
+        self.notification_ids = notification_ids
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+    def latest(self):
+        return self.features[self.starts + self.counts - 1]
+
+    def deltas(self):
+        # Latest visit minus the one before it; NaN for single-visit patients
+        previous = self.features[np.maximum(self.starts + self.counts - 2, self.starts)]
+        delta = self.latest() - previous
+        delta[self.counts < 2] = np.nan
+        return delta
+
+    def slopes(self):
+        # Change per day of each feature over each patient's visits
+        return slopes(self.scored_at, self.features, self.starts, self.counts)
+
+
+def slopes(scored_at, features, starts, counts):
+    # Least-squares change per day of each feature over each group of visits
+    # (rows starts[i] to starts[i] + counts[i]); NaN with fewer than two
+    # visits at different times
+    if not len(counts):
+        return np.empty((0, features.shape[1]))
+    days = scored_at / SECONDS_PER_DAY
+    owner = np.repeat(np.arange(len(counts)), counts)
+    t = days - (np.add.reduceat(days, starts) / counts)[owner]
+    x = features - (np.add.reduceat(features, starts) / counts[:, None])[owner]
+    spread = np.add.reduceat(t * t, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.add.reduceat(t[:, None] * x, starts) / spread[:, None]
+    slope[spread <= 0] = np.nan
+    return slope
+
+
+def percentile_of(values, index):
+    # Share (0-100) of patients whose value is below patient `index`'s, for
+    # each column of `values` (patients x 22); NaNs are left out
+    present = (~np.isnan(values)).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ranks = 100.0 * (values < values[index]).sum(axis=0) / present
+    ranks[np.isnan(values[index])] = np.nan
+    return ranks
+
+
+def percentiles(values):
+    # COHORT_PERCENTILES of each column of `values`, NaNs left out:
+    # {feature: [p10, ..., p90]}, None for a column with no values
+    result = {}
+    for j, feature in enumerate(columns):
+        column = values[:, j]
+        column = column[~np.isnan(column)]
+        result[feature] = np.percentile(column, COHORT_PERCENTILES).tolist() if len(column) else None
+    return result
+
+
+def nan_to_none(values):
+    return [None if math.isnan(value) else value for value in np.asarray(values, dtype=float).tolist()]
+
+
+def by_feature(values):
+    return dict(zip(columns, nan_to_none(values)))
+
+
+class FeatureStore:
+    """Every scored visit of every patient, in the patient_features table.
+
+    A patient's visits are four packed arrays in one row: their feature
+    vectors, when they were scored, the predictions and the notifications
+    scored. Scoring a notification again replaces its visit instead of adding
+    one. Arrays are rewritten with a conditional UPDATE on the visit count
+    and update time, so concurrent visits of a patient are retried instead of
+    lost. Trends and cohort percentiles are computed with NumPy over all
+    patients' arrays, read with one query and no ORM objects.
+    """
+
+    def __init__(self, retries=FEATURE_STORE_RETRIES):
+        self.retries = retries
+
+    def patient(self, db, name):
+        # The patient of this name, created on first sight; IntegrityError if
+        # another request created it meanwhile
+        patient = db.query(Patient).filter(Patient.name == name).first()
+        if patient is None:
+            patient = Patient(name=name)
+            db.add(patient)
+            db.flush()
+        return patient
+
+    def record(self, db, patient_name, features, prediction, notification_id=None, scored_at=None):
+        # Stores one scored visit and the patient's latest result; commits.
+        # prediction is the model's 0 or 1. A visit of a notification already
+        # recorded replaces that visit's features and prediction, and keeps
+        # when it was first scored. Returns the patient's id. Losing a race
+        # for the patient or their arrays starts over.
+        scored_at = scored_at or datetime.now()
+        visit = pack_visit(features, scored_at, prediction, notification_id)
+        table = PatientFeatures.__table__
+        for _ in range(self.retries):
+            try:
+                patient = self.patient(db, patient_name)
+                row = db.execute(
+                    select(table.c.visits, table.c.features, table.c.scored_at, table.c.predictions,
+                           table.c.notification_ids, table.c.updated_at)
+                    .where(table.c.patient_id == patient.id)
+                ).first()
+                if row is None:
+                    predictions = visit[2]
+                    db.execute(insert(table).values(
+                        patient_id=patient.id, visits=1, features=visit[0], scored_at=visit[1],
+                        predictions=visit[2], notification_ids=visit[3], updated_at=scored_at
+                    ))
+                else:
+                    ids = np.frombuffer(row.notification_ids, dtype=NOTIFICATION_DTYPE)
+                    scored = np.flatnonzero(ids == notification_id) if notification_id else []
+                    if len(scored):
+                        index = int(scored[-1])
+                        values = {
+                            "visits": row.visits,
+                            "features": replace_item(row.features, index, visit[0]),
+                            "predictions": replace_item(row.predictions, index, visit[2]),
+                        }
+                    else:
+                        values = {
+                            "visits": row.visits + 1,
+                            "features": row.features + visit[0],
+                            "scored_at": row.scored_at + visit[1],
+                            "predictions": row.predictions + visit[2],
+                            "notification_ids": row.notification_ids + visit[3],
+                        }
+                    predictions = values["predictions"]
+                    # Only over the arrays as read; a visit recorded meanwhile
+                    # changes the count or the update time and this updates
+                    # nothing
+                    written = db.execute(
+                        update(table)
+                        .where(table.c.patient_id == patient.id, table.c.visits == row.visits,
+                               table.c.updated_at == row.updated_at)
+                        .values(updated_at=max(scored_at, row.updated_at + UPDATE_STEP), **values)
+                    ).rowcount
+                    if not written:
+                        raise StoreConflict()
+                patient.prediction = "Positive" if predictions[-1] == 1 else "Negative"
+                db.commit()
+                return patient.id
+            except (IntegrityError, StoreConflict):
+                db.rollback()
+        raise StoreConflict(f"Could not record a visit of {patient_name!r} after {self.retries} tries")
+
+    def load(self, db):
+        # The Cohort of every patient with a scored visit
+        table = PatientFeatures.__table__
+        rows = db.execute(
+            select(table.c.patient_id, Patient.name, table.c.visits, table.c.features,
+                   table.c.scored_at, table.c.predictions, table.c.notification_ids)
+            .join(Patient, Patient.id == table.c.patient_id)
+            .order_by(table.c.patient_id)
+        ).all()
+        patient_ids, names, counts, features, scored_at, predictions, notification_ids = \
+            zip(*rows) if rows else ([],) * 7
+        return Cohort(
+            np.asarray(patient_ids, dtype=np.int64),
+            list(names),
+            np.asarray(counts, dtype=np.int64),
+            np.frombuffer(b"".join(features), dtype=FEATURE_DTYPE).reshape(-1, len(columns)),
+            np.frombuffer(b"".join(scored_at), dtype=TIME_DTYPE),
+            np.frombuffer(b"".join(predictions), dtype=PREDICTION_DTYPE),
+            np.frombuffer(b"".join(notification_ids), dtype=NOTIFICATION_DTYPE),
+        )
+
+    def cohort_summary(self, cohort):
+        # Percentiles of the patients' latest values, their change since the
+        # previous visit and their change per day, feature by feature
+        last = cohort.starts + cohort.counts - 1
+        return {
+            "patients": len(cohort),
+            "visits": int(cohort.counts.sum()),
+            "positive_latest": int((cohort.predictions[last] == 1).sum()),
+            "percentiles": COHORT_PERCENTILES,
+            "latest": percentiles(cohort.latest()),
+            "delta": percentiles(cohort.deltas()),
+            "slope_per_day": percentiles(cohort.slopes()),
+        }
+
+    def patient_trends(self, cohort, patient_id):
+        # One patient's visits, latest values, change since the previous
+        # visit and per day, and where the latest values and the change rank
+        # in the cohort; None if the patient has no scored visit
+        index = int(np.searchsorted(cohort.patient_ids, patient_id))
+        if index >= len(cohort) or cohort.patient_ids[index] != patient_id:
+            return None
+        start, count = cohort.starts[index], cohort.counts[index]
+        latest, deltas = cohort.latest(), cohort.deltas()
+        return {
+            "patient_id": int(patient_id),
+            "name": cohort.names[index],
+            "visits": [
+                {
+                    "scored_at": datetime.fromtimestamp(cohort.scored_at[row]).isoformat(),
+                    "prediction": "Positive" if cohort.predictions[row] == 1 else "Negative",
+                    "notification_id": int(cohort.notification_ids[row]) or None,
+                }
+                for row in range(start, start + count)
+            ],
+            "latest": by_feature(latest[index]),
+            "delta": by_feature(deltas[index]),
+            "slope_per_day": by_feature(slopes(
+                cohort.scored_at[start:start + count], cohort.features[start:start + count],
+                np.array([0]), np.array([count])
+            )[0]),
+            "cohort_percentile": by_feature(percentile_of(latest, index)),
+            "delta_cohort_percentile": by_feature(percentile_of(deltas, index)),
+        }
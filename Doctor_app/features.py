@@ -0,0 +1,7 @@
+# The 22 UCI Parkinson's voice measures, in the column order the model was trained on
+columns = [
+    "MDVP:Fo(Hz)", "MDVP:Fhi(Hz)", "MDVP:Flo(Hz)", "MDVP:Jitter(%)", "MDVP:Jitter(Abs)",
+    "MDVP:RAP", "MDVP:PPQ", "Jitter:DDP", "MDVP:Shimmer", "MDVP:Shimmer(dB)",
+    "Shimmer:APQ3", "Shimmer:APQ5", "MDVP:APQ", "Shimmer:DDA", "NHR", "HNR",
+    "RPDE", "DFA", "spread1", "spread2", "D2", "PPE"
+]
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+# Batching settings, overridable per deployment
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "32"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """Collects concurrent single-row predictions and runs them as one vectorized call.
+
+    A batch is flushed as soon as it holds `max_batch_size` rows or the oldest
+    queued row has waited `max_wait_ms` milliseconds, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        # Queue and worker are bound to the running event loop, created on first use
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.batch_sizes = Counter()
+        self.predict_seconds = 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, features):
+        # Queue one feature row and wait for its label
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self.requests += 1
+        await self._queue.put((features, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that went away (client disconnect) don't need a slot in the batch
+            batch = [(row, future) for row, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            inputs = np.asarray([row for row, _ in batch], dtype=float)
+            started = time.perf_counter()
+            try:
+                # Run the model off the event loop so new requests keep queueing meanwhile
+                predictions = await self._loop.run_in_executor(None, self.predict_fn, inputs)
+            except Exception as e:
+                self.errors += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.predict_seconds += time.perf_counter() - started
+
+            self.batches += 1
+            self.rows += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.batch_sizes[len(batch)] += 1
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "predict_seconds_total": self.predict_seconds,
+        }
@@ -1,7 +1,6 @@
-from db import Base  # Import Base from your db.py file
-from sqlalchemy import create_engine
+from db import engine
+from migrations import upgrade
 
-DATABASE_URL = "sqlite:///./doctor_app.db"
-
-engine = create_engine(DATABASE_URL)
-Base.metadata.create_all(bind=engine)
+# Creates the database, or applies the migrations it hasn't had yet
+applied = upgrade(engine)
+print(f"Database {engine.url.render_as_string()} is up to date; applied: {', '.join(applied) or 'nothing'}.")
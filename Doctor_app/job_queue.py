@@ -0,0 +1,174 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+
+from db import SessionLocal
+from models import ReportJob
+from parkinson_common.metrics import registry
+
+# Seconds a claimed job stays hidden from other workers. A job still running
+# after that (its worker died or hung) is handed to another worker.
+REPORT_JOB_VISIBILITY_TIMEOUT = float(os.getenv("REPORT_JOB_VISIBILITY_TIMEOUT", "120"))
+# Runs of a job before it is left as failed
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", "5"))
+# Seconds before the first retry of a failed job, doubled for each later one
+REPORT_JOB_RETRY_DELAY = float(os.getenv("REPORT_JOB_RETRY_DELAY", "5"))
+# Hours finished jobs are kept for the status endpoint
+REPORT_JOB_RETENTION_HOURS = float(os.getenv("REPORT_JOB_RETENTION_HOURS", "24"))
+
+STATUSES = ("queued", "running", "done", "failed")
+
+REPORT_JOBS = registry.gauge("report_jobs", "Report pre-processing jobs by status.", ("status",))
+REPORT_QUEUE_LAG = registry.gauge(
+    "report_queue_lag_seconds", "How long the oldest runnable queued report job has waited."
+)
+
+# A job as handed to a worker
+ClaimedJob = namedtuple("ClaimedJob", ["id", "notification_id", "content_hash", "attempts", "max_attempts"])
+
+
+class JobQueue:
+    """Report pre-processing jobs, kept in the report_jobs table.
+
+    Jobs are added in the transaction that stores their notification, so a
+    received report always gets one. Workers (report_worker.py) claim the
+    oldest runnable job with a conditional UPDATE that only one of them can
+    win, and lease it for `visibility_timeout` seconds. A failed job is
+    retried with exponential backoff until `max_attempts` runs, then left as
+    failed; a job whose lease ran out is claimed again.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        visibility_timeout=REPORT_JOB_VISIBILITY_TIMEOUT,
+        max_attempts=REPORT_JOB_MAX_ATTEMPTS,
+        retry_delay=REPORT_JOB_RETRY_DELAY,
+    ):
+        self.session_factory = session_factory
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = retry_delay
+
+    def enqueue(self, db, notification_id, content_hash):
+        # Adds the job to db's transaction; the caller commits
+        now = datetime.now()
+        job = ReportJob(
+            notification_id=notification_id,
+            content_hash=content_hash,
+            status="queued",
+            attempts=0,
+            max_attempts=self.max_attempts,
+            available_at=now,
+            created_at=now
+        )
+        db.add(job)
+        return job
+
+    def claim(self, worker_id):
+        # The next runnable job, leased to worker_id, or None
+        with self.session_factory() as db:
+            now = datetime.now()
+            # Jobs whose lease ran out go first, they have waited longest
+            for status in ("running", "queued"):
+                while True:
+                    row = db.execute(
+                        select(ReportJob.id, ReportJob.available_at, ReportJob.attempts, ReportJob.max_attempts)
+                        .where(ReportJob.status == status, ReportJob.available_at <= now)
+                        .order_by(ReportJob.available_at, ReportJob.id)
+                        .limit(1)
+                    ).first()
+                    if row is None:
+                        break
+                    # Only the row as it was read is claimed; if another worker
+                    # changed it first, nothing is updated
+                    unchanged = (ReportJob.id == row.id, ReportJob.status == status,
+                                 ReportJob.available_at == row.available_at)
+                    if row.attempts >= row.max_attempts:
+                        # The lease ran out on the last attempt: give the job up
+                        db.execute(
+                            update(ReportJob).where(*unchanged)
+                            .values(status="failed", finished_at=now, locked_by=None,
+                                    last_error="Lease ran out on the last attempt")
+                            .execution_options(synchronize_session=False)
+                        )
+                        db.commit()
+                        continue
+                    claimed = db.execute(
+                        update(ReportJob).where(*unchanged)
+                        .values(status="running", attempts=ReportJob.attempts + 1, locked_by=worker_id,
+                                available_at=now + timedelta(seconds=self.visibility_timeout), started_at=now)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+                    db.commit()
+                    if claimed:
+                        job = db.execute(
+                            select(ReportJob.id, ReportJob.notification_id, ReportJob.content_hash,
+                                   ReportJob.attempts, ReportJob.max_attempts)
+                            .where(ReportJob.id == row.id)
+                        ).first()
+                        return ClaimedJob(*job)
+                    # Another worker won this one; try the next
+        return None
+
+    def complete(self, job, worker_id):
+        self._finish(job, worker_id, status="done", finished_at=datetime.now(), last_error=None)
+
+    def fail(self, job, worker_id, error):
+        now = datetime.now()
+        if job.attempts >= job.max_attempts:
+            self._finish(job, worker_id, status="failed", finished_at=now, last_error=error)
+        else:
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            self._finish(job, worker_id, status="queued", available_at=now + timedelta(seconds=delay), last_error=error)
+
+    def _finish(self, job, worker_id, **values):
+        # Only while worker_id still holds the lease; after it ran out the job
+        # belongs to whoever claimed it next
+        with self.session_factory() as db:
+            db.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job.id, ReportJob.status == "running", ReportJob.locked_by == worker_id)
+                .values(locked_by=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+    def purge(self, retention_hours=REPORT_JOB_RETENTION_HOURS):
+        # Delete jobs that finished more than retention_hours ago
+        cutoff = datetime.now() - timedelta(hours=retention_hours)
+        with self.session_factory() as db:
+            deleted = db.execute(
+                delete(ReportJob).where(ReportJob.status.in_(("done", "failed")), ReportJob.finished_at < cutoff)
+            ).rowcount
+            db.commit()
+        return deleted
+
+    def latest(self, db, notification_id):
+        # The newest job of a notification, or None
+        return db.query(ReportJob).filter(ReportJob.notification_id == notification_id) \
+            .order_by(ReportJob.id.desc()).first()
+
+    def stats(self, db):
+        now = datetime.now()
+        counts = dict(db.execute(select(ReportJob.status, func.count()).group_by(ReportJob.status)).all())
+        oldest = db.scalar(
+            select(func.min(ReportJob.available_at))
+            .where(ReportJob.status == "queued", ReportJob.available_at <= now)
+        )
+        return {
+            "visibility_timeout_seconds": self.visibility_timeout,
+            "max_attempts": self.max_attempts,
+            "jobs": {status: counts.get(status, 0) for status in STATUSES},
+            "lag_seconds": (now - oldest).total_seconds() if oldest is not None else 0.0,
+        }
+
+    def observe(self):
+        # Refresh the queue gauges; registered to run on each /metrics scrape
+        with self.session_factory() as db:
+            stats = self.stats(db)
+        for status, count in stats["jobs"].items():
+            REPORT_JOBS.set(count, status=status)
+        REPORT_QUEUE_LAG.set(stats["lag_seconds"])
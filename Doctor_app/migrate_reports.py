@@ -0,0 +1,96 @@
+# Moves report PDFs stored inline in notifications.report into the report store,
+# and catalogs the final reports written to static/final_reports. Applies any
+# pending schema migrations first.
+# Safe to re-run: rows that already have a report_hash are skipped.
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+from db import SessionLocal, engine
+from migrations import upgrade
+from report_gc import sweep
+from report_store import ReportStore
+from report_text import extract_raw_text
+
+BATCH_SIZE = 50
+FINAL_REPORTS_DIR = "static/final_reports"
+FINAL_REPORT_FIELDS = re.compile(
+    r"Patient Name: (?P<patient>.+)\nPrediction Result: (?P<prediction>\w+)\nReport by: Dr\. (?P<doctor>.+)"
+)
+
+
+def move_blobs(store):
+    moved = 0
+    while True:
+        # Small batches keep memory bounded to a few blobs at a time
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, report FROM notifications "
+                "WHERE report IS NOT NULL AND report_hash IS NULL LIMIT :limit"
+            ), {"limit": BATCH_SIZE}).fetchall()
+            if not rows:
+                return moved
+            for notification_id, blob in rows:
+                if isinstance(blob, str):
+                    blob = blob.encode()
+                digest, size = store.save_bytes(blob)
+                conn.execute(text(
+                    "UPDATE notifications SET report_hash = :digest, report_size = :size, report = NULL "
+                    "WHERE id = :id"
+                ), {"digest": digest, "size": size, "id": notification_id})
+                moved += 1
+
+
+def import_final_reports(store, directory=FINAL_REPORTS_DIR):
+    # Catalog the PDFs final_report used to write to disk; the doctor and
+    # patient are read back from the report text. The files are left in place.
+    imported = 0
+    if not os.path.isdir(directory):
+        return imported
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not filename.endswith(".pdf"):
+            continue
+        fields = FINAL_REPORT_FIELDS.search(extract_raw_text(path))
+        if not fields:
+            # An uploaded report rather than one we generated
+            continue
+        with open(path, "rb") as f:
+            digest, size = store.save(f)
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT 1 FROM final_reports WHERE report_hash = :digest"), {"digest": digest}).first():
+                continue
+            doctor_id = conn.execute(
+                text("SELECT id FROM doctors WHERE name = :name"), {"name": fields.group("doctor").strip()}
+            ).scalar()
+            conn.execute(text(
+                "INSERT INTO final_reports (doctor_id, patient_name, prediction, report_hash, report_size, created_at) "
+                "VALUES (:doctor_id, :patient, :prediction, :digest, :size, :created_at)"
+            ), {
+                "doctor_id": doctor_id,
+                "patient": fields.group("patient").strip(),
+                "prediction": fields.group("prediction"),
+                "digest": digest,
+                "size": size,
+                "created_at": datetime.fromtimestamp(os.path.getmtime(path)),
+            })
+            imported += 1
+    return imported
+
+
+if __name__ == "__main__":
+    upgrade(engine)
+    store = ReportStore()
+    moved = move_blobs(store)
+    imported = import_final_reports(store)
+    # Files left without a row, e.g. by migration 10 dropping duplicate final reports
+    with SessionLocal() as db:
+        swept = sweep(db, store)
+    # Give the space held by the old blobs back to the filesystem
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print(f"Moved {moved} report(s) into the report store.")
+    print(f"Cataloged {imported} final report(s) from {FINAL_REPORTS_DIR}.")
+    print(f"Deleted {swept} unused report file(s).")
@@ -0,0 +1,132 @@
+# Schema migrations of doctor_app's database; run them with init_db.py.
+# Versions 1-4 bring databases from before versioned migrations up to date.
+from sqlalchemy import inspect, select, text, update
+
+from db import Base
+import models  # Registers the tables on Base
+from parkinson_common.migration_runner import Migrations, add_column, create_index
+from report_search import ReportSearch, create_table as create_search_table
+
+migrations = Migrations(Base.metadata)
+
+
+def model_index(table, name):
+    return next(index for index in Base.metadata.tables[table].indexes if index.name == name)
+
+
+@migrations.register(1)
+def baseline_tables(conn):
+    # Tables added to the models before versioned migrations, for databases
+    # created without them
+    names = ["doctors", "notifications", "patients", "patient_reports",
+             "report_extractions", "final_reports", "user_sessions"]
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[name] for name in names])
+
+
+@migrations.register(2)
+def nullable_inline_reports(conn):
+    # Reports moved to the report store: notifications gains report_hash and
+    # report_size, and report may be NULL
+    existing = {column["name"] for column in inspect(conn).get_columns("notifications")}
+    if "report_hash" in existing:
+        return
+    # SQLite can't drop the NOT NULL on report in place, so rebuild the table
+    conn.execute(text("""
+        CREATE TABLE notifications_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER,
+            patient_name TEXT,
+            date DATETIME,
+            report BLOB,
+            report_hash VARCHAR(64),
+            report_size INTEGER
+        )
+    """))
+    conn.execute(text("""
+        INSERT INTO notifications_new (id, doctor_id, patient_name, date, report)
+        SELECT id, doctor_id, patient_name, date, report FROM notifications
+    """))
+    conn.execute(text("DROP TABLE notifications"))
+    conn.execute(text("ALTER TABLE notifications_new RENAME TO notifications"))
+    conn.execute(text("CREATE INDEX ix_notifications_id ON notifications (id)"))
+
+
+@migrations.register(3)
+def extraction_confidence(conn):
+    add_column(conn, "report_extractions", "confidence", "TEXT")
+
+
+@migrations.register(4, transactional=False)
+def listing_indexes(conn):
+    # Indexes behind the report store lookups, the keyset-paged lists and the
+    # session purge
+    for table, name in [
+        ("notifications", "ix_notifications_report_hash"),
+        ("notifications", "ix_notifications_doctor_date"),
+        ("final_reports", "ix_final_reports_doctor_created"),
+        ("final_reports", "ix_final_reports_patient_name"),
+        ("user_sessions", "ix_user_sessions_expires_at"),
+    ]:
+        create_index(conn, model_index(table, name))
+
+
+@migrations.register(5)
+def report_jobs(conn):
+    # Queue of received reports to pre-process, and their draft predictions
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables["report_jobs"], Base.metadata.tables["report_drafts"]])
+
+
+@migrations.register(6)
+def report_search(conn):
+    # Full-text index of received reports, filled with the ones already there
+    if conn.dialect.name != "sqlite":
+        return
+    create_search_table(conn)
+    ReportSearch().backfill(conn)
+
+
+@migrations.register(7, transactional=False)
+def patient_features(conn):
+    # Scored visits of each patient, and the unique name they are filed under
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables["patient_features"]])
+    create_index(conn, model_index("patients", "ix_patients_name"))
+
+
+@migrations.register(8)
+def prediction_cache(conn):
+    # Persistent tier of the prediction and rendered report cache
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables["cached_predictions"], Base.metadata.tables["cached_reports"]])
+
+
+@migrations.register(9, transactional=False)
+def report_hash_indexes(conn):
+    # Every table pointing into the report store is checked before a stored
+    # file is deleted
+    create_index(conn, model_index("final_reports", "ix_final_reports_report_hash"))
+    create_index(conn, model_index("cached_reports", "ix_cached_reports_report_hash"))
+
+
+@migrations.register(10, transactional=False)
+def visits_by_notification(conn):
+    # Re-scoring a notification replaces its visit and its final report:
+    # patient_features gains the notification of each visit (0 for the ones
+    # recorded before), and final_reports keeps the newest report of each
+    # notification, then indexes them uniquely
+    features = Base.metadata.tables["patient_features"]
+    add_column(conn, "patient_features", "notification_ids", features.c.notification_ids.type.compile(dialect=conn.dialect))
+    for patient_id, visits in conn.execute(
+        select(features.c.patient_id, features.c.visits).where(features.c.notification_ids.is_(None))
+    ).all():
+        conn.execute(
+            update(features).where(features.c.patient_id == patient_id).values(notification_ids=bytes(8 * visits))
+        )
+    conn.execute(text("""
+        DELETE FROM final_reports WHERE notification_id IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM final_reports WHERE notification_id IS NOT NULL GROUP BY notification_id
+        )
+    """))
+    create_index(conn, model_index("final_reports", "ix_final_reports_notification_id"))
+
+
+def upgrade(engine):
+    return migrations.upgrade(engine)
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from features import columns
+from parkinson_common.metrics import registry
+
+# Point at a model.npz written by numpy_model.py to serve without scikit-learn
+MODEL_PATH = os.getenv("MODEL_PATH", "model.pkl")
+# Directory holding joblib re-dumps of the model that workers memory-map
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model_cache")
+# Seconds between checks of MODEL_PATH for a new model
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "2"))
+
+MODEL_INFERENCE_SECONDS = registry.histogram(
+    "model_inference_seconds", "Duration of each model.predict call, of a micro-batch or a bulk chunk."
+)
+MODEL_INFERENCE_ROWS = registry.counter("model_inference_rows_total", "Rows scored by the model.")
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ModelRegistry:
+    """Lazily loads the model, shares its arrays between workers and hot-swaps it on change.
+
+    Deploy a new model by writing it next to MODEL_PATH and renaming it into
+    place; requests keep using the previous model until the new one is loaded
+    and warmed up, then the reference is swapped in one assignment.
+    """
+
+    def __init__(self, path=MODEL_PATH, cache_dir=MODEL_CACHE_DIR, check_interval=MODEL_RELOAD_INTERVAL):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+
+        self._model = None
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+        self.version = None
+        self.loaded_at = None
+        self.loads = 0
+        self.reload_errors = 0
+
+    def _file_signature(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _mapped_copy(self, digest):
+        # A plain pickle can't be memory-mapped, so re-dump it once per model
+        # version with joblib; every worker then maps the same file pages
+        import joblib
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        mapped_path = os.path.join(self.cache_dir, f"{digest}.joblib")
+        if not os.path.exists(mapped_path):
+            tmp_path = f"{mapped_path}.{os.getpid()}.tmp"
+            joblib.dump(joblib.load(self.path), tmp_path)
+            os.replace(tmp_path, mapped_path)
+        return mapped_path
+
+    def _load(self):
+        digest = file_digest(self.path)
+        if self.path.endswith(".npz"):
+            # Exported by numpy_model.py; serving it needs neither sklearn nor joblib
+            from numpy_model import NumpyModel
+
+            model = NumpyModel.load(self.path)
+        else:
+            import joblib
+
+            model = joblib.load(self._mapped_copy(digest), mmap_mode="r")
+        # Warm up so the first real request doesn't pay for lazy initialisation
+        model.predict(np.zeros((1, len(columns))))
+        return model, digest
+
+    def _prune_cache(self, keep):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".joblib") and name != f"{keep}.joblib":
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _refresh(self):
+        # Only the first load blocks callers; later reloads happen while the
+        # current model keeps serving
+        if not self._lock.acquire(blocking=self._model is None):
+            return
+        try:
+            now = time.monotonic()
+            if self._model is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+
+            try:
+                signature = self._file_signature()
+            except OSError:
+                if self._model is None:
+                    raise
+                logging.warning(f"Model file {self.path} is missing, keeping version {self.version}")
+                return
+            if signature == self._signature:
+                return
+
+            try:
+                model, digest = self._load()
+            except Exception as e:
+                if self._model is None:
+                    raise
+                self.reload_errors += 1
+                logging.error(f"Failed to reload model from {self.path}: {e}")
+                return
+
+            previous = self.version
+            self._model, self._signature, self.version = model, signature, digest
+            self.loaded_at = time.time()
+            self.loads += 1
+            if os.path.isdir(self.cache_dir):
+                self._prune_cache(digest)
+            if previous is not None and previous != digest:
+                logging.info(f"Model reloaded: {previous} -> {digest}")
+                for listener in self._listeners:
+                    listener(digest)
+        finally:
+            self._lock.release()
+
+    def get(self):
+        if self._model is None or time.monotonic() >= self._next_check:
+            self._refresh()
+        return self._model
+
+    def predict(self, inputs):
+        model = self.get()
+        started = time.perf_counter()
+        predictions = model.predict(inputs)
+        MODEL_INFERENCE_SECONDS.observe(time.perf_counter() - started)
+        MODEL_INFERENCE_ROWS.inc(len(inputs))
+        return predictions
+
+    def on_reload(self, listener):
+        # Register a callback receiving the new version after each hot swap
+        self._listeners.append(listener)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "loaded": self._model is not None,
+            "loaded_at": self.loaded_at,
+            "loads": self.loads,
+            "reload_errors": self.reload_errors,
+        }
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text , BLOB, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Text , BLOB, DateTime, Index
 from db import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 class Doctor(Base):
     __tablename__ = "doctors"
     
@@ -20,14 +20,23 @@ class Notification(Base):
     doctor_id = Column(Integer)
     patient_name = Column(String)
     date = Column(DateTime)
-    report = Column(String)
+    # Legacy inline PDF; new reports live in the report store under report_hash.
+    # Deferred so listing notifications never loads it.
+    report = deferred(Column(String, nullable=True))
+    report_hash = Column(String(64), index=True)
+    report_size = Column(Integer)
+
+    # Serves each doctor's newest-first dashboard
+    __table_args__ = (
+        Index("ix_notifications_doctor_date", "doctor_id", "date", "id"),
+    )
 
 class Patient(Base):
     __tablename__ = 'patients'
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
-    prediction = Column(Text, nullable=True)
+    name = Column(String, nullable=False, unique=True, index=True)
+    prediction = Column(Text, nullable=True)  # Latest result, Positive or Negative
 
     reports = relationship("PatientReport", back_populates="patient")
 
@@ -39,4 +48,108 @@ class PatientReport(Base):
     patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
     report = Column(Text, nullable=False)
 
-    patient = relationship("Patient", back_populates="reports")
\ No newline at end of file
+    patient = relationship("Patient", back_populates="reports")
+
+class ReportExtraction(Base):
+    __tablename__ = "report_extractions"
+
+    # SHA-256 of the PDF the text was extracted from
+    content_hash = Column(String(64), primary_key=True)
+    text = Column(Text, nullable=False)
+    features = Column(Text, nullable=False)  # JSON object keyed by feature column
+    confidence = Column(Text)  # JSON object of per-feature detection confidence
+    created_at = Column(DateTime, nullable=False)
+
+class FinalReport(Base):
+    __tablename__ = "final_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, nullable=True)
+    notification_id = Column(Integer, nullable=True)
+    patient_name = Column(String, index=True)
+    prediction = Column(String)
+    # Rendered PDF, stored in the report store under its content hash
+    report_hash = Column(String(64), nullable=False, index=True)
+    report_size = Column(Integer)
+    created_at = Column(DateTime, nullable=False)
+
+    # Serves each doctor's newest-first listing; one report per notification
+    __table_args__ = (
+        Index("ix_final_reports_doctor_created", "doctor_id", "created_at", "id"),
+        Index("ix_final_reports_notification_id", "notification_id", unique=True),
+    )
+
+class UserSession(Base):
+    __tablename__ = "user_sessions"
+
+    # SHA-256 of the session cookie's token
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    # Pre-processing of a received report (see job_queue.py)
+    id = Column(Integer, primary_key=True)
+    notification_id = Column(Integer, nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False)  # queued, running, done or failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # When a queued job may run, or a running job's lease runs out
+    available_at = Column(DateTime, nullable=False)
+    locked_by = Column(String)
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    # Serves the workers' claim query and the queue lag
+    __table_args__ = (
+        Index("ix_report_jobs_status_available", "status", "available_at", "id"),
+    )
+
+class ReportDraft(Base):
+    __tablename__ = "report_drafts"
+
+    # Prediction on a report's extracted features, before the doctor reviews them
+    content_hash = Column(String(64), primary_key=True)
+    prediction = Column(String, nullable=False)
+    model_version = Column(String(64), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+class PatientFeatures(Base):
+    __tablename__ = "patient_features"
+
+    # Every scored visit of a patient, oldest first, as packed little-endian
+    # arrays (see feature_store.py): features is visits x 22 float64 in
+    # features.columns order, scored_at float64 epoch seconds, predictions
+    # int8 (1 = Positive), notification_ids int64 (0 = unknown)
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+    visits = Column(Integer, nullable=False)
+    features = Column(BLOB, nullable=False)
+    scored_at = Column(BLOB, nullable=False)
+    predictions = Column(BLOB, nullable=False)
+    notification_ids = Column(BLOB, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+class CachedPrediction(Base):
+    __tablename__ = "cached_predictions"
+
+    # The model's output for a feature vector (see prediction_cache.py)
+    model_version = Column(String(64), primary_key=True)
+    feature_hash = Column(String(64), primary_key=True)
+    prediction = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+class CachedReport(Base):
+    __tablename__ = "cached_reports"
+
+    # A rendered final report, stored in the report store
+    model_version = Column(String(64), primary_key=True)
+    render_key = Column(String(64), primary_key=True)
+    report_hash = Column(String(64), nullable=False, index=True)
+    report_size = Column(Integer)
+    created_at = Column(DateTime, nullable=False, index=True)
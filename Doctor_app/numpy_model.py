@@ -0,0 +1,259 @@
+import json
+import sys
+
+import numpy as np
+
+# Bump when the layout of the exported arrays changes
+FORMAT_VERSION = 1
+
+
+# ---- Export (needs scikit-learn, run offline) ----
+
+def _export_transform(step, index, arrays):
+    name = type(step).__name__
+    prefix = f"t{index}_"
+    if name == "StandardScaler":
+        n = step.n_features_in_
+        arrays[prefix + "sub"] = step.mean_ if step.mean_ is not None else np.zeros(n)
+        arrays[prefix + "div"] = step.scale_ if step.scale_ is not None else np.ones(n)
+        return "center_scale"
+    if name == "RobustScaler":
+        n = step.n_features_in_
+        arrays[prefix + "sub"] = step.center_ if step.center_ is not None else np.zeros(n)
+        arrays[prefix + "div"] = step.scale_ if step.scale_ is not None else np.ones(n)
+        return "center_scale"
+    if name == "MaxAbsScaler":
+        arrays[prefix + "sub"] = np.zeros(step.n_features_in_)
+        arrays[prefix + "div"] = step.scale_
+        return "center_scale"
+    if name == "MinMaxScaler":
+        arrays[prefix + "mul"] = step.scale_
+        arrays[prefix + "add"] = step.min_
+        return "affine"
+    raise ValueError(f"Unsupported pipeline step: {name}")
+
+
+def _export_trees(trees, arrays, normalize):
+    # Concatenate every tree's node arrays; child indexes become global offsets
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        t = tree.tree_
+        left = t.children_left.astype(np.int32)
+        right = t.children_right.astype(np.int32)
+        leaf = left == -1
+        roots.append(offset)
+        features.append(np.where(leaf, 0, t.feature).astype(np.int32))
+        thresholds.append(t.threshold.astype(np.float64))
+        lefts.append(np.where(leaf, -1, left + offset).astype(np.int32))
+        rights.append(np.where(leaf, -1, right + offset).astype(np.int32))
+        value = t.value[:, 0, :].astype(np.float64)
+        if normalize:
+            totals = value.sum(axis=1, keepdims=True)
+            value = value / np.where(totals == 0, 1.0, totals)
+        values.append(value)
+        offset += t.node_count
+
+    arrays["tree_roots"] = np.asarray(roots, dtype=np.int32)
+    arrays["tree_feature"] = np.concatenate(features)
+    arrays["tree_threshold"] = np.concatenate(thresholds)
+    arrays["tree_left"] = np.concatenate(lefts)
+    arrays["tree_right"] = np.concatenate(rights)
+    arrays["tree_value"] = np.concatenate(values)
+
+
+def _gradient_boosting_init(estimator):
+    # The raw score the boosted trees are added to: the link function of the
+    # init estimator's probability of the positive class (logit for log_loss,
+    # half the logit for exponential), clipped as scikit-learn clips it
+    if isinstance(estimator.init_, str) and estimator.init_ == "zero":
+        return 0.0
+    if type(estimator.init_).__name__ != "DummyClassifier":
+        raise ValueError("Only GradientBoostingClassifier models with the default init are supported")
+    eps = np.finfo(np.float64).eps
+    proba = estimator.init_.predict_proba(np.zeros((1, estimator.n_features_in_)))[0, 1]
+    proba = float(np.clip(proba, eps, 1 - eps))
+    log_odds = float(np.log(proba / (1 - proba)))
+    return log_odds / 2 if estimator.loss == "exponential" else log_odds
+
+
+def _export_estimator(estimator, arrays):
+    name = type(estimator).__name__
+    classes = np.asarray(estimator.classes_)
+    arrays["classes"] = classes
+
+    if name in ("SVC", "NuSVC"):
+        if len(classes) != 2:
+            raise ValueError(f"Only binary {name} models are supported")
+        arrays["support_vectors"] = np.asarray(estimator.support_vectors_, dtype=np.float64)
+        arrays["dual_coef"] = np.asarray(estimator.dual_coef_, dtype=np.float64)[0]
+        arrays["intercept"] = np.asarray(estimator.intercept_, dtype=np.float64)
+        return {
+            "kind": "svc",
+            "kernel": estimator.kernel,
+            # gamma="scale"/"auto" is only resolved at fit time, into the
+            # private _gamma (present since scikit-learn 0.22; covered by
+            # tests/test_numpy_model.py)
+            "gamma": float(estimator.gamma if not isinstance(estimator.gamma, str) else estimator._gamma),
+            "coef0": float(estimator.coef0),
+            "degree": int(estimator.degree),
+        }
+
+    if name in ("DecisionTreeClassifier", "RandomForestClassifier", "ExtraTreesClassifier"):
+        trees = estimator.estimators_ if hasattr(estimator, "estimators_") else [estimator]
+        _export_trees(trees, arrays, normalize=True)
+        return {"kind": "forest"}
+
+    if name == "GradientBoostingClassifier":
+        if len(classes) != 2:
+            raise ValueError("Only binary GradientBoostingClassifier models are supported")
+        _export_trees(estimator.estimators_[:, 0], arrays, normalize=False)
+        return {
+            "kind": "gradient_boosting",
+            "learning_rate": float(estimator.learning_rate),
+            "init": _gradient_boosting_init(estimator),
+        }
+
+    if hasattr(estimator, "coef_") and hasattr(estimator, "intercept_"):
+        # LogisticRegression, LinearSVC, SGDClassifier, RidgeClassifier, Perceptron...
+        arrays["coef"] = np.atleast_2d(np.asarray(estimator.coef_, dtype=np.float64))
+        arrays["intercept"] = np.atleast_1d(np.asarray(estimator.intercept_, dtype=np.float64))
+        return {"kind": "linear"}
+
+    raise ValueError(f"Unsupported estimator: {name}")
+
+
+def export_model(estimator, path):
+    # Write a fitted scikit-learn classifier (optionally a Pipeline of scalers
+    # followed by the classifier) to a plain .npz file
+    arrays = {}
+    steps = getattr(estimator, "steps", None)
+    if steps is None:
+        transforms, final = [], estimator
+    else:
+        transforms = [step for _, step in steps[:-1] if step not in (None, "passthrough")]
+        final = steps[-1][1]
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "source": type(final).__name__,
+        "n_features": int(getattr(estimator, "n_features_in_", 0)),
+        "transforms": [_export_transform(step, i, arrays) for i, step in enumerate(transforms)],
+    }
+    meta.update(_export_estimator(final, arrays))
+
+    with open(path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+# ---- Inference (NumPy only) ----
+
+class NumpyModel:
+    """Pure-NumPy predictor for models written by export_model."""
+
+    def __init__(self, meta, arrays):
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model format version: {meta.get('format_version')}")
+        self.meta = meta
+        self.kind = meta["kind"]
+        self.arrays = arrays
+        self.classes_ = arrays["classes"]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        meta = json.loads(str(arrays.pop("meta")))
+        return cls(meta, arrays)
+
+    def transform(self, X):
+        for i, kind in enumerate(self.meta["transforms"]):
+            prefix = f"t{i}_"
+            if kind == "center_scale":
+                X = (X - self.arrays[prefix + "sub"]) / self.arrays[prefix + "div"]
+            else:
+                X = X * self.arrays[prefix + "mul"] + self.arrays[prefix + "add"]
+        return X
+
+    def _kernel(self, X):
+        sv = self.arrays["support_vectors"]
+        kernel = self.meta["kernel"]
+        gamma, coef0, degree = self.meta["gamma"], self.meta["coef0"], self.meta["degree"]
+        if kernel == "linear":
+            return X @ sv.T
+        if kernel == "rbf":
+            sq_dist = (X * X).sum(axis=1)[:, None] - 2.0 * (X @ sv.T) + (sv * sv).sum(axis=1)[None, :]
+            return np.exp(-gamma * np.maximum(sq_dist, 0.0))
+        if kernel == "poly":
+            return (gamma * (X @ sv.T) + coef0) ** degree
+        if kernel == "sigmoid":
+            return np.tanh(gamma * (X @ sv.T) + coef0)
+        raise ValueError(f"Unsupported SVC kernel: {kernel}")
+
+    def _leaves(self, X):
+        # Walk all trees for all rows at once, one tree level per iteration
+        feature = self.arrays["tree_feature"]
+        threshold = self.arrays["tree_threshold"]
+        left = self.arrays["tree_left"]
+        right = self.arrays["tree_right"]
+        nodes = np.tile(self.arrays["tree_roots"], (X.shape[0], 1))
+        rows = np.arange(X.shape[0])[:, None]
+        while True:
+            internal = left[nodes] != -1
+            if not internal.any():
+                return nodes
+            go_left = X[rows, feature[nodes]] <= threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left[nodes], right[nodes]), nodes)
+
+    def decision_function(self, X):
+        X = self.transform(np.asarray(X, dtype=np.float64))
+        if self.kind == "svc":
+            return self._kernel(X) @ self.arrays["dual_coef"] + self.arrays["intercept"][0]
+        if self.kind == "linear":
+            scores = X @ self.arrays["coef"].T + self.arrays["intercept"]
+            return scores[:, 0] if scores.shape[1] == 1 else scores
+        if self.kind == "gradient_boosting":
+            # scikit-learn's trees compare float32 inputs against float64 thresholds
+            leaves = self._leaves(X.astype(np.float32))
+            values = self.arrays["tree_value"][leaves, 0]
+            return self.meta["init"] + self.meta["learning_rate"] * values.sum(axis=1)
+        raise ValueError(f"decision_function is not available for {self.kind} models")
+
+    def predict_proba(self, X):
+        if self.kind != "forest":
+            raise ValueError(f"predict_proba is not available for {self.kind} models")
+        X = self.transform(np.asarray(X, dtype=np.float64))
+        leaves = self._leaves(X.astype(np.float32))
+        return self.arrays["tree_value"][leaves].mean(axis=1)
+
+    def predict(self, X):
+        if self.kind == "forest":
+            return self.classes_[self.predict_proba(X).argmax(axis=1)]
+        scores = self.decision_function(X)
+        if scores.ndim == 1:
+            return self.classes_[(scores > 0).astype(int)]
+        return self.classes_[scores.argmax(axis=1)]
+
+
+if __name__ == "__main__":
+    # Usage: python numpy_model.py model.pkl model.npz
+    import joblib
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "model.pkl"
+    target = sys.argv[2] if len(sys.argv) > 2 else "model.npz"
+    estimator = joblib.load(source)
+    export_model(estimator, target)
+
+    # Refuse to leave behind an export that disagrees with the original
+    rng = np.random.default_rng(0)
+    steps = getattr(estimator, "steps", None)
+    scaler = steps[0][1] if steps else None
+    center = getattr(scaler, "mean_", None)
+    spread = getattr(scaler, "scale_", None)
+    n_features = estimator.n_features_in_
+    samples = rng.normal(size=(10000, n_features))
+    if center is not None and spread is not None:
+        samples = center + samples * spread * 2
+    mismatches = int((NumpyModel.load(target).predict(samples) != estimator.predict(samples)).sum())
+    print(f"Exported {source} -> {target}: {mismatches} mismatches on {len(samples)} samples")
+    sys.exit(1 if mismatches else 0)
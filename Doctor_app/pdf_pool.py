@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from parkinson_common.metrics import registry
+
+# Pool sizing and limits, overridable per deployment
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a free worker before new ones are turned away
+PDF_POOL_MAX_QUEUED = int(os.getenv("PDF_POOL_MAX_QUEUED", "16"))
+PDF_JOB_TIMEOUT = float(os.getenv("PDF_JOB_TIMEOUT", "30"))
+# Runs of a job that may be lost to another job's timeout before it fails
+PDF_JOB_ATTEMPTS = 2
+
+PDF_JOB_SECONDS = registry.histogram(
+    "pdf_job_duration_seconds", "Duration of completed PDF jobs (parsing, rendering), queue wait included.", ("job",)
+)
+PDF_JOBS = registry.counter("pdf_jobs_total", "PDF jobs by outcome.", ("job", "outcome"))
+
+
+class PoolBusy(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+# Queue on which a worker process reports the jobs it starts, set by the initializer
+_started = None
+
+
+def _init_worker(started):
+    global _started
+    _started = started
+
+
+def _run_job(job_id, fn, *args):
+    # Tell the parent this job is running, and in which process, so its
+    # deadline starts now rather than when it was queued
+    _started.put((job_id, os.getpid()))
+    return fn(*args)
+
+
+def _set_started(future, pid):
+    if not future.done():
+        future.set_result(pid)
+
+
+class PdfPool:
+    """Runs CPU-heavy PDF work (parsing, rendering) in a bounded pool of worker processes.
+
+    At most `workers` jobs run at once and `max_queued` more may wait; past
+    that, `run` raises PoolBusy straight away instead of letting the backlog
+    grow. A job that runs past its timeout raises JobTimeout and its worker is
+    killed, so a pathological PDF can't hold a worker forever. The timeout
+    counts from when the job starts running, not from when it was queued.
+    Killing a worker breaks the whole pool, so the other jobs that were
+    running or queued in it are run again on a fresh one.
+    """
+
+    def __init__(self, workers=PDF_POOL_WORKERS, max_queued=PDF_POOL_MAX_QUEUED, timeout=PDF_JOB_TIMEOUT):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(0, int(max_queued))
+        self.timeout = timeout
+
+        # Worker processes are started on first use
+        self._executor = None
+        self._started = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Jobs submitted but not yet started: job id -> (loop, future set to the worker's pid)
+        self._starting = {}
+        self._job_ids = itertools.count()
+
+        self.submitted = Counter()
+        self.completed = Counter()
+        self.failed = Counter()
+        self.timeouts = Counter()
+        self.rejected = Counter()
+        self.job_seconds = Counter()
+        self.slowest_job = {}
+        self.restarts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs threads (the event loop's
+                # executor, the model reloader) can copy held locks into the child
+                context = multiprocessing.get_context("spawn")
+                self._started = context.SimpleQueue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self._started,)
+                )
+                threading.Thread(target=self._watch_starts, args=(self._started,), daemon=True).start()
+            return self._executor
+
+    def _watch_starts(self, started):
+        # Wake the jobs whose workers report them started, until the pool is discarded
+        while True:
+            item = started.get()
+            if item is None:
+                return
+            job_id, pid = item
+            with self._lock:
+                waiter = self._starting.pop(job_id, None)
+            if waiter is not None:
+                loop, future = waiter
+                loop.call_soon_threadsafe(_set_started, future, pid)
+
+    def _discard(self, executor):
+        # Start a fresh pool on the next job; the old one is broken or about to be
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            started, self._started = self._started, None
+            self.restarts += 1
+        started.put(None)
+        executor.shutdown(wait=False)
+
+    async def _run_once(self, executor, fn, args, timeout):
+        loop = asyncio.get_running_loop()
+        job_id = next(self._job_ids)
+        started = loop.create_future()
+        with self._lock:
+            self._starting[job_id] = (loop, started)
+        future = loop.run_in_executor(executor, _run_job, job_id, fn, *args)
+        try:
+            # No deadline while the job waits for a worker; admission in run() bounds that wait
+            await asyncio.wait({started, future}, return_when=asyncio.FIRST_COMPLETED)
+            if future.done():
+                return future.result()
+            pid = started.result()
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                # Kill only the hung worker. The pool notices the dead process
+                # and fails its other jobs with BrokenProcessPool, and run()
+                # submits those again to a fresh pool.
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                self._discard(executor)
+                raise JobTimeout(f"{fn.__name__} took longer than {timeout}s")
+        finally:
+            with self._lock:
+                self._starting.pop(job_id, None)
+            started.cancel()
+            future.cancel()
+
+    async def run(self, fn, *args, timeout=None):
+        # Run fn(*args) in a worker process and return its result
+        name = fn.__name__
+        with self._lock:
+            if self._pending >= self.workers + self.max_queued:
+                self.rejected[name] += 1
+                PDF_JOBS.inc(job=name, outcome="rejected")
+                raise PoolBusy(f"PDF pool is full ({self._pending} jobs in progress)")
+            self._pending += 1
+        self.submitted[name] += 1
+
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        try:
+            for attempt in range(1, PDF_JOB_ATTEMPTS + 1):
+                executor = self._get_executor()
+                try:
+                    result = await self._run_once(executor, fn, args, timeout)
+                    break
+                except BrokenProcessPool:
+                    # A worker died: another job's timeout, a crash or an OOM kill
+                    self._discard(executor)
+                    if attempt == PDF_JOB_ATTEMPTS:
+                        raise
+                    logging.warning(f"PDF job {name} was lost when its pool broke, running it again")
+        except JobTimeout:
+            self.timeouts[name] += 1
+            PDF_JOBS.inc(job=name, outcome="timeout")
+            logging.warning(f"PDF job {name} timed out after {timeout}s, its worker was killed")
+            raise
+        except Exception:
+            self.failed[name] += 1
+            PDF_JOBS.inc(job=name, outcome="failed")
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+        elapsed = time.perf_counter() - started
+        self.completed[name] += 1
+        self.job_seconds[name] += elapsed
+        self.slowest_job[name] = max(self.slowest_job.get(name, 0.0), elapsed)
+        PDF_JOB_SECONDS.observe(elapsed, job=name)
+        PDF_JOBS.inc(job=name, outcome="completed")
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            started, self._started = self._started, None
+        if executor is not None:
+            started.put(None)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "timeout_seconds": self.timeout,
+            "in_progress": self._pending,
+            "restarts": self.restarts,
+            "jobs": {
+                name: {
+                    "submitted": self.submitted[name],
+                    "completed": self.completed[name],
+                    "failed": self.failed[name],
+                    "timeouts": self.timeouts[name],
+                    "rejected": self.rejected[name],
+                    "mean_seconds": self.job_seconds[name] / self.completed[name] if self.completed[name] else 0.0,
+                    "max_seconds": self.slowest_job.get(name, 0.0),
+                }
+                for name in sorted(set(self.submitted) | set(self.rejected))
+            },
+        }
@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+import report_gc
+from db import SessionLocal
+from models import CachedPrediction, CachedReport
+
+# Entries (predictions and rendered reports) kept in memory per worker
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+# Rows kept in each of the cached_predictions and cached_reports tables;
+# the oldest go past that
+PREDICTION_CACHE_DB_ROWS = int(os.getenv("PREDICTION_CACHE_DB_ROWS", "100000"))
+# Significant digits features are rounded to before hashing, so the same
+# values typed or parsed slightly differently share an entry
+PREDICTION_CACHE_DIGITS = int(os.getenv("PREDICTION_CACHE_DIGITS", "10"))
+# Stores between trims of the tables to PREDICTION_CACHE_DB_ROWS
+TRIM_EVERY = 500
+
+
+def feature_hash(values, digits=PREDICTION_CACHE_DIGITS):
+    # SHA-256 of the features rounded to `digits` significant digits; + 0.0
+    # turns -0.0 into 0.0
+    normalized = ",".join(f"{float(value) + 0.0:.{digits}g}" for value in values)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def render_key(values, prediction, patient_name, doctor_name):
+    # What a final report PDF shows: the names, the result and the values
+    # exactly as printed, so a cached PDF reads the same as a fresh render.
+    # Only the bytes differ: FPDF stamps each render with its creation date.
+    printed = "\x1f".join([patient_name, doctor_name, str(prediction), *(str(value) for value in values)])
+    return hashlib.sha256(printed.encode()).hexdigest()
+
+
+class PredictionCache:
+    """Model predictions and rendered final reports of feature vectors already scored.
+
+    Predictions are keyed by the model version and feature_hash(); rendered
+    reports by the model version and render_key(), pointing at the PDF in
+    the report store. Lookups go to an in-process LRU first, then to the
+    cached_predictions and cached_reports tables, like ExtractionCache.
+    Registered with the model registry, a model swap empties the LRU and
+    deletes the other versions' rows; entries are only stored while the
+    model that made them is still the current one.
+    """
+
+    def __init__(self, model_registry, report_store, session_factory=SessionLocal,
+                 max_entries=PREDICTION_CACHE_SIZE, max_rows=PREDICTION_CACHE_DB_ROWS):
+        self.model_registry = model_registry
+        self.report_store = report_store
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stores = 0
+        model_registry.on_reload(self.invalidate)
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _recall(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return value
+
+    def _load(self, db, model, key_column, key, value_columns):
+        # The stored values for key, or None; db is a sync Session
+        row = db.execute(
+            select(*value_columns).where(model.model_version == key[1], key_column == key[2])
+        ).first()
+        if row is None:
+            return None
+        self.db_hits += 1
+        value = tuple(row)
+        self._remember(key, value)
+        return value
+
+    def _store(self, db, row, key, value):
+        # Keep the entry unless the model changed since it was made
+        if row.model_version != self.model_registry.version:
+            return
+        db.merge(row)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker stored it first
+            db.rollback()
+        self._remember(key, value)
+        self._stores += 1
+        if self._stores % TRIM_EVERY == 0:
+            self.trim(db)
+
+    async def current_version(self):
+        # Loads the model, or picks up a new one, before its version is used
+        # as a key; hits never reach the model, so they would never notice a
+        # swap otherwise. Off the event loop, as a reload can take a while.
+        await run_in_threadpool(self.model_registry.get)
+        return self.model_registry.version
+
+    async def predict(self, db, values, predict):
+        # The model's prediction for the 22 values; `predict` (a coroutine
+        # function, e.g. MicroBatcher.predict) runs only on a miss. db is an
+        # async session.
+        version = await self.current_version()
+        key = ("prediction", version, feature_hash(values))
+        cached = self._recall(key) or await db.run_sync(
+            self._load, CachedPrediction, CachedPrediction.feature_hash, key, [CachedPrediction.prediction]
+        )
+        if cached is not None:
+            return cached[0]
+        self.misses += 1
+        prediction = await predict(values)
+        await db.run_sync(self._store, CachedPrediction(
+            model_version=version, feature_hash=key[2], prediction=int(prediction), created_at=datetime.now()
+        ), key, (int(prediction),))
+        return prediction
+
+    async def render(self, db, values, prediction, patient_name, doctor_name, render):
+        # (report_hash, report_size) of the final report in the report store;
+        # `render` (a coroutine function) renders and stores it, and runs only
+        # on a miss or when the stored PDF is gone
+        version = await self.current_version()
+        key = ("report", version, render_key(values, prediction, patient_name, doctor_name))
+        cached = self._recall(key) or await db.run_sync(
+            self._load, CachedReport, CachedReport.render_key, key, [CachedReport.report_hash, CachedReport.report_size]
+        )
+        # Claimed, so a concurrent report_gc sweep keeps it for the row this is for
+        if cached is not None and self.report_store.claim(cached[0]):
+            return cached
+        self.misses += 1
+        report_hash, report_size = await render()
+        await db.run_sync(self._store, CachedReport(
+            model_version=version, render_key=key[2], report_hash=report_hash, report_size=report_size,
+            created_at=datetime.now()
+        ), key, (report_hash, report_size))
+        return report_hash, report_size
+
+    def trim(self, db):
+        # Delete the oldest rows of each table past max_rows, and the rendered
+        # reports only they referred to
+        dropped = []
+        for model in (CachedPrediction, CachedReport):
+            cutoff = db.scalar(
+                select(model.created_at).order_by(model.created_at.desc()).offset(self.max_rows).limit(1)
+            )
+            if cutoff is not None:
+                dropped += self._delete(db, model, model.created_at <= cutoff)
+        db.commit()
+        report_gc.collect(db, self.report_store, dropped)
+
+    def _delete(self, db, model, condition):
+        # Deletes model's rows matching condition; the report_hash of each
+        # CachedReport deleted, for report_gc.collect
+        if model is CachedReport:
+            return db.scalars(delete(model).where(condition).returning(model.report_hash)).all()
+        db.execute(delete(model).where(condition))
+        return []
+
+    def invalidate(self, version):
+        # Model registry listener: drop every entry not made by `version`
+        with self._lock:
+            self._entries.clear()
+        self.invalidations += 1
+        try:
+            with self.session_factory() as db:
+                dropped = []
+                for model in (CachedPrediction, CachedReport):
+                    dropped += self._delete(db, model, model.model_version != version)
+                db.commit()
+                report_gc.collect(db, self.report_store, dropped)
+        except Exception as e:
+            # The rows can't be hit under the new version anyway
+            logging.warning(f"Could not delete cached predictions of old models: {e!r}")
+
+    def stats(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_rows": self.max_rows,
+            "model_version": self.model_registry.version,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
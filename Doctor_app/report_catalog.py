@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import FinalReport
+from parkinson_common.pagination import keyset_page
+
+
+def report_filename(report):
+    return f"{report.patient_name.replace(' ', '_')}_parkinsons_report_{report.id}.pdf"
+
+
+def record_report(db, doctor_id, notification_id, patient_name, prediction, report_hash, report_size):
+    # Adds the final report of a notification to the catalog, or replaces
+    # the one it already has; commits. Returns the report_hash replaced, if
+    # any, for report_gc.collect.
+    values = {
+        "doctor_id": doctor_id,
+        "patient_name": patient_name,
+        "prediction": prediction,
+        "report_hash": report_hash,
+        "report_size": report_size,
+        "created_at": datetime.now(),
+    }
+    query = db.query(FinalReport).filter(FinalReport.notification_id == notification_id)
+    report = query.first() if notification_id is not None else None
+    if report is None:
+        report = FinalReport(notification_id=notification_id, **values)
+        db.add(report)
+        try:
+            db.commit()
+            return None
+        except IntegrityError:
+            # Another request stored this notification's report first
+            db.rollback()
+            report = query.one()
+    replaced = report.report_hash
+    for name, value in values.items():
+        setattr(report, name, value)
+    db.commit()
+    return replaced
+
+
+def list_reports(db, doctor_id, before=None):
+    # A doctor's reports, newest first; served by ix_final_reports_doctor_created
+    query = db.query(FinalReport).filter(FinalReport.doctor_id == doctor_id)
+    return keyset_page(query, FinalReport.created_at, FinalReport.id, before)
@@ -0,0 +1,65 @@
+# Deletes report store files nothing refers to any more. Received reports,
+# final reports and cached renders share the content-addressed store, so a
+# file can go only once no row of any of them has its hash.
+#
+#     python report_gc.py
+#
+# sweeps the whole store. The app collects the files it stops referring to as
+# it goes, and report_worker.py sweeps every REPORT_GC_INTERVAL for the rest
+# (files left by crashes, or by rows deleted outside the app).
+#
+# Files saved or claimed in the last REPORT_GC_GRACE_SECONDS are kept: a
+# request saves a file before committing the row that refers to it, and a
+# sweep between the two must not take it. See ReportStore.delete_unused for
+# how a save racing the delete itself is handled.
+import os
+
+from sqlalchemy import select
+
+from models import CachedReport, FinalReport, Notification
+
+REPORT_GC_GRACE_SECONDS = float(os.getenv("REPORT_GC_GRACE_SECONDS", "3600"))
+# Seconds between report_worker.py's sweeps of the whole store
+REPORT_GC_INTERVAL = float(os.getenv("REPORT_GC_INTERVAL", "3600"))
+# Digests looked up per query during a sweep
+SWEEP_BATCH = 500
+
+REFERENCES = (Notification, FinalReport, CachedReport)
+
+
+def referenced(db, digests):
+    # Those of `digests` some row refers to
+    found = set()
+    for model in REFERENCES:
+        found.update(db.scalars(select(model.report_hash).where(model.report_hash.in_(digests))))
+    return found
+
+
+def collect(db, report_store, digests, grace=None):
+    # Deletes the files of `digests` that no row refers to; returns how many.
+    # Call after committing the change that dropped the references.
+    grace = REPORT_GC_GRACE_SECONDS if grace is None else grace
+    digests = {digest for digest in digests if digest}
+    if not digests:
+        return 0
+    unused = digests - referenced(db, list(digests))
+    return sum(report_store.delete_unused(digest, grace) for digest in sorted(unused))
+
+
+def sweep(db, report_store, grace=None):
+    # Collects every file in the store; returns how many were deleted
+    deleted, batch = 0, []
+    for digest in report_store.digests():
+        batch.append(digest)
+        if len(batch) == SWEEP_BATCH:
+            deleted += collect(db, report_store, batch, grace)
+            batch = []
+    return deleted + collect(db, report_store, batch, grace)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+    from report_store import ReportStore
+
+    with SessionLocal() as db:
+        print(f"Deleted {sweep(db, ReportStore())} unused report file(s).")
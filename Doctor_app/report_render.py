@@ -0,0 +1,29 @@
+from fpdf import FPDF
+
+from features import columns
+
+
+def render_final_report(patient_name, prediction_result, doctor_name, values):
+    # The final report PDF as bytes; values are the 22 features in column order.
+    # Runs in the PDF worker pool.
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Center the title
+    pdf.cell(0, 10, "Parkinson Disease Detection Report", ln=True, align='C')
+    pdf.ln(10)  # Add a line break for spacing
+
+    # Add patient name
+    pdf.cell(0, 10, f"Patient Name: {patient_name}", ln=True)
+    pdf.cell(0, 10, f"Prediction Result: {prediction_result}", ln=True)
+    pdf.cell(0, 10, f"Report by: Dr. {doctor_name}", ln=True, align='R')
+    pdf.ln(10)  # Line break for spacing
+
+    # Add input feature values ("spread1" is printed as "Spread1")
+    for column, value in zip(columns, values):
+        pdf.cell(0, 10, f"{column[0].upper()}{column[1:]}: {value}", ln=True)
+
+    # fpdf 1.x returns a latin-1 str, fpdf2 a bytearray
+    output = pdf.output(dest="S")
+    return output.encode("latin-1") if isinstance(output, str) else bytes(output)
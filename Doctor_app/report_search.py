@@ -0,0 +1,188 @@
+import os
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, event, text
+
+from db import Base, engine
+from models import Notification
+
+# Results per page of /search, and the deepest page served
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", "50"))
+# Matches ranked per search, newest first. Older ones past this many are
+# left out of the results on every page, keeping a query that matches every
+# report a few milliseconds; such a search is reported as truncated, so the
+# doctor knows to narrow it.
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "5000"))
+# Words of report text around the matches in a result's snippet
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "16"))
+
+# One row per notification, rowid = notifications.id. `doctor` holds the token
+# d<doctor_id>, so a doctor's results are an index lookup ANDed with the
+# query instead of a filter over every match.
+CREATE_TABLE = text("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_search USING fts5(
+        doctor, patient_name, date, body,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+""")
+# Results ranked by bm25 with the patient's name weighing most; the doctor
+# column is only a filter
+SET_RANK = text("INSERT INTO report_search (report_search, rank) VALUES ('rank', 'bm25(0.0, 10.0, 4.0, 1.0)')")
+
+INSERT = text("INSERT INTO report_search (rowid, doctor, patient_name, date, body) VALUES (:id, :doctor, :name, :date, :body)")
+
+# Marks around matched words, replaced by <mark> once the rest is escaped
+MATCH_START, MATCH_END = "\x02", "\x03"
+WORD = re.compile(r"(\w+)(\*?)")
+# Rows per INSERT of the backfill
+BACKFILL_BATCH = 1000
+
+# FTS5 is SQLite's; elsewhere reports aren't indexed and search is unavailable
+SEARCH_ENABLED = engine.dialect.name == "sqlite"
+
+
+def create_table(conn):
+    conn.execute(CREATE_TABLE)
+    conn.execute(SET_RANK)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_with_models(target, conn, **kw):
+    # Virtual tables aren't models; create this one with them
+    if conn.dialect.name == "sqlite":
+        create_table(conn)
+
+
+def doctor_token(doctor_id):
+    return f"d{doctor_id}"
+
+
+def indexed_date(date):
+    # Searchable as 2024-05-17, 2024 or May
+    return f"{date:%Y-%m-%d %B}" if date is not None else ""
+
+
+def index_row(notification_id, doctor_id, patient_name, date, body=""):
+    return {"id": notification_id, "doctor": doctor_token(doctor_id), "name": patient_name or "",
+            "date": indexed_date(date), "body": body or ""}
+
+
+def match_query(query):
+    # The words of a free-text query as an FTS5 expression: all of them must
+    # match, a word ending in * as a prefix. Anything else in the query is
+    # ignored, so it can't be FTS5 syntax. None if there is nothing to search for.
+    terms = [f'"{word}"{star}' for word, star in WORD.findall(query)]
+    return " AND ".join(terms) if terms else None
+
+
+def highlighted(fragment):
+    # An FTS5 snippet as HTML: escaped, with the matches in <mark>
+    return Markup(escape(fragment or "").replace(MATCH_START, Markup("<mark>")).replace(MATCH_END, Markup("</mark>")))
+
+
+class ReportSearch:
+    """Full-text index of received reports, in the report_search FTS5 table.
+
+    A notification is indexed with its patient name and date when it is
+    received, in the same transaction; its report text follows once
+    report_worker.py or a doctor's analysis has extracted it.
+    """
+
+    def __init__(self, enabled=SEARCH_ENABLED, page_size=SEARCH_PAGE_SIZE, max_pages=SEARCH_MAX_PAGES,
+                 rank_window=SEARCH_RANK_WINDOW):
+        self.enabled = enabled
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.rank_window = rank_window
+
+    def add(self, db, notification):
+        # Adds to db's transaction; the caller commits
+        if not self.enabled:
+            return
+        db.execute(INSERT, index_row(notification.id, notification.doctor_id, notification.patient_name, notification.date))
+
+    def set_text(self, db, notification_id, report_text):
+        # Indexes a notification's report text once; later calls leave it be
+        if not self.enabled:
+            return
+        db.execute(
+            text("UPDATE report_search SET body = :body WHERE rowid = :id AND body = ''"),
+            {"id": notification_id, "body": report_text or ""}
+        )
+        db.commit()
+
+    def remove(self, db, notification_id):
+        if not self.enabled:
+            return
+        db.execute(text("DELETE FROM report_search WHERE rowid = :id"), {"id": notification_id})
+        db.commit()
+
+    def search(self, db, doctor_id, query, page=1):
+        # One page of a doctor's notifications matching `query`, best first:
+        # [{"id", "patient_name", "date", "snippet"}], whether a next page
+        # exists, and whether older matches were left out of the ranking
+        expression = match_query(query)
+        if expression is None or page < 1 or page > self.max_pages:
+            return [], False, False
+        # The query's words match the searchable columns only, not the doctor token
+        match = f"doctor:{doctor_token(doctor_id)} AND {{patient_name date body}}: ({expression})"
+        # Rank first, then build highlights and snippets for this page only;
+        # in one query they would be made for every match before the sort.
+        # rowids grow with arrival, so the window is the newest matches; one
+        # match past it is fetched, not ranked, to tell if any were left out.
+        rows = db.execute(
+            text("""
+                SELECT rowid, matched FROM (
+                    SELECT rowid, rank, row_number() OVER (ORDER BY rowid DESC) AS n, count(*) OVER () AS matched
+                    FROM (
+                        SELECT rowid, rank FROM report_search WHERE report_search MATCH :match
+                        ORDER BY rowid DESC LIMIT :window + 1
+                    )
+                )
+                WHERE n <= :window
+                ORDER BY rank LIMIT :limit OFFSET :offset
+            """),
+            {"match": match, "window": self.rank_window, "limit": self.page_size + 1,
+             "offset": (page - 1) * self.page_size}
+        ).all()
+        if not rows:
+            return [], False, False
+        truncated = rows[0][1] > self.rank_window
+        has_next = len(rows) > self.page_size
+        ids = [row[0] for row in rows[:self.page_size]]
+        rows = db.execute(
+            text("""
+                SELECT rowid, highlight(report_search, 1, :start, :end),
+                       snippet(report_search, 3, :start, :end, '…', :words)
+                FROM report_search
+                WHERE report_search MATCH :match AND rowid IN :ids
+            """).bindparams(bindparam("ids", expanding=True)),
+            {"match": match, "ids": ids, "start": MATCH_START, "end": MATCH_END, "words": SEARCH_SNIPPET_WORDS}
+        ).all()
+        found = {row[0]: row for row in rows}
+        dates = dict(db.query(Notification.id, Notification.date).filter(Notification.id.in_(ids)))
+        return [
+            {"id": notification_id, "patient_name": highlighted(found[notification_id][1]),
+             "date": dates.get(notification_id), "snippet": highlighted(found[notification_id][2])}
+            for notification_id in ids if notification_id in found
+        ], has_next, truncated
+
+    def backfill(self, conn):
+        # Indexes the notifications not in report_search yet, with the text
+        # already extracted from their reports; returns how many
+        query = text("""
+            SELECT n.id, n.doctor_id, n.patient_name, n.date, e.text
+            FROM notifications n
+            LEFT JOIN report_extractions e ON e.content_hash = n.report_hash
+            WHERE n.id > :after AND n.id NOT IN (SELECT rowid FROM report_search)
+            ORDER BY n.id
+            LIMIT :limit
+        """).columns(date=Notification.date.type)
+        added, after = 0, 0
+        while rows := conn.execute(query, {"after": after, "limit": BACKFILL_BATCH}).all():
+            conn.execute(INSERT, [index_row(*row) for row in rows])
+            added += len(rows)
+            after = rows[-1][0]
+        return added
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import tempfile
+import time
+from io import BytesIO
+
+# Root directory of the content-addressed report files
+REPORT_STORE_DIR = os.getenv("REPORT_STORE_DIR", "report_store")
+CHUNK_SIZE = 64 * 1024
+
+
+class ReportStore:
+    """Report files on local disk, named by the SHA-256 of their content.
+
+    Identical uploads map to the same file, so each distinct PDF is stored once.
+    Files nothing refers to any more are deleted by report_gc.py; saving or
+    claiming a file marks it used, which keeps it through a concurrent sweep.
+    """
+
+    def __init__(self, root=REPORT_STORE_DIR):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    def claim(self, digest):
+        # Marks a stored file as just used, before a row refers to it, so
+        # report_gc.py leaves it be; False if it isn't stored (any more)
+        try:
+            os.utime(self.path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def digests(self):
+        # Every stored file's digest
+        if not os.path.isdir(self.root):
+            return
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                yield prefix + name
+
+    def save(self, fileobj, chunk_size=CHUNK_SIZE):
+        # Spool the upload to a temp file in chunks, hashing as we go, then
+        # move it into place under its digest (or drop it if already stored)
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            digest = sha.hexdigest()
+            final_path = self.path(digest)
+            if self.claim(digest):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest, size
+
+    def save_file(self, path, chunk_size=CHUNK_SIZE):
+        # Move a file already on disk (an assembled upload) into the store.
+        # It must be on the same filesystem, e.g. under the store's root.
+        sha = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+                size += len(chunk)
+        digest = sha.hexdigest()
+        final_path = self.path(digest)
+        if self.claim(digest):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(path, final_path)
+        return digest, size
+
+    def save_bytes(self, data):
+        return self.save(BytesIO(data))
+
+    def delete_unused(self, digest, grace):
+        # Deletes a file not saved or claimed in the last `grace` seconds;
+        # True if it was. The file is moved aside before the last check, so a
+        # save or claim racing the delete either finds it gone and stores its
+        # own copy, or is seen here and the file is put back.
+        path = self.path(digest)
+        tmp_dir = os.path.join(self.root, "tmp")
+        try:
+            if time.time() - os.stat(path).st_mtime < grace:
+                return False
+        except FileNotFoundError:
+            return False
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, aside = tempfile.mkstemp(dir=tmp_dir)
+        os.close(fd)
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            # Deleted by another sweep meanwhile
+            os.remove(aside)
+            return False
+        if time.time() - os.stat(aside).st_mtime < grace:
+            # Same content as any copy saved meanwhile, so replacing it is harmless
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
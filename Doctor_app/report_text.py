@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from PyPDF2 import PdfReader
+
+from feature_extractor import extractor
+
+
+def extract_raw_text(source):
+    # Text of every page of a PDF given as bytes or a file path
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    pdf_reader = PdfReader(source)
+    pages = []
+    for page in pdf_reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            pages.append(page_text)
+    return "\n".join(pages)
+
+
+def normalize_text(text):
+    # One line with runs of whitespace collapsed, in a single pass
+    return " ".join(text.split())
+
+
+def extract_text(source):
+    return normalize_text(extract_raw_text(source))
+
+
+def parse_features(text):
+    # ({column: value string}, {column: confidence}) for the 22 feature columns;
+    # works on raw or normalized text
+    return extractor.parse(text)
+
+
+def extract_report(source):
+    # (normalized text, features, confidence) of a PDF; runs in the PDF worker pool
+    raw_text = extract_raw_text(source)
+    features, confidence = parse_features(raw_text)
+    return normalize_text(raw_text), features, confidence
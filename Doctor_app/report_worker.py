@@ -0,0 +1,180 @@
+# Pre-processes received reports in the background, so that opening one is a
+# lookup: extracts the text and the 22 features, stores a draft prediction
+# and adds the text to the search index. Runs the jobs /receive-report queues
+# (see job_queue.py).
+#
+#     python report_worker.py [workers]
+#
+# Starts `workers` processes (default REPORT_WORKERS), restarting any that
+# die, and stops them on SIGINT or SIGTERM. Jobs a stopped worker was running
+# are claimed again once their lease runs out.
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from db import SessionLocal
+from extraction_cache import ExtractionCache
+from features import columns
+from job_queue import JobQueue, REPORT_JOB_VISIBILITY_TIMEOUT
+from model_registry import ModelRegistry
+from report_gc import REPORT_GC_INTERVAL, sweep
+from models import ReportDraft
+from report_search import ReportSearch
+from report_store import ReportStore
+from report_text import extract_report
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds an idle worker waits before looking for a job again
+REPORT_JOB_POLL_INTERVAL = float(os.getenv("REPORT_JOB_POLL_INTERVAL", "0.5"))
+# Seconds between purges of old finished jobs
+REPORT_JOB_PURGE_INTERVAL = float(os.getenv("REPORT_JOB_PURGE_INTERVAL", "600"))
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def draft_prediction(features, model_registry):
+    # "Positive" or "Negative", or None unless every feature was found
+    try:
+        row = [float(features[column]) for column in columns]
+    except (KeyError, TypeError, ValueError):
+        return None
+    prediction = model_registry.predict(np.asarray([row]))[0]
+    return "Positive" if prediction == 1 else "Negative"
+
+
+def process(db, job, extraction_cache, report_store, model_registry, report_search):
+    entry = extraction_cache.load(db, job.content_hash)
+    if entry is None:
+        entry = extract_report(report_store.path(job.content_hash))
+        extraction_cache.put(db, job.content_hash, *entry)
+    report_search.set_text(db, job.notification_id, entry[0])
+    prediction = draft_prediction(entry[1], model_registry)
+    if prediction is not None:
+        db.merge(ReportDraft(
+            content_hash=job.content_hash,
+            prediction=prediction,
+            model_version=model_registry.version,
+            created_at=datetime.now()
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+
+
+def run_with_deadline(fn, seconds):
+    # fn()'s result, from a daemon thread; JobTimeout if it is still running
+    # after `seconds`. The thread can't be stopped, so after a timeout the
+    # caller must give up its process.
+    outcome = []
+
+    def target():
+        try:
+            outcome.append((fn(), None))
+        except BaseException as e:
+            outcome.append((None, e))
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    if not outcome:
+        raise JobTimeout(f"Job ran past its lease ({seconds:.0f}s)")
+    result, error = outcome[0]
+    if error is not None:
+        raise error
+    return result
+
+
+def run_worker(stopping):
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker {os.getpid()} %(levelname)s %(message)s")
+    # The supervisor stops workers through `stopping`; a worker sent SIGTERM
+    # itself finishes its job first. (Setting the Event from a handler could
+    # deadlock with the wait it interrupted, hence the list.)
+    terminated = []
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: terminated.append(signum))
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue()
+    extraction_cache = ExtractionCache(pool=None)
+    report_store = ReportStore()
+    model_registry = ModelRegistry()
+    report_search = ReportSearch()
+    next_purge = 0.0
+    next_sweep = time.monotonic() + REPORT_GC_INTERVAL
+
+    while not stopping.is_set() and not terminated:
+        job = queue.claim(worker_id)
+        if job is None:
+            if time.monotonic() >= next_purge:
+                queue.purge()
+                next_purge = time.monotonic() + REPORT_JOB_PURGE_INTERVAL
+            if time.monotonic() >= next_sweep:
+                # Report files no row refers to any more
+                with SessionLocal() as db:
+                    deleted = sweep(db, report_store)
+                if deleted:
+                    logging.info(f"Deleted {deleted} unused report file(s)")
+                next_sweep = time.monotonic() + REPORT_GC_INTERVAL
+            stopping.wait(REPORT_JOB_POLL_INTERVAL)
+            continue
+
+        def run_job():
+            with SessionLocal() as db:
+                process(db, job, extraction_cache, report_store, model_registry, report_search)
+
+        started = time.perf_counter()
+        try:
+            # Give up before the lease runs out, so two workers never run the job at once
+            run_with_deadline(run_job, REPORT_JOB_VISIBILITY_TIMEOUT * 0.9)
+        except JobTimeout as e:
+            logging.warning(f"Job {job.id} (attempt {job.attempts}/{job.max_attempts}) timed out; restarting the worker")
+            queue.fail(job, worker_id, repr(e))
+            # The job's thread may still be running; exiting ends it, and the
+            # supervisor starts a fresh worker
+            return
+        except Exception as e:
+            logging.warning(f"Job {job.id} (attempt {job.attempts}/{job.max_attempts}) failed: {e!r}")
+            queue.fail(job, worker_id, repr(e))
+        else:
+            queue.complete(job, worker_id)
+            logging.info(f"Job {job.id} for notification {job.notification_id} done in {time.perf_counter() - started:.2f}s")
+
+
+def main(workers=REPORT_WORKERS):
+    # spawn: workers start clean, without the parent's database connections
+    context = multiprocessing.get_context("spawn")
+    stopping = context.Event()
+    stop_requested = []
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.append(signum))
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.append(signum))
+
+    children = []
+    while not stop_requested:
+        children = [child for child in children if child.is_alive()]
+        for _ in range(workers - len(children)):
+            child = context.Process(target=run_worker, args=(stopping,), daemon=True)
+            child.start()
+            children.append(child)
+        time.sleep(1.0)
+
+    stopping.set()
+    for child in children:
+        child.join(REPORT_JOB_POLL_INTERVAL + 5)
+        if child.is_alive():
+            child.terminate()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REPORT_WORKERS)
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from db import SessionLocal
+from models import UserSession
+
+# "sql" keeps sessions in the app database so every worker process sees them;
+# "memory" is for a single process (development)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sql")
+# Seconds a login stays valid
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(8 * 60 * 60)))
+# Seconds a worker trusts a looked-up session before asking the store again.
+# A session revoked on another worker may stay usable here for this long.
+SESSION_CACHE_SECONDS = float(os.getenv("SESSION_CACHE_SECONDS", "5"))
+# Looked-up sessions kept in memory per worker, least recently used dropped first
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "4096"))
+# Expired rows are deleted after every this many logins
+SESSION_PURGE_EVERY = 100
+
+
+def token_digest(token):
+    # Only a hash of the token is stored, so the table can't be used to log in
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionStore(ABC):
+    """Maps random session tokens to user ids, with expiry.
+
+    Subclasses implement _save, _load and _delete; lookups are cached in
+    process for SESSION_CACHE_SECONDS so most requests skip the backend,
+    in an LRU of at most SESSION_CACHE_SIZE tokens.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, cache_seconds=SESSION_CACHE_SECONDS, cache_size=SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_seconds = cache_seconds
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, user_id):
+        # Returns the new session's token, to be sent as the cookie value
+        token = secrets.token_urlsafe(32)
+        self._save(token_digest(token), user_id, datetime.now() + timedelta(seconds=self.ttl))
+        return token
+
+    def get(self, token):
+        # The user id of a live session, or None
+        if not token:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(token)
+                return cached[0]
+
+        user_id = self._load(token_digest(token), datetime.now())
+        with self._lock:
+            if user_id is None:
+                self._cache.pop(token, None)
+            else:
+                self._cache[token] = (user_id, now + self.cache_seconds)
+                self._cache.move_to_end(token)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return user_id
+
+    def revoke(self, token):
+        if not token:
+            return
+        with self._lock:
+            self._cache.pop(token, None)
+        self._delete(token_digest(token))
+
+    @abstractmethod
+    def _save(self, digest, user_id, expires_at):
+        ...
+
+    @abstractmethod
+    def _load(self, digest, now):
+        # The user id stored under digest, or None if missing or expired at `now`
+        ...
+
+    @abstractmethod
+    def _delete(self, digest):
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions = {}
+
+    def _save(self, digest, user_id, expires_at):
+        self._sessions[digest] = (user_id, expires_at)
+
+    def _load(self, digest, now):
+        session = self._sessions.get(digest)
+        if session is None or session[1] <= now:
+            self._sessions.pop(digest, None)
+            return None
+        return session[0]
+
+    def _delete(self, digest):
+        self._sessions.pop(digest, None)
+
+
+class SqlSessionStore(SessionStore):
+    # Sessions in the user_sessions table, shared by all workers on the database
+    def __init__(self, session_factory=SessionLocal, **kwargs):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+        self._logins = 0
+
+    def _save(self, digest, user_id, expires_at):
+        with self.session_factory() as db:
+            db.add(UserSession(token_hash=digest, user_id=user_id, created_at=datetime.now(), expires_at=expires_at))
+            db.commit()
+        self._logins += 1
+        if self._logins % SESSION_PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def _load(self, digest, now):
+        with self.session_factory() as db:
+            return db.query(UserSession.user_id).filter(
+                UserSession.token_hash == digest, UserSession.expires_at > now
+            ).scalar()
+
+    def _delete(self, digest):
+        with self.session_factory() as db:
+            db.query(UserSession).filter(UserSession.token_hash == digest).delete()
+            db.commit()
+
+    def purge_expired(self):
+        with self.session_factory() as db:
+            db.query(UserSession).filter(UserSession.expires_at <= datetime.now()).delete()
+            db.commit()
+
+
+def make_session_store(backend=SESSION_BACKEND):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sql":
+        return SqlSessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app's modules are imported by name, as when it runs from Doctor_app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Modules open the default database at import; keep it away from the app's
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/doctor_app_test.db")
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A sessionmaker on a fresh database with every table, per test
+    from sqlalchemy.orm import sessionmaker
+
+    import models  # noqa: F401
+    import report_search  # noqa: F401
+    from db import Base, make_engine
+
+    engine = make_engine(f"sqlite:///{tmp_path}/doctor_app.db")
+    Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
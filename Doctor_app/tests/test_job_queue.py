@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from job_queue import JobQueue
+from models import ReportJob
+
+
+@pytest.fixture
+def queue(session_factory):
+    return JobQueue(session_factory, visibility_timeout=60, max_attempts=3, retry_delay=10)
+
+
+def add(queue, notification_id, content_hash="hash"):
+    with queue.session_factory() as db:
+        job = queue.enqueue(db, notification_id, content_hash)
+        db.commit()
+        return job.id
+
+
+def row(queue, job_id):
+    with queue.session_factory() as db:
+        return db.get(ReportJob, job_id)
+
+
+def make_runnable(queue, job_id, seconds_ago=1):
+    # As if the job's lease or retry delay ran out
+    with queue.session_factory() as db:
+        db.execute(update(ReportJob).where(ReportJob.id == job_id)
+                   .values(available_at=datetime.now() - timedelta(seconds=seconds_ago)))
+        db.commit()
+
+
+def test_claim_leases_oldest_job(queue):
+    first, second = add(queue, 1), add(queue, 2)
+    job = queue.claim("a")
+    assert (job.id, job.notification_id, job.attempts, job.max_attempts) == (first, 1, 1, 3)
+    claimed = row(queue, first)
+    assert (claimed.status, claimed.locked_by) == ("running", "a")
+    assert claimed.available_at > datetime.now() + timedelta(seconds=50)
+    assert queue.claim("b").id == second
+    assert queue.claim("c") is None
+
+
+def test_complete(queue):
+    job_id = add(queue, 1)
+    job = queue.claim("a")
+    queue.complete(job, "a")
+    done = row(queue, job_id)
+    assert (done.status, done.locked_by, done.last_error) == ("done", None, None)
+    assert done.finished_at is not None
+    assert queue.claim("a") is None
+
+
+def test_failed_job_retried_with_backoff(queue):
+    job_id = add(queue, 1)
+    queue.fail(queue.claim("a"), "a", "boom")
+    retry = row(queue, job_id)
+    assert (retry.status, retry.last_error, retry.locked_by) == ("queued", "boom", None)
+    assert retry.available_at > datetime.now() + timedelta(seconds=8)
+    assert queue.claim("a") is None
+
+    make_runnable(queue, job_id)
+    queue.fail(queue.claim("a"), "a", "boom")
+    # The second retry waits twice as long
+    assert row(queue, job_id).available_at > datetime.now() + timedelta(seconds=18)
+
+
+def test_failed_on_last_attempt(queue):
+    job_id = add(queue, 1)
+    for attempt in range(1, 4):
+        job = queue.claim("a")
+        assert job.attempts == attempt
+        queue.fail(job, "a", f"boom {attempt}")
+        make_runnable(queue, job_id)
+    failed = row(queue, job_id)
+    assert (failed.status, failed.attempts, failed.last_error) == ("failed", 3, "boom 3")
+    assert queue.claim("a") is None
+
+
+def test_expired_lease_reclaimed(queue):
+    job_id = add(queue, 1)
+    stale = queue.claim("a")
+    assert queue.claim("b") is None
+    make_runnable(queue, job_id)
+    job = queue.claim("b")
+    assert (job.id, job.attempts) == (job_id, 2)
+    assert row(queue, job_id).locked_by == "b"
+
+    # The first worker no longer holds the lease; its outcome is ignored
+    queue.fail(stale, "a", "late")
+    queue.complete(stale, "a")
+    assert (row(queue, job_id).status, row(queue, job_id).last_error) == ("running", None)
+    queue.complete(job, "b")
+    assert row(queue, job_id).status == "done"
+
+
+def test_expired_lease_reclaimed_first(queue):
+    leased, waiting = add(queue, 1), add(queue, 2)
+    assert queue.claim("a").id == leased
+    make_runnable(queue, waiting, seconds_ago=600)
+    make_runnable(queue, leased)
+    # The job whose lease ran out goes before the one queued earlier
+    assert queue.claim("b").id == leased
+    assert queue.claim("c").id == waiting
+
+
+def test_expired_lease_on_last_attempt_fails(session_factory):
+    queue = JobQueue(session_factory, max_attempts=1)
+    job_id = add(queue, 1)
+    queue.claim("a")
+    make_runnable(queue, job_id)
+    assert queue.claim("b") is None
+    failed = row(queue, job_id)
+    assert (failed.status, failed.last_error) == ("failed", "Lease ran out on the last attempt")
+
+
+def test_purge(queue):
+    old, recent, queued = add(queue, 1), add(queue, 2), add(queue, 3)
+    for worker in ("a", "b"):
+        queue.complete(queue.claim(worker), worker)
+    with queue.session_factory() as db:
+        db.execute(update(ReportJob).where(ReportJob.id == old)
+                   .values(finished_at=datetime.now() - timedelta(hours=25)))
+        db.commit()
+    assert queue.purge(retention_hours=24) == 1
+    assert row(queue, old) is None
+    assert row(queue, recent).status == "done"
+    assert row(queue, queued).status == "queued"
+
+
+def test_latest_and_stats(queue):
+    add(queue, 1, "old")
+    newest = add(queue, 1, "new")
+    add(queue, 2)
+    queue.claim("a")
+    with queue.session_factory() as db:
+        assert queue.latest(db, 1).id == newest
+        assert queue.latest(db, 9) is None
+        stats = queue.stats(db)
+    assert stats["jobs"] == {"queued": 2, "running": 1, "done": 0, "failed": 0}
+    assert stats["max_attempts"] == 3
+    assert stats["lag_seconds"] >= 0
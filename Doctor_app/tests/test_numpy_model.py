@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pytest
+
+from numpy_model import NumpyModel, export_model
+
+sklearn = pytest.importorskip("sklearn")
+
+from sklearn.datasets import make_classification  # noqa: E402
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier  # noqa: E402
+from sklearn.linear_model import LogisticRegression, SGDClassifier  # noqa: E402
+from sklearn.pipeline import make_pipeline  # noqa: E402
+from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler, RobustScaler, StandardScaler  # noqa: E402
+from sklearn.svm import SVC, LinearSVC, NuSVC  # noqa: E402
+from sklearn.tree import DecisionTreeClassifier  # noqa: E402
+
+N_FEATURES = 22
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.pkl")
+
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_classification(n_samples=300, n_features=N_FEATURES, n_informative=8, random_state=0)
+    # Feature scales as different as the voice measurements'
+    X = X * np.logspace(-3, 2, N_FEATURES) + np.linspace(0, 150, N_FEATURES)
+    return X, y
+
+
+def samples(X, n=2000, seed=1):
+    # Around and well beyond the training data
+    rng = np.random.default_rng(seed)
+    return X.mean(axis=0) + rng.normal(size=(n, X.shape[1])) * X.std(axis=0) * 2
+
+
+def assert_parity(estimator, X, tmp_path):
+    path = tmp_path / "model.npz"
+    export_model(estimator, path)
+    model = NumpyModel.load(path)
+    inputs = np.vstack([X, samples(X)])
+    np.testing.assert_array_equal(model.predict(inputs), estimator.predict(inputs))
+    return model, inputs
+
+
+@pytest.mark.parametrize("estimator", [
+    make_pipeline(StandardScaler(), SVC(kernel="rbf")),
+    make_pipeline(StandardScaler(), SVC(kernel="linear")),
+    make_pipeline(MinMaxScaler(), SVC(kernel="poly", degree=3, gamma=0.5, coef0=1.0)),
+    make_pipeline(StandardScaler(), SVC(kernel="sigmoid", gamma="auto")),
+    make_pipeline(RobustScaler(), NuSVC()),
+    make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000)),
+    make_pipeline(MaxAbsScaler(), LinearSVC()),
+    make_pipeline(StandardScaler(), SGDClassifier(random_state=0)),
+    DecisionTreeClassifier(random_state=0),
+    RandomForestClassifier(n_estimators=30, random_state=0),
+    ExtraTreesClassifier(n_estimators=30, random_state=0),
+    make_pipeline(StandardScaler(), RandomForestClassifier(n_estimators=10, random_state=0)),
+    GradientBoostingClassifier(n_estimators=50, random_state=0),
+    GradientBoostingClassifier(n_estimators=50, loss="exponential", random_state=0),
+    GradientBoostingClassifier(n_estimators=50, init="zero", random_state=0),
+], ids=lambda estimator: "-".join(type(step).__name__ for _, step in getattr(estimator, "steps", [(None, estimator)])))
+def test_predict_matches_estimator(estimator, data, tmp_path):
+    X, y = data
+    estimator.fit(X, y)
+    assert_parity(estimator, X, tmp_path)
+
+
+def test_string_labels(data, tmp_path):
+    X, y = data
+    estimator = make_pipeline(StandardScaler(), SVC()).fit(X, np.where(y == 1, "Positive", "Negative"))
+    assert_parity(estimator, X, tmp_path)
+
+
+@pytest.mark.parametrize("estimator", [
+    make_pipeline(StandardScaler(), SVC(kernel="rbf")),
+    make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000)),
+    GradientBoostingClassifier(n_estimators=50, random_state=0),
+])
+def test_decision_function_matches_estimator(estimator, data, tmp_path):
+    X, y = data
+    estimator.fit(X, y)
+    model, inputs = assert_parity(estimator, X, tmp_path)
+    np.testing.assert_allclose(model.decision_function(inputs), estimator.decision_function(inputs), rtol=1e-9, atol=1e-9)
+
+
+def test_predict_proba_matches_forest(data, tmp_path):
+    X, y = data
+    estimator = RandomForestClassifier(n_estimators=30, random_state=0).fit(X, y)
+    model, inputs = assert_parity(estimator, X, tmp_path)
+    np.testing.assert_allclose(model.predict_proba(inputs), estimator.predict_proba(inputs), atol=1e-12)
+
+
+def test_unsupported_estimator(data, tmp_path):
+    X, y = data
+    estimator = GradientBoostingClassifier(n_estimators=5, init=DecisionTreeClassifier(max_depth=1), random_state=0).fit(X, y)
+    with pytest.raises(ValueError):
+        export_model(estimator, tmp_path / "model.npz")
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL_PATH), reason="model.pkl is not present")
+def test_shipped_model(tmp_path):
+    import joblib
+
+    estimator = joblib.load(MODEL_PATH)
+    rng = np.random.default_rng(0)
+    steps = getattr(estimator, "steps", None)
+    scaler = steps[0][1] if steps else None
+    inputs = rng.normal(size=(5000, estimator.n_features_in_))
+    if getattr(scaler, "mean_", None) is not None:
+        inputs = scaler.mean_ + inputs * scaler.scale_ * 2
+    path = tmp_path / "model.npz"
+    export_model(estimator, path)
+    np.testing.assert_array_equal(NumpyModel.load(path).predict(inputs), estimator.predict(inputs))
@@ -0,0 +1,151 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import report_store as report_store_module
+from models import CachedReport, FinalReport, Notification
+from prediction_cache import PredictionCache
+from report_catalog import record_report
+from report_gc import collect, sweep
+from report_store import ReportStore
+
+GRACE = 60
+
+
+class Registry:
+    # The parts of ModelRegistry PredictionCache uses
+    version = "v2"
+
+    def on_reload(self, listener):
+        pass
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReportStore(str(tmp_path / "store"))
+
+
+def save_old(store, data):
+    # A file saved longer ago than the grace period
+    digest, _ = store.save_bytes(data)
+    past = time.time() - GRACE * 2
+    os.utime(store.path(digest), (past, past))
+    return digest
+
+
+def test_unreferenced_deleted(store, session_factory):
+    digest = save_old(store, b"report")
+    with session_factory() as db:
+        assert collect(db, store, [digest], GRACE) == 1
+    assert not store.exists(digest)
+    assert list(store.digests()) == []
+
+
+def test_recent_kept(store, session_factory):
+    digest, _ = store.save_bytes(b"report")
+    with session_factory() as db:
+        assert collect(db, store, [digest], GRACE) == 0
+    assert store.exists(digest)
+
+
+def test_save_of_stored_file_claims_it(store, session_factory):
+    digest = save_old(store, b"report")
+    store.save_bytes(b"report")
+    with session_factory() as db:
+        assert collect(db, store, [digest], GRACE) == 0
+    assert store.exists(digest)
+
+
+@pytest.mark.parametrize("model", ["notification", "final", "cached"])
+def test_referenced_kept(store, session_factory, model):
+    digest = save_old(store, b"report")
+    row = {
+        "notification": Notification(doctor_id=1, patient_name="Akhil", report_hash=digest),
+        "final": FinalReport(doctor_id=1, patient_name="Akhil", report_hash=digest, created_at=datetime.now()),
+        "cached": CachedReport(model_version="v1", render_key="k", report_hash=digest, created_at=datetime.now()),
+    }[model]
+    with session_factory() as db:
+        db.add(row)
+        db.commit()
+        assert collect(db, store, [digest, None], GRACE) == 0
+        assert sweep(db, store, GRACE) == 0
+    assert store.exists(digest)
+
+
+def test_sweep(store, session_factory):
+    kept, dropped = save_old(store, b"kept"), save_old(store, b"dropped")
+    with session_factory() as db:
+        db.add(Notification(doctor_id=1, patient_name="Akhil", report_hash=kept))
+        db.commit()
+        assert sweep(db, store, GRACE) == 1
+    assert list(store.digests()) == [kept]
+
+
+def test_claim_racing_delete(store, session_factory, monkeypatch):
+    # A save claims the file after the sweep's first check but before it is
+    # moved aside; the sweep must put it back
+    digest = save_old(store, b"report")
+    mkstemp = report_store_module.tempfile.mkstemp
+
+    def claim_then_mkstemp(**kwargs):
+        assert store.claim(digest)
+        return mkstemp(**kwargs)
+
+    monkeypatch.setattr(report_store_module.tempfile, "mkstemp", claim_then_mkstemp)
+    assert not store.delete_unused(digest, GRACE)
+    assert store.exists(digest)
+    assert os.listdir(os.path.join(store.root, "tmp")) == []
+
+
+def test_save_after_file_moved_aside(store, monkeypatch):
+    # A save that finds the file gone stores its own copy
+    digest = save_old(store, b"report")
+    replace = os.replace
+
+    def replace_then_save(src, dst):
+        replace(src, dst)
+        if src == store.path(digest):
+            store.save_bytes(b"report")
+
+    monkeypatch.setattr(os, "replace", replace_then_save)
+    assert store.delete_unused(digest, GRACE)
+    monkeypatch.undo()
+    assert store.exists(digest)
+
+
+def test_replaced_final_report_collected(store, session_factory):
+    first, second = save_old(store, b"first"), save_old(store, b"second")
+    with session_factory() as db:
+        assert record_report(db, 1, 5, "Akhil", "Positive", first, 5) is None
+        replaced = record_report(db, 1, 5, "Akhil", "Negative", second, 6)
+        assert replaced == first
+        collect(db, store, [replaced], GRACE)
+    assert not store.exists(first)
+    assert store.exists(second)
+
+
+def test_prediction_cache_drops_unused_renders(store, session_factory, monkeypatch):
+    monkeypatch.setattr("report_gc.REPORT_GC_GRACE_SECONDS", GRACE)
+    old, shared, current = (save_old(store, data) for data in (b"old", b"shared", b"current"))
+    with session_factory() as db:
+        now = datetime.now()
+        db.add_all([
+            CachedReport(model_version="v1", render_key="a", report_hash=old, created_at=now - timedelta(days=1)),
+            CachedReport(model_version="v1", render_key="b", report_hash=shared, created_at=now - timedelta(days=1)),
+            CachedReport(model_version="v2", render_key="c", report_hash=current, created_at=now),
+            FinalReport(doctor_id=1, patient_name="Akhil", report_hash=shared, created_at=now),
+        ])
+        db.commit()
+
+    cache = PredictionCache(Registry(), store, session_factory=session_factory)
+    cache.invalidate("v2")
+    assert not store.exists(old)
+    assert store.exists(shared) and store.exists(current)
+
+    cache.max_rows = 0
+    with session_factory() as db:
+        cache.trim(db)
+    assert not store.exists(current)
+    assert store.exists(shared)
@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import Notification, ReportExtraction
+from report_search import ReportSearch, highlighted, match_query
+
+START = datetime(2024, 5, 17, 10, 0)
+
+
+@pytest.fixture
+def db(session_factory):
+    with session_factory() as db:
+        yield db
+
+
+def receive(db, index, doctor_id=1, patient_name="Patient", report_text=None, days=0):
+    # A notification as /receive-report stores it, with its text once extracted
+    notification = Notification(doctor_id=doctor_id, patient_name=patient_name, date=START + timedelta(days=days))
+    db.add(notification)
+    db.flush()
+    index.add(db, notification)
+    db.commit()
+    if report_text is not None:
+        index.set_text(db, notification.id, report_text)
+    return notification.id
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_match_query():
+    assert match_query("tremor rigid*") == '"tremor" AND "rigid"*'
+    assert match_query('tremor" OR doctor:d2 NEAR(x') == '"tremor" AND "OR" AND "doctor" AND "d2" AND "NEAR" AND "x"'
+    assert match_query(" -*: ") is None
+
+
+def test_highlighted_escapes():
+    assert highlighted("<b>\x02Ann\x03</b>") == "&lt;b&gt;<mark>Ann</mark>&lt;/b&gt;"
+    assert highlighted(None) == ""
+
+
+def test_search_by_name_date_and_text(db):
+    index = ReportSearch()
+    ann = receive(db, index, patient_name="Ann Lee", report_text="Mild tremor in the left hand")
+    bob = receive(db, index, patient_name="Bob Ray", report_text="No rigidity observed", days=40)
+    for query, expected in [("ann", [ann]), ("tremor", [ann]), ("rigid*", [bob]), ("2024-06-26", [bob]),
+                            ("May", [ann]), ("ann rigidity", []), ('"', [])]:
+        assert ids(index.search(db, 1, query)[0]) == expected, query
+
+
+def test_results_highlighted(db):
+    index = ReportSearch()
+    receive(db, index, patient_name="Ann <Lee>", report_text="Mild tremor in the left hand")
+    results, has_next, truncated = index.search(db, 1, "ann tremor")
+    assert (has_next, truncated) == (False, False)
+    assert results[0]["patient_name"] == "<mark>Ann</mark> &lt;Lee&gt;"
+    assert "<mark>tremor</mark>" in results[0]["snippet"]
+    assert results[0]["date"] == START
+
+
+def test_search_scoped_to_doctor(db):
+    index = ReportSearch()
+    mine = receive(db, index, doctor_id=1, patient_name="Ann")
+    receive(db, index, doctor_id=2, patient_name="Ann")
+    receive(db, index, doctor_id=11, patient_name="Ann")
+    assert ids(index.search(db, 1, "ann")[0]) == [mine]
+    # The doctor column is a filter only, not searchable text
+    assert index.search(db, 1, "d1")[0] == []
+
+
+def test_name_matches_rank_first(db):
+    index = ReportSearch()
+    in_name = receive(db, index, patient_name="Tremor Ann", report_text="Routine visit")
+    in_text = receive(db, index, patient_name="Bob", report_text="Tremor noted", days=1)
+    assert ids(index.search(db, 1, "tremor")[0]) == [in_name, in_text]
+
+
+def test_text_indexed_once(db):
+    index = ReportSearch()
+    notification_id = receive(db, index, report_text="tremor")
+    index.set_text(db, notification_id, "rigidity")
+    assert ids(index.search(db, 1, "tremor")[0]) == [notification_id]
+    assert index.search(db, 1, "rigidity")[0] == []
+
+
+def test_remove(db):
+    index = ReportSearch()
+    notification_id = receive(db, index, patient_name="Ann")
+    index.remove(db, notification_id)
+    assert index.search(db, 1, "ann")[0] == []
+
+
+def test_paging(db):
+    index = ReportSearch(page_size=2, max_pages=3)
+    matches = {receive(db, index, patient_name=f"Ann {n}") for n in range(5)}
+    pages = [index.search(db, 1, "ann", page) for page in (1, 2, 3)]
+    assert [(len(results), has_next) for results, has_next, _ in pages] == [(2, True), (2, True), (1, False)]
+    assert {notification_id for results, _, _ in pages for notification_id in ids(results)} == matches
+    for page in (0, 4):
+        assert index.search(db, 1, "ann", page) == ([], False, False)
+
+
+def test_rank_window_keeps_newest(db):
+    index = ReportSearch(page_size=10, rank_window=3)
+    found = [receive(db, index, patient_name="Ann") for _ in range(5)]
+    results, has_next, truncated = index.search(db, 1, "ann")
+    assert sorted(ids(results)) == found[2:]
+    assert (has_next, truncated) == (False, True)
+
+    exact = ReportSearch(page_size=10, rank_window=5)
+    assert exact.search(db, 1, "ann")[2] is False
+
+
+def test_rank_window_paging(db):
+    index = ReportSearch(page_size=2, rank_window=3)
+    for _ in range(5):
+        receive(db, index, patient_name="Ann")
+    assert [len(index.search(db, 1, "ann", page)[0]) for page in (1, 2, 3)] == [2, 1, 0]
+    assert index.search(db, 1, "ann", 2)[1:] == (False, True)
+
+
+def test_disabled(db):
+    index = ReportSearch(enabled=False)
+    notification_id = receive(db, index, patient_name="Ann", report_text="tremor")
+    assert db.execute(text("SELECT count(*) FROM report_search")).scalar() == 0
+    index.remove(db, notification_id)
+
+
+def test_backfill(db):
+    index = ReportSearch()
+    indexed = receive(db, index, patient_name="Ann")
+    db.add_all([
+        Notification(id=10, doctor_id=1, patient_name="Bob", date=START, report_hash="a" * 64),
+        Notification(id=11, doctor_id=1, patient_name="Cy", date=START),
+        ReportExtraction(content_hash="a" * 64, text="tremor", features="{}", created_at=START),
+    ])
+    db.commit()
+    assert index.backfill(db.connection()) == 2
+    db.commit()
+    assert index.backfill(db.connection()) == 0
+    assert ids(index.search(db, 1, "tremor")[0]) == [10]
+    assert ids(index.search(db, 1, "cy")[0]) == [11]
+    assert sorted(ids(index.search(db, 1, "may")[0])) == [indexed, 10, 11]
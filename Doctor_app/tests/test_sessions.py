@@ -0,0 +1,107 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import UserSession
+from sessions import MemorySessionStore, SqlSessionStore, make_session_store, token_digest
+
+
+@pytest.fixture(params=["memory", "sql"])
+def make_store(request, session_factory):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SqlSessionStore(session_factory=session_factory, **kwargs)
+    return make
+
+
+def test_create_and_get(make_store):
+    store = make_store()
+    token = store.create(7)
+    assert store.get(token) == 7
+    assert store.get(token) == 7
+
+
+@pytest.mark.parametrize("token", [None, "", "not-a-session"])
+def test_unknown_token(make_store, token):
+    assert make_store().get(token) is None
+
+
+def test_tokens_are_distinct(make_store):
+    store = make_store()
+    first, second = store.create(1), store.create(1)
+    assert first != second
+    assert store.get(first) == store.get(second) == 1
+
+
+def test_revoke(make_store):
+    store = make_store()
+    token, other = store.create(7), store.create(7)
+    store.get(token)
+    store.revoke(token)
+    assert store.get(token) is None
+    assert store.get(other) == 7
+    store.revoke(token)
+    store.revoke(None)
+
+
+def test_expired_session(make_store):
+    store = make_store(ttl=0)
+    assert store.get(store.create(7)) is None
+
+
+def test_cache_bounded(make_store):
+    store = make_store(cache_size=3)
+    tokens = [store.create(user_id) for user_id in range(10)]
+    assert [store.get(token) for token in tokens] == list(range(10))
+    assert len(store._cache) == 3
+    # Dropped from the cache, not from the store
+    assert store.get(tokens[0]) == 0
+
+
+def test_cache_keeps_recently_used(make_store):
+    store = make_store(cache_size=2)
+    first, second, third = (store.create(user_id) for user_id in range(3))
+    store.get(first)
+    store.get(second)
+    store.get(first)
+    store.get(third)
+    assert list(store._cache) == [first, third]
+
+
+def test_revoked_on_other_worker(session_factory):
+    # Another process's store sees a revocation once its cached lookup expires
+    worker, other = (SqlSessionStore(session_factory=session_factory, cache_seconds=0.2) for _ in range(2))
+    token = worker.create(7)
+    assert other.get(token) == 7
+    worker.revoke(token)
+    assert worker.get(token) is None
+    assert other.get(token) == 7
+    time.sleep(0.25)
+    assert other.get(token) is None
+
+
+def test_only_token_hash_stored(session_factory):
+    store = SqlSessionStore(session_factory=session_factory)
+    token = store.create(7)
+    with session_factory() as db:
+        assert db.query(UserSession.token_hash).scalar() == token_digest(token) != token
+
+
+def test_purge_expired(session_factory):
+    store = SqlSessionStore(session_factory=session_factory)
+    live = store.create(1)
+    with session_factory() as db:
+        db.add(UserSession(token_hash="old", user_id=2, created_at=datetime.now(),
+                           expires_at=datetime.now() - timedelta(seconds=1)))
+        db.commit()
+    store.purge_expired()
+    with session_factory() as db:
+        assert db.query(UserSession.token_hash).all() == [(token_digest(live),)]
+    assert store.get(live) == 1
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_session_store("redis")
@@ -1,40 +1,80 @@
 from fastapi import FastAPI, Depends, Request, Form, File, UploadFile
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from db import get_db,SessionLocal, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db,SessionLocal, engine, get_async_db, AsyncSessionLocal
 from models import Patient
-import requests
-from passlib.context import CryptContext
-from fastapi.responses import RedirectResponse, HTMLResponse
+import httpx
+import logging
+from parkinson_common.passwords import PasswordHasher, HasherBusy
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse, JSONResponse, Response
 from starlette.status import HTTP_303_SEE_OTHER
-from fastapi.staticfiles import StaticFiles
+from parkinson_common.file_responses import ConditionalStaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from datetime import datetime
 from models import FinalReport
 from models import Notification
+from parkinson_common.pagination import keyset_page
+from auth import Authenticator, ProfileCache, PatientProfile
+from parkinson_common.service_client import ServiceClient, CircuitOpen
+from parkinson_common.service_auth import service_headers
+from doctor_directory import DoctorDirectory
+from parkinson_common.broker import LocalBroker, last_event_id
+from parkinson_common.uploads import UploadStore, UploadError, tus_headers, header_int, create_upload, send_file
+from parkinson_common.metrics import MetricsMiddleware, registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 app = FastAPI()
 import os
 # Mount the static directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", ConditionalStaticFiles(directory="static"), name="static")
 
 # Add session middleware
 app.add_middleware(SessionMiddleware, secret_key="your_secret_key")
+# Per-route latency, status and database use, served at /metrics
+app.add_middleware(MetricsMiddleware)
 
 templates = Jinja2Templates(directory="templates")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing on its own threads, off the shared threadpool
+password_hasher = PasswordHasher()
 
-# Hash a password
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+@app.exception_handler(HasherBusy)
+async def password_hasher_busy(request: Request, exc: HasherBusy):
+    return JSONResponse(status_code=503, content={"detail": "Too many logins at once, please retry shortly."}, headers={"Retry-After": "2"})
 
-# Verify a password
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Resumable report uploads from the browser, assembled on disk
+uploads = UploadStore()
+
+@app.exception_handler(UploadError)
+async def upload_error(request: Request, exc: UploadError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers={**tus_headers(), **exc.headers})
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+# The logged-in patient of each request, with profiles cached per worker
+auth = Authenticator(ProfileCache().listen())
+
+# Pooled async client for calls to Doctor_app
+DOCTOR_APP_URL = os.getenv("DOCTOR_APP_URL", "http://localhost:5001")
+doctor_app = ServiceClient(DOCTOR_APP_URL, headers=service_headers())
+
+# Doctors shown on the dashboard, cached and revalidated in the background
+doctor_directory = DoctorDirectory(doctor_app)
+
+# Live notification streams of the patients connected to this worker
+broker = LocalBroker()
+# Missed notifications sent to a reconnecting stream, newest kept
+STREAM_REPLAY_LIMIT = 100
+
+@app.on_event("shutdown")
+async def close_service_clients():
+    await doctor_app.aclose()
 
 # Function to get user logged in status
 def get_user_logged_in_status(request: Request) -> bool:
-    return request.session.get('user_id') is not None
+    return auth.resolve(request) is not None
 
 # Root Page (Homepage)
 @app.get("/", response_class=HTMLResponse)
@@ -49,18 +89,17 @@ def signup_page(request: Request):
     return templates.TemplateResponse("signup.html", {"request": request, "user_logged_in": user_logged_in})
 
 @app.post("/signup")
-def signup(
+async def signup(
     request: Request, 
     username: str = Form(...), 
     password: str = Form(...), 
     email: str = Form(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    hashed_password = hash_password(password)
+    hashed_password = await password_hasher.hash(password)
     patient = Patient(username=username, password=hashed_password, email=email)
     db.add(patient)
-    db.commit()
-    db.refresh(patient)
+    await db.commit()
     return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
 # Login Page
@@ -71,17 +110,25 @@ def login_page(request: Request):
     user_logged_in = get_user_logged_in_status(request)
     return templates.TemplateResponse("login.html", {"request": request, "user_logged_in": user_logged_in, "flash_message": flash_message})
 
+def save_password_hash(db, patient_id, password_hash):
+    db.query(Patient).filter(Patient.id == patient_id).update({"password": password_hash})
+    db.commit()
+
 @app.post("/login")
-def login(
+async def login(
     request: Request, 
     username: str = Form(...), 
     password: str = Form(...), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    patient = db.query(Patient).filter(Patient.username == username).first()
-    if not patient or not verify_password(password, patient.password):
+    patient = (await db.execute(select(Patient.id, Patient.password).where(Patient.username == username))).first()
+    matches, new_hash = await password_hasher.verify(password, patient.password) if patient else (False, None)
+    if not matches:
         request.session['flash_message'] = "Invalid username or password"
         return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
+    if new_hash:
+        # Stored with an old cost; keep the hash made with the current one
+        await db.run_sync(save_password_hash, patient.id, new_hash)
     
     # Create a session
     request.session['user_id'] = patient.id
@@ -89,28 +136,63 @@ def login(
 
 # Dashboard Page
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request, db: Session = Depends(get_db)):
-    if not get_user_logged_in_status(request):
+async def dashboard(
+    request: Request,
+    before: int = None,
+    patient: PatientProfile = Depends(auth.optional),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if patient is None:
         return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
-    try:
-        # Fetch doctors from the doctor app running on port 5001
-        response = requests.get("http://localhost:5001/doctors")
-        doctors = response.json()
-    except requests.RequestException:
-        doctors = []
+    # Doctors from the doctor app running on port 5001, via the local cache
+    doctors = await doctor_directory.get()
 
-    patient_id = request.session.get('user_id')
-    notifications = db.query(Notification).filter(Notification.patient_id == patient_id).all()
+    notifications, next_before = await db.run_sync(patient_notifications, patient.id, before)
 
-    user_logged_in = get_user_logged_in_status(request)
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "doctors": doctors,
-        "user_logged_in": user_logged_in,
-        "notifications": notifications
+        "user_logged_in": True,
+        "notifications": notifications,
+        "next_before": next_before,
+        # The first page listens for new notifications past the newest one shown
+        "stream_after": max((n.id for n in notifications), default=0) if before is None else None
     })
 
+def patient_notifications(db, patient_id, before):
+    # Newest first, one page at a time, served by ix_notifications_patient_date
+    return keyset_page(
+        db.query(Notification).filter(Notification.patient_id == patient_id),
+        Notification.date, Notification.id, before
+    )
+
+def notification_event(notification_id, date):
+    # What a dashboard needs to show a new notification
+    return notification_id, "notification", {"id": notification_id, "date": date}
+
+def missed_notifications(db, patient_id, after):
+    rows = db.query(Notification.id, Notification.date).filter(
+        Notification.patient_id == patient_id, Notification.id > after
+    ).order_by(Notification.id.desc()).limit(STREAM_REPLAY_LIMIT).all()
+    return [notification_event(*row) for row in reversed(rows)]
+
+# Live notifications for the logged-in patient, as Server-Sent Events. Resumes
+# after the Last-Event-ID header on reconnect, or after `last_id` on first connect.
+@app.get("/notifications/stream")
+async def notification_stream(request: Request, last_id: int = 0, patient: PatientProfile = Depends(auth.required)):
+    after = last_event_id(request, last_id)
+
+    async def replay():
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(missed_notifications, patient.id, after)
+
+    return StreamingResponse(
+        broker.stream(f"patient:{patient.id}", replay),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 # Send Report to Doctor Page
 @app.get("/send-report", response_class=HTMLResponse)
@@ -119,47 +201,111 @@ def send_report_page(request: Request):
     user_logged_in = get_user_logged_in_status(request)
     return templates.TemplateResponse("send_report.html", {"request": request, "doctor_id": doctor_id, "user_logged_in": user_logged_in})
 
+# Resumable uploads (tus 1.0 subset, see uploads.py) used by the send report
+# page; the finished upload is then sent with /send-report as upload_id
+@app.options("/uploads")
+def upload_capabilities():
+    return Response(status_code=204, headers=uploads.capabilities())
+
+@app.post("/uploads")
+def create_report_upload(request: Request, patient: PatientProfile = Depends(auth.required)):
+    upload_id = uploads.create(header_int(request, "upload-length"), owner=patient.id)
+    return Response(status_code=201, headers=tus_headers(Location=f"/uploads/{upload_id}"))
+
+@app.head("/uploads/{upload_id}")
+def upload_offset(upload_id: str, patient: PatientProfile = Depends(auth.required)):
+    info = uploads.info(upload_id, owner=patient.id)
+    return Response(headers=tus_headers(Upload_Offset=info["offset"], Upload_Length=info["length"], Cache_Control="no-store"))
+
+@app.patch("/uploads/{upload_id}")
+async def upload_chunk(request: Request, upload_id: str, patient: PatientProfile = Depends(auth.required)):
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise UploadError(415, "Chunks must be sent as application/offset+octet-stream")
+    offset = await uploads.append(
+        upload_id, header_int(request, "upload-offset"), request.stream(), request.headers.get("upload-checksum"),
+        owner=patient.id
+    )
+    return Response(status_code=204, headers=tus_headers(Upload_Offset=offset))
+
+@app.delete("/uploads/{upload_id}")
+def delete_upload(upload_id: str, patient: PatientProfile = Depends(auth.required)):
+    uploads.info(upload_id, owner=patient.id)
+    uploads.delete(upload_id)
+    return Response(status_code=204, headers=tus_headers())
+
+# Resumable upload counters
+@app.get("/uploads/stats")
+def upload_stats():
+    return uploads.stats()
+
+async def forward_upload(upload_id, path):
+    # Send a finished upload on to Doctor_app, resuming a previous attempt's
+    # upload there when it still exists; returns its upload id at Doctor_app
+    info = uploads.info(upload_id)
+    remote_url = info.get("remote_url")
+    if remote_url is not None:
+        try:
+            await send_file(doctor_app, path, remote_url)
+            return remote_url.rsplit("/", 1)[-1]
+        except UploadError as e:
+            if e.status_code != 404:
+                raise
+    # Counted against the patient's quota at Doctor_app too
+    remote_url = await create_upload(doctor_app, os.path.getsize(path), owner=info["owner"])
+    uploads.set_info(upload_id, remote_url=remote_url)
+    await send_file(doctor_app, path, remote_url)
+    return remote_url.rsplit("/", 1)[-1]
+
 @app.post("/send-report")
 async def send_report(
     request: Request,
     doctor_id: int = Form(...),
-    report: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    report: UploadFile = File(None),
+    upload_id: str = Form(None),
+    patient: PatientProfile = Depends(auth.required)
 ):
-    # Read the file contents
-    file_content = await report.read()
-    patient_id = request.session.get('user_id')
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
     patient_name = patient.username  # Updated to `username` since `name` might not be a field in `Patient`
+    data = {
+        "doctor_id": doctor_id,
+        "patient_name": patient_name,
+        "date": datetime.now().isoformat()
+    }
+
+    if upload_id is not None:
+        path = uploads.completed_path(upload_id, owner=patient.id)
 
-    # Send the report to the doctor
     try:
-        response = requests.post(
-            "http://localhost:5001/receive-report",
-            data={
-                "doctor_id": doctor_id,
-                "patient_name": patient_name,
-                "date": datetime.now().isoformat()
-            },
-            files={"report": ("report", file_content, "application/octet-stream")}
-        )
+        if upload_id is not None:
+            # Sent on in checksummed chunks; after a failure, sending again
+            # resumes where Doctor_app's copy stopped
+            data["upload_id"] = await forward_upload(upload_id, path)
+            response = await doctor_app.post("/receive-report", data=data)
+        elif report is not None:
+            # Without JavaScript: the form's file, streamed as the body
+            response = await doctor_app.post(
+                "/receive-report",
+                data=data,
+                files={"report": ("report", report.file, "application/octet-stream")}
+            )
+        else:
+            return {"error": "No report was uploaded"}
         response.raise_for_status()
-    except requests.RequestException:
+    except (httpx.HTTPError, CircuitOpen, UploadError) as e:
+        logging.error(f"Sending report to doctor {doctor_id} failed: {e!r}")
         return {"error": "Failed to send report"}
 
+    if upload_id is not None:
+        uploads.delete(upload_id)
     return RedirectResponse(url="/dashboard", status_code=HTTP_303_SEE_OTHER)
 
 
 # Profile Page
 @app.get("/profile", response_class=HTMLResponse)
-def profile(request: Request, db: Session = Depends(get_db)):
-    if not get_user_logged_in_status(request):
+def profile(request: Request, patient: PatientProfile = Depends(auth.optional)):
+    if patient is None:
         return RedirectResponse(url="/login", status_code=HTTP_303_SEE_OTHER)
 
-    patient_id = request.session.get('user_id')
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
-    user_logged_in = get_user_logged_in_status(request)
-    return templates.TemplateResponse("profile.html", {"request": request, "patient": patient, "user_logged_in": user_logged_in})
+    return templates.TemplateResponse("profile.html", {"request": request, "patient": patient, "user_logged_in": True})
 
 # Logout
 @app.get("/logout")
@@ -175,17 +321,21 @@ class ReportData(BaseModel):
     report: str
     
 @app.get("/patient/notifications")
-async def get_notifications(patient_username: str):
-    db: Session = SessionLocal()
-    
+async def get_notifications(patient_username: str, db: AsyncSession = Depends(get_async_db)):
     # Find the patient by username
-    patient = db.query(Patient).filter(Patient.username == patient_username).first()
-    if not patient:
+    patient_id = await db.scalar(select(Patient.id).where(Patient.username == patient_username))
+    if patient_id is None:
         return {"error": "Patient not found"}
-    
-    notifications = db.query(Notification).filter(Notification.patient_id == patient.id).all()
-    
-    return notifications
+
+    # The same fields as before; the report itself is not sent
+    notifications = await db.execute(
+        select(
+            Notification.id, Notification.doctor_id, Notification.patient_id,
+            Notification.patient_name, Notification.date
+        ).where(Notification.patient_id == patient_id)
+    )
+
+    return [dict(row._mapping) for row in notifications]
 
 UPLOAD_DIR = "static/final_reports/"
 
@@ -193,7 +343,8 @@ UPLOAD_DIR = "static/final_reports/"
 @app.post("/patient/receive_report")
 async def receive_report(
     patient_username: str = Form(...),
-    report: UploadFile = File(...)
+    report: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db)
 ):
     report_filename = report.filename  # Get the filename from the UploadFile object
 
@@ -207,11 +358,8 @@ async def receive_report(
     with open(report_path, "wb") as buffer:
         buffer.write(await report.read())  # Directly write the file content
 
-    # Add the final report entry to the database
-    db: Session = SessionLocal()
-
     # Find the patient by username
-    patient = db.query(Patient).filter(Patient.username == patient_username).first()
+    patient = await db.scalar(select(Patient).where(Patient.username == patient_username))
     if not patient:
         return {"error": "Patient not found"}
 
@@ -234,7 +382,35 @@ async def receive_report(
     db.add(notification)
 
     # Commit changes to the database
-    db.commit()
+    await db.commit()
+
+    # Push it to the patient's open dashboards
+    broker.publish(f"patient:{patient.id}", *notification_event(notification.id, notification.date))
 
     return {"message": "Report received and saved successfully"}
 
+# Doctor_app client connection and circuit breaker stats
+@app.get("/service-client/stats")
+def service_client_stats():
+    return doctor_app.stats()
+
+# Cached doctor directory freshness and revalidation counts
+@app.get("/doctor-directory/stats")
+def doctor_directory_stats():
+    return doctor_directory.stats()
+
+# Open notification streams and events pushed by this worker
+@app.get("/broker/stats")
+def broker_stats():
+    return broker.stats()
+
+# Password hashing queue and rehash counts
+@app.get("/password-hasher/stats")
+def password_hasher_stats():
+    return password_hasher.stats()
+
+# Prometheus metrics of this worker: request latency, database use and calls
+# to Doctor_app
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
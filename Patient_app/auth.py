@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+
+from db import SessionLocal
+from models import Patient
+
+# Seconds a worker reuses a patient's profile before reading it again
+PROFILE_CACHE_SECONDS = float(os.getenv("PROFILE_CACHE_SECONDS", "30"))
+
+# What pages need of the logged-in patient; leaves out the password hash
+PatientProfile = namedtuple("PatientProfile", ["id", "username", "email"])
+
+_UNRESOLVED = object()
+
+
+def load_profile(db, patient_id):
+    row = db.query(Patient.id, Patient.username, Patient.email).filter(Patient.id == patient_id).first()
+    return PatientProfile(*row) if row is not None else None
+
+
+class ProfileCache:
+    """Patient profiles by id, each kept for `ttl` seconds.
+
+    Updates to a Patient through the ORM drop its entry in this process at
+    once; other workers see the change within `ttl`.
+    """
+
+    def __init__(self, ttl=PROFILE_CACHE_SECONDS, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, patient_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._profiles.get(patient_id)
+            if cached is not None and cached[1] > now:
+                self.hits += 1
+                return cached[0]
+        self.misses += 1
+        with self.session_factory() as db:
+            profile = load_profile(db, patient_id)
+        if profile is not None:
+            with self._lock:
+                self._profiles[patient_id] = (profile, now + self.ttl)
+        return profile
+
+    def invalidate(self, patient_id):
+        with self._lock:
+            self._profiles.pop(patient_id, None)
+
+    def listen(self):
+        # Drop a patient's profile whenever the row is updated or deleted
+        def invalidate(mapper, connection, target):
+            self.invalidate(target.id)
+        event.listen(Patient, "after_update", invalidate)
+        event.listen(Patient, "after_delete", invalidate)
+        return self
+
+
+class Authenticator:
+    # Resolves the logged-in patient once per request, into request.state.patient
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    def resolve(self, request):
+        if getattr(request.state, "patient", _UNRESOLVED) is _UNRESOLVED:
+            patient_id = request.session.get('user_id')
+            request.state.patient = self.profiles.get(patient_id) if patient_id is not None else None
+        return request.state.patient
+
+    def optional(self, request: Request):
+        # Dependency: the PatientProfile, or None when not logged in
+        return self.resolve(request)
+
+    def required(self, request: Request):
+        # Dependency: the PatientProfile; 403 when not logged in
+        patient = self.resolve(request)
+        if patient is None:
+            raise HTTPException(status_code=403, detail="User not logged in")
+        return patient
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import re
+import time
+
+import httpx
+
+from parkinson_common.service_client import CircuitOpen
+
+# Seconds the directory is served without checking Doctor_app for changes
+DOCTOR_DIRECTORY_TTL = float(os.getenv("DOCTOR_DIRECTORY_TTL", "60"))
+DOCTOR_DIRECTORY_PAGE_SIZE = 100
+NEXT_LINK = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+
+
+class DoctorDirectory:
+    """Local copy of Doctor_app's /doctors list, served stale-while-revalidate.
+
+    Page views never wait on Doctor_app once the directory has been loaded:
+    after `ttl` seconds the cached list is still returned and a background
+    task revalidates it, sending each page's ETag so unchanged pages come
+    back as 304 without a body. If Doctor_app is down the last known list
+    keeps being served.
+    """
+
+    def __init__(self, client, ttl=DOCTOR_DIRECTORY_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._doctors = None
+        self._fetched_at = 0.0
+        # Page URL -> (ETag, doctors on the page, next page URL)
+        self._pages = {}
+        self._refresh_task = None
+
+        self.refreshes = 0
+        self.pages_fetched = 0
+        self.pages_not_modified = 0
+        self.errors = 0
+
+    async def get(self):
+        # The doctor list; [] only if it has never been loaded successfully
+        if self._doctors is None:
+            await self.refresh()
+            return self._doctors or []
+        if time.monotonic() - self._fetched_at > self.ttl and not self._refreshing():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._doctors
+
+    def _refreshing(self):
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    async def refresh(self):
+        try:
+            doctors, pages = [], {}
+            url = f"/doctors?limit={DOCTOR_DIRECTORY_PAGE_SIZE}"
+            while url:
+                page = await self._fetch_page(url)
+                pages[url] = page
+                doctors.extend(page[1])
+                url = page[2]
+        except (httpx.HTTPError, CircuitOpen, ValueError) as e:
+            self.errors += 1
+            logging.warning(f"Doctor directory refresh failed, serving the cached list: {e!r}")
+            return
+        self._doctors, self._pages = doctors, pages
+        self._fetched_at = time.monotonic()
+        self.refreshes += 1
+
+    async def _fetch_page(self, url):
+        cached = self._pages.get(url)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = await self.client.get(url, headers=headers)
+        if response.status_code == 304 and cached:
+            self.pages_not_modified += 1
+            return cached
+        response.raise_for_status()
+        self.pages_fetched += 1
+        next_link = NEXT_LINK.search(response.headers.get("link", ""))
+        return response.headers.get("etag"), response.json(), next_link.group(1) if next_link else None
+
+    def stats(self):
+        return {
+            "doctors": len(self._doctors or []),
+            "age_seconds": time.monotonic() - self._fetched_at if self._doctors is not None else None,
+            "ttl_seconds": self.ttl,
+            "refreshing": self._refreshing(),
+            "refreshes": self.refreshes,
+            "pages_fetched": self.pages_fetched,
+            "pages_not_modified": self.pages_not_modified,
+            "errors": self.errors,
+        }
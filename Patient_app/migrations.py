@@ -0,0 +1,53 @@
+# Schema migrations of patients_app's database; run them with init_db.py.
+# Versions 1-3 bring databases from before versioned migrations up to date.
+from sqlalchemy import inspect
+
+from db import Base
+import models  # Registers the tables on Base
+from parkinson_common.migration_runner import Migrations, create_index
+
+migrations = Migrations(Base.metadata)
+
+
+def model_index(table, name):
+    return next(index for index in Base.metadata.tables[table].indexes if index.name == name)
+
+
+@migrations.register(1)
+def baseline_tables(conn):
+    # Tables added to the models before versioned migrations, for databases
+    # created without them
+    names = ["patients", "final_reports", "notifications"]
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[name] for name in names])
+
+
+@migrations.register(2)
+def notification_integer_ids(conn):
+    # notifications was first created by hand as "id SERIAL PRIMARY KEY", which
+    # SQLite doesn't take as the row id, so every row got a NULL id. Rebuild it
+    # from the model, numbering the existing rows in insertion order.
+    id_type = next(column["type"] for column in inspect(conn).get_columns("notifications") if column["name"] == "id")
+    if conn.dialect.name != "sqlite" or str(id_type).upper() == "INTEGER":
+        return
+    conn.exec_driver_sql("ALTER TABLE notifications RENAME TO notifications_old")
+    old_indexes = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'notifications_old' AND sql IS NOT NULL"
+    ).scalars().all()
+    for name in old_indexes:
+        conn.exec_driver_sql(f'DROP INDEX "{name}"')
+    models.Notification.__table__.create(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO notifications (doctor_id, patient_id, patient_name, date, report) "
+        "SELECT doctor_id, patient_id, patient_name, date, report FROM notifications_old ORDER BY rowid"
+    )
+    conn.exec_driver_sql("DROP TABLE notifications_old")
+
+
+@migrations.register(3, transactional=False)
+def dashboard_indexes(conn):
+    # Index behind the keyset-paged dashboard
+    create_index(conn, model_index("notifications", "ix_notifications_patient_date"))
+
+
+def upgrade(engine):
+    return migrations.upgrade(engine)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BLOB
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, BLOB, Index
 from db import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 
 
 class Patient(Base):
@@ -27,8 +27,15 @@ class Notification(Base):
     __tablename__ = "notifications"
     
     id = Column(Integer, primary_key=True, index=True)
-    doctor_id = Column(Integer, ForeignKey('doctors.id'))
+    doctor_id = Column(Integer)  # Id in Doctor_app's database, so not a foreign key here
     patient_id = Column(Integer, ForeignKey('patients.id'))  # Add this line
     patient_name = Column(String)
     date = Column(DateTime)
-    report = Column(BLOB) 
\ No newline at end of file
+    # Deferred so listing notifications never loads the report
+    report = deferred(Column(BLOB))
+
+    # Serves each patient's newest-first dashboard
+    __table_args__ = (
+        Index("ix_notifications_patient_date", "patient_id", "date", "id"),
+    )
+ 
\ No newline at end of file
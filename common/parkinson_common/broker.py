@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+
+# Seconds between keep-alive comments on an idle stream, so proxies keep it open
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+# Events a subscriber may fall behind by before its stream is closed
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+# Milliseconds the browser waits before reconnecting a dropped stream
+STREAM_RETRY_MS = 5000
+
+
+def format_event(event_id, event, data):
+    # One Server-Sent Events message
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def last_event_id(request, fallback=0):
+    # Where a stream resumes: the browser's Last-Event-ID header on reconnect,
+    # else the newest id the page was rendered with
+    value = request.headers.get("last-event-id") or fallback
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Subscription:
+    def __init__(self, channel, queue_size):
+        self.channel = channel
+        self.queue = asyncio.Queue(queue_size)
+
+
+class LocalBroker:
+    """Fans events out to the event streams open in this process.
+
+    Channels are names like "doctor:1". Each open stream holds one
+    Subscription, a bounded queue it awaits; an idle stream costs that queue
+    and a keep-alive every STREAM_KEEPALIVE seconds. Event ids are the ids of
+    the rows they announce, so a reconnecting client catches up by replaying
+    rows past its Last-Event-ID from the database. That also covers events
+    published by other worker processes, which this broker doesn't reach.
+
+    publish may be called from any thread (sync endpoints run in the
+    threadpool). A subscriber more than `queue_size` events behind is closed
+    and catches up the same way when the browser reconnects.
+    """
+
+    def __init__(self, keepalive=STREAM_KEEPALIVE, queue_size=STREAM_QUEUE_SIZE):
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._loop = None
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, channel):
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, event_id, event, data):
+        self.published += 1
+        loop = self._loop
+        if loop is None or channel not in self._subscribers:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(channel, (event_id, event, data))
+        else:
+            loop.call_soon_threadsafe(self._deliver, channel, (event_id, event, data))
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # Too far behind: empty the queue and tell the stream to close
+                self.dropped += 1
+                self.unsubscribe(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+    async def stream(self, channel, replay=None):
+        """Body of an event stream response for `channel`.
+
+        `replay` is an async callable returning (event_id, event, data) tuples
+        the client missed; they are sent first, and live events they already
+        cover are skipped.
+        """
+        subscription = self.subscribe(channel)
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            sent = 0
+            if replay is not None:
+                for event_id, event, data in await replay():
+                    sent = max(sent, event_id)
+                    yield format_event(event_id, event, data)
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                event_id, event, data = message
+                if event_id > sent:
+                    yield format_event(event_id, event, data)
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            streams = sum(len(subscribers) for subscribers in self._subscribers.values())
+            channels = len(self._subscribers)
+        return {
+            "open_streams": streams,
+            "channels": channels,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_slow_subscribers": self.dropped,
+        }
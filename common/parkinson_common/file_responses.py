@@ -0,0 +1,128 @@
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from functools import lru_cache
+
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+
+CHUNK_SIZE = 64 * 1024
+# Only a single byte range is honoured; multi-range requests get the whole file
+RANGE_PATTERN = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def etag_matches(header, etag):
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def parse_range(header, size):
+    # Returns the inclusive (start, end) to serve, or None to send the whole file
+    match = RANGE_PATTERN.match(header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def iter_file(path, start, end, chunk_size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, etag, media_type, headers=None):
+    # Serve a file with a strong ETag, 304 revalidation and single-range 206 support
+    size = os.path.getsize(path)
+    base_headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"}
+    base_headers.update(headers or {})
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": base_headers["Cache-Control"]})
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                iter_file(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **base_headers,
+                    "Content-Range": f"bytes {start}-{end}/{size}",
+                    "Content-Length": str(end - start + 1),
+                }
+            )
+
+    return StreamingResponse(
+        iter_file(path, 0, size - 1),
+        media_type=media_type,
+        headers={**base_headers, "Content-Length": str(size)}
+    )
+
+
+@lru_cache(maxsize=4096)
+def _content_etag(path, mtime_ns, size):
+    # Keyed on mtime and size so an edited file is re-hashed
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return f'"{sha.hexdigest()}"'
+
+
+class ConditionalStaticFiles(StaticFiles):
+    # StaticFiles with strong content ETags and byte-range support
+    def lookup_path(self, path):
+        # StaticFiles runs this in a worker thread: hashing the file here
+        # leaves file_response a cached ETag instead of a read on the event loop
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+            _content_etag(str(full_path), stat_result.st_mtime_ns, stat_result.st_size)
+        return full_path, stat_result
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        if status_code != 200:
+            return super().file_response(full_path, stat_result, scope, status_code)
+        full_path = str(full_path)
+        etag = _content_etag(full_path, stat_result.st_mtime_ns, stat_result.st_size)
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        return file_response(Request(scope), full_path, etag, media_type)
@@ -0,0 +1,264 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+# Share (0 to 1) of requests whose whole payloads, such as a report's
+# extracted text, are logged. Off by default: they are large and private.
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "0"))
+
+# Upper bounds in seconds of the latency histograms' buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the queries-per-request histogram's buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def sample_debug():
+    # Whether this call falls in the DEBUG_LOG_SAMPLE_RATE share
+    return DEBUG_LOG_SAMPLE_RATE > 0 and random.random() < DEBUG_LOG_SAMPLE_RATE
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{format_labels(self.labels, key)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def _samples(self, key, counts):
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            total += count
+            bucket = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, bucket)} {total}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {counts[-1]}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, key)} {total}")
+        return lines
+
+
+class Registry:
+    """This worker process's metrics, rendered in the Prometheus text format.
+
+    Each worker process keeps its own, so scrape every worker and sum them
+    in the queries.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def on_collect(self, collector):
+        # Call collector() before each render, to set gauges read from elsewhere
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logging.exception(f"Metrics collector {collector.__qualname__} failed")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "Requests handled, by route and status.", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time from receiving a request to the end of its response.", ("method", "route")
+)
+HTTP_IN_PROGRESS = registry.gauge("http_requests_in_progress", "Requests being handled.", ("method",))
+REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Database queries run per request.", ("route",), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time per request spent in database queries.", ("route",)
+)
+DB_QUERY_SECONDS = registry.histogram("db_query_duration_seconds", "Duration of each database query.")
+
+
+class QueryUsage:
+    # The database queries of one request
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set by MetricsMiddleware for the request being handled. The threadpool runs
+# sync handlers in a copy of the context, which shares the QueryUsage object.
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    DB_QUERY_SECONDS.observe(elapsed)
+    usage = _request_queries.get()
+    if usage is not None:
+        usage.queries += 1
+        usage.seconds += elapsed
+
+
+def instrument_engine(engine):
+    # Time every query run on a sync Engine (an AsyncEngine's is .sync_engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+def route_label(scope):
+    # The route's path template, so /final-reports/1 and /final-reports/2 are
+    # one series; a mount (static files) by its prefix
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("endpoint") is not None and scope.get("root_path"):
+        return scope["root_path"]
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Records latency, status and database use of every HTTP request.
+
+    A plain ASGI middleware: streamed responses (downloads, event streams)
+    pass through as they are, and their duration runs until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        usage = QueryUsage()
+        token = _request_queries.set(usage)
+        HTTP_IN_PROGRESS.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.dec(method=method)
+            _request_queries.reset(token)
+            route = route_label(scope)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status)
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route)
+            REQUEST_DB_QUERIES.observe(usage.queries, route=route)
+            REQUEST_DB_SECONDS.observe(usage.seconds, route=route)
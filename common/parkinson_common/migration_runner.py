@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+# One row per applied migration
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migrations:
+    """An app's schema migrations, applied in version order.
+
+    Each migration is a function taking a Connection, registered with
+    `@migrations.register(version)`. `upgrade` runs the ones not yet in
+    schema_migrations, each in its own transaction with its row there. A new
+    empty database is instead created from the models and marked as fully
+    migrated.
+
+    A released migration never changes; schema changes ship as a new one.
+    Keep them additive (tables, nullable columns, indexes) so they can run
+    while the previous release is still serving.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.steps = []
+
+    def register(self, version, transactional=True):
+        # transactional=False runs the migration on an autocommit connection,
+        # which PostgreSQL needs for CREATE INDEX CONCURRENTLY
+        def decorator(fn):
+            if any(step[0] == version for step in self.steps):
+                raise ValueError(f"Duplicate migration version {version}")
+            self.steps.append((version, fn.__name__, fn, transactional))
+            self.steps.sort(key=lambda step: step[0])
+            return fn
+        return decorator
+
+    def upgrade(self, engine):
+        # Returns the names of the migrations applied
+        with engine.begin() as conn:
+            fresh = not [name for name in inspect(conn).get_table_names() if name != "sqlite_sequence"]
+            schema_migrations.create(conn, checkfirst=True)
+            if fresh:
+                self.metadata.create_all(conn)
+                for version, name, _, _ in self.steps:
+                    record(conn, version, name)
+                return ["create_all"]
+            applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+        done = []
+        for version, name, fn, transactional in self.steps:
+            if version in applied:
+                continue
+            logging.info(f"Applying migration {version} {name}")
+            if transactional:
+                with engine.begin() as conn:
+                    fn(conn)
+                    record(conn, version, name)
+            else:
+                with engine.connect() as conn:
+                    conn.execution_options(isolation_level="AUTOCOMMIT")
+                    fn(conn)
+                    record(conn, version, name)
+            done.append(name)
+        return done
+
+
+def record(conn, version, name):
+    conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.now()))
+
+
+# The helpers below skip what is already there, so they are safe to run after
+# the baseline migration, which builds missing tables from the current models
+
+def has_column(conn, table, column):
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, table, column, ddl_type):
+    if not has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index(conn, index):
+    # Build an index defined on the models if it is missing. PostgreSQL builds
+    # it CONCURRENTLY, so writes go on meanwhile (register the migration with
+    # transactional=False); SQLite holds the write lock while it builds, but
+    # in WAL mode reads go on.
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if conn.dialect.name == "postgresql":
+        ddl = ddl.replace("INDEX", "INDEX CONCURRENTLY", 1)
+    conn.execute(text(ddl))
@@ -0,0 +1,23 @@
+import os
+
+from sqlalchemy import tuple_
+
+# Rows per page of the dashboard and report lists
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "20"))
+
+
+def keyset_page(query, date_column, id_column, before=None, limit=PAGE_SIZE):
+    # One page of `query`, newest first by (date_column, id_column), starting
+    # after the row whose id is `before`. Returns (rows, id to pass as
+    # `before` for the next page, or None on the last page).
+    # Unlike OFFSET, every page is a range scan on an index ending in
+    # (date, id), however deep the page.
+    if before is not None:
+        cursor = query.with_entities(date_column, id_column).filter(id_column == before).first()
+        if cursor is None:
+            return [], None
+        query = query.filter(tuple_(date_column, id_column) < tuple(cursor))
+
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_before = getattr(rows[limit - 1], id_column.key) if len(rows) > limit else None
+    return rows[:limit], next_before
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# bcrypt cost of new hashes; a stored hash of another cost is redone at the
+# next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashes computed at once. bcrypt releases the GIL, so up to one per core helps.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait for a worker before new ones are turned away
+HASH_MAX_QUEUED = int(os.getenv("HASH_MAX_QUEUED", "32"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Password hashing and checking on a few dedicated threads.
+
+    bcrypt is slow on purpose (about a quarter second at cost 12), so it
+    doesn't run in the shared threadpool, where a burst of logins would take
+    every thread and stall the other sync endpoints. At most `workers` hashes
+    run at once and `max_queued` more may wait; past that HasherBusy is
+    raised straight away.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS, max_queued=HASH_MAX_QUEUED):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.rounds = rounds
+        self.workers = max(1, int(workers))
+        self.max_queued = max(0, int(max_queued))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queued:
+                self.rejected += 1
+                raise HasherBusy(f"Password hashing is full ({self._pending} jobs in progress)")
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+    async def hash(self, password):
+        self.hashed += 1
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password, password_hash):
+        # Returns (matches, new hash to store or None). The new hash is given
+        # when the stored one uses another cost or scheme than configured.
+        self.verified += 1
+        matches, new_hash = await self._run(self.context.verify_and_update, password, password_hash)
+        if new_hash is not None:
+            self.rehashed += 1
+        return matches, new_hash
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "in_progress": self._pending,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+            "rejected": self.rejected,
+            "busy_seconds": self.busy_seconds,
+        }
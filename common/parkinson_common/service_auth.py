@@ -0,0 +1,26 @@
+import os
+import secrets
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+# Shared by Doctor_app and Patient_app; calls between them carry it, and the
+# routes only the other app may call require it. Set the same value on both
+# apps in production.
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN", "your_service_token")
+
+
+def service_headers(token=SERVICE_TOKEN):
+    # Headers of a call to the other app (see ServiceClient's headers)
+    return {"Authorization": f"Bearer {token}"}
+
+
+class ServiceAuth:
+    # Dependency of the routes only the other app calls; 403 without the token
+    def __init__(self, token=SERVICE_TOKEN):
+        self.token = token
+
+    def __call__(self, request: Request):
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), self.token.encode()):
+            raise HTTPException(status_code=403, detail="Only the other app may call this")
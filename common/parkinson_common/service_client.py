@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+from starlette.concurrency import iterate_in_threadpool
+
+from .metrics import registry
+
+# Timeouts in seconds for calls to the other app
+SERVICE_CONNECT_TIMEOUT = float(os.getenv("SERVICE_CONNECT_TIMEOUT", "2"))
+SERVICE_READ_TIMEOUT = float(os.getenv("SERVICE_READ_TIMEOUT", "10"))
+# Retries after the first attempt, with full-jitter exponential backoff
+SERVICE_RETRIES = int(os.getenv("SERVICE_RETRIES", "2"))
+SERVICE_BACKOFF = float(os.getenv("SERVICE_BACKOFF", "0.2"))
+# Consecutive failures that open the circuit, and seconds before a trial call
+SERVICE_BREAKER_THRESHOLD = int(os.getenv("SERVICE_BREAKER_THRESHOLD", "5"))
+SERVICE_BREAKER_RESET = float(os.getenv("SERVICE_BREAKER_RESET", "30"))
+
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+OUTBOUND_SECONDS = registry.histogram(
+    "outbound_request_duration_seconds",
+    "Duration of each attempt of a call to the other app, until its response headers.",
+    ("peer", "method", "path", "status"),
+)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling a peer that keeps failing.
+
+    A failure is a call that got no response or a 5xx one. After
+    `threshold` consecutive failures calls fail fast with CircuitOpen
+    for `reset_after` seconds; then one trial call is let through, and its
+    outcome closes the circuit again or restarts the wait.
+    """
+
+    def __init__(self, threshold=SERVICE_BREAKER_THRESHOLD, reset_after=SERVICE_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._trial_running):
+            raise CircuitOpen("Circuit is open after repeated failures")
+        if state == "half-open":
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release_trial(self):
+        # A call ended without an outcome (cancelled, or failed before the
+        # peer answered): let the next call be the trial
+        self._trial_running = False
+
+
+class ServiceClient:
+    """Async HTTP client for one peer app, shared by all requests of a worker.
+
+    Connections are kept alive and pooled. Failed calls are retried with
+    jittered backoff: idempotent requests on transport errors and 502/503/504,
+    others only when the connection could not be made (so the request was
+    never sent). Multipart bodies are streamed from file objects, which are
+    rewound on each attempt, and read in the threadpool. `headers` go with
+    every call, e.g. service_auth.service_headers().
+    """
+
+    def __init__(self, base_url, retries=SERVICE_RETRIES, backoff=SERVICE_BACKOFF, breaker=None, headers=None):
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @property
+    def client(self):
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=httpx.Timeout(SERVICE_READ_TIMEOUT, connect=SERVICE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+        return self._client
+
+    def _should_retry(self, method, error=None, response=None):
+        if error is not None:
+            return method in IDEMPOTENT_METHODS or isinstance(error, httpx.ConnectError)
+        return method in IDEMPOTENT_METHODS and response.status_code in RETRY_STATUSES
+
+    def _threadpool_files(self, kwargs):
+        # httpx reads the `files` of a multipart request on the event loop,
+        # blocking it on disk reads. Encode the body here instead and read it
+        # in the threadpool; each call starts it over, rewinding the files.
+        if not kwargs.get("files"):
+            return kwargs
+        kwargs = dict(kwargs)
+        encoded = httpx.Request("POST", self.base_url, data=kwargs.pop("data", None), files=kwargs.pop("files"))
+        headers = {**(kwargs.pop("headers", None) or {}), "Content-Type": encoded.headers["content-type"]}
+        if "content-length" in encoded.headers:
+            headers["Content-Length"] = encoded.headers["content-length"]
+        return {**kwargs, "headers": headers, "content": iterate_in_threadpool(iter(encoded.stream))}
+
+    async def request(self, method, path, **kwargs):
+        # Returns the httpx.Response; raises httpx.HTTPError or CircuitOpen
+        method = method.upper()
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self.rejected += 1
+            raise
+        self.requests += 1
+
+        # The path without its query string, so pages of a list are one series
+        endpoint = httpx.URL(path).path
+        attempt = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = await self.client.request(method, path, **self._threadpool_files(kwargs))
+                except httpx.TransportError as e:
+                    OUTBOUND_SECONDS.observe(
+                        time.perf_counter() - started, peer=self.base_url, method=method, path=endpoint, status="error"
+                    )
+                    if attempt < self.retries and self._should_retry(method, error=e):
+                        attempt = await self._wait(attempt, f"{method} {path} failed: {e!r}")
+                        continue
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise
+                OUTBOUND_SECONDS.observe(
+                    time.perf_counter() - started, peer=self.base_url, method=method, path=endpoint,
+                    status=response.status_code
+                )
+
+                if response.status_code >= 500:
+                    if attempt < self.retries and self._should_retry(method, response=response):
+                        await response.aclose()
+                        attempt = await self._wait(attempt, f"{method} {path} returned {response.status_code}")
+                        continue
+                    self.failures += 1
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return response
+        except BaseException:
+            # Whatever ended the call, a half-open trial mustn't stay taken
+            # and keep the circuit refusing calls for good
+            self.breaker.release_trial()
+            raise
+
+    async def _wait(self, attempt, reason):
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        logging.warning(f"{reason}; retrying in {delay:.2f}s")
+        self.retried += 1
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "rejected_by_circuit": self.rejected,
+        }
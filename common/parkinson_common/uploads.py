@@ -0,0 +1,395 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import time
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Resumable uploads, a subset of the tus 1.0 protocol (https://tus.io):
+# creation, checksum (sha256), termination and expiration.
+TUS_VERSION = "1.0.0"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Largest upload accepted, in bytes
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+# Largest single PATCH accepted, and the chunk size used when sending
+UPLOAD_MAX_CHUNK = int(os.getenv("UPLOAD_MAX_CHUNK", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Hours an unfinished upload is kept after its last chunk
+UPLOAD_EXPIRY_HOURS = float(os.getenv("UPLOAD_EXPIRY_HOURS", "24"))
+# Unfinished uploads one owner may have at once, and the bytes they may
+# declare in total, so no single caller can fill the disk
+UPLOAD_OWNER_MAX_UPLOADS = int(os.getenv("UPLOAD_OWNER_MAX_UPLOADS", "5"))
+UPLOAD_OWNER_MAX_BYTES = int(os.getenv("UPLOAD_OWNER_MAX_BYTES", str(2 * UPLOAD_MAX_SIZE)))
+# Received bytes gathered before each write, which runs in the threadpool
+UPLOAD_WRITE_BUFFER = 1024 * 1024
+# Failed chunks in a row before send_file gives up
+UPLOAD_SEND_ATTEMPTS = int(os.getenv("UPLOAD_SEND_ATTEMPTS", "5"))
+
+UPLOAD_ID = re.compile(r"^[A-Za-z0-9_-]{22}$")
+# Byte locked on Windows, where locks are mandatory: far past the end of any
+# upload, so the lock never covers bytes being read or written
+LOCK_OFFSET = 2 ** 40
+
+
+class UploadError(Exception):
+    def __init__(self, status_code, detail, headers=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers or {}
+
+
+def tus_headers(**headers):
+    # Response headers of the upload endpoints; Upload_Offset=1 -> Upload-Offset: 1
+    return {"Tus-Resumable": TUS_VERSION, **{name.replace("_", "-"): str(value) for name, value in headers.items()}}
+
+
+def header_int(request, name):
+    try:
+        value = int(request.headers[name])
+    except (KeyError, ValueError):
+        raise UploadError(400, f"Missing or invalid {name} header")
+    if value < 0:
+        raise UploadError(400, f"Invalid {name} header")
+    return value
+
+
+def parse_checksum(header):
+    # "sha256 <base64 digest>" to the raw digest, or None without a header
+    if not header:
+        return None
+    algorithm, _, encoded = header.partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError(400, f"Unsupported checksum algorithm {algorithm!r}, use sha256")
+    try:
+        return base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise UploadError(400, "Invalid Upload-Checksum header")
+
+
+def parse_metadata(header):
+    # Upload-Metadata ("key base64value,key2 ...") to a dict of str
+    metadata = {}
+    for pair in filter(None, (pair.strip() for pair in (header or "").split(","))):
+        key, _, encoded = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode()
+        except ValueError:
+            raise UploadError(400, "Invalid Upload-Metadata header")
+    return metadata
+
+
+def metadata_header(**values):
+    return ",".join(f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in values.items())
+
+
+def checksum_header(data):
+    return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def try_lock(f):
+    # Exclusive lock of the open file f, across processes; False if another
+    # handle holds it. Released by unlock() or when the process exits.
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+    else:
+        f.seek(LOCK_OFFSET)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+    return True
+
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(LOCK_OFFSET)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class UploadStore:
+    """Uploads received in chunks and assembled on disk.
+
+    Each upload is `<id>.part`, the bytes received so far, and `<id>.json`,
+    its declared length and owner. The size of the .part file is the upload's
+    offset, so an interrupted transfer resumes from what actually reached the
+    disk. A chunk with a checksum is kept only if it matches; a chunk without
+    one keeps whatever arrived before an interruption. Chunks are streamed to
+    the file, so memory per upload stays constant whatever its size.
+    """
+
+    def __init__(self, root=UPLOAD_DIR, max_size=UPLOAD_MAX_SIZE, max_chunk=UPLOAD_MAX_CHUNK,
+                 expiry_hours=UPLOAD_EXPIRY_HOURS, owner_max_uploads=UPLOAD_OWNER_MAX_UPLOADS,
+                 owner_max_bytes=UPLOAD_OWNER_MAX_BYTES):
+        self.root = root
+        self.max_size = max_size
+        self.max_chunk = max_chunk
+        self.expiry_seconds = expiry_hours * 3600
+        self.owner_max_uploads = owner_max_uploads
+        self.owner_max_bytes = owner_max_bytes
+        self._next_purge = 0.0
+
+        self.created = 0
+        self.chunks = 0
+        self.bytes_received = 0
+        self.checksum_failures = 0
+        self.offset_conflicts = 0
+        self.quota_rejections = 0
+
+    def _path(self, upload_id, suffix):
+        if not UPLOAD_ID.match(upload_id):
+            raise UploadError(404, "Upload not found")
+        return os.path.join(self.root, f"{upload_id}{suffix}")
+
+    def capabilities(self):
+        return tus_headers(
+            Tus_Version=TUS_VERSION,
+            Tus_Max_Size=self.max_size,
+            Tus_Extension="creation,checksum,termination,expiration",
+            Tus_Checksum_Algorithm="sha256",
+        )
+
+    def create(self, length, owner=None):
+        if length == 0 or length > self.max_size:
+            raise UploadError(413, f"Uploads must be 1 to {self.max_size} bytes", tus_headers(Tus_Max_Size=self.max_size))
+        self.purge_expired()
+        # Checked, then created: concurrent creates of one owner may both get through
+        uploads, declared = self.owner_usage(owner)
+        if uploads >= self.owner_max_uploads or declared + length > self.owner_max_bytes:
+            self.quota_rejections += 1
+            raise UploadError(429, "Too many unfinished uploads; finish or delete one first")
+        os.makedirs(self.root, exist_ok=True)
+        upload_id = secrets.token_urlsafe(16)
+        open(self._path(upload_id, ".part"), "xb").close()
+        info_path = self._path(upload_id, ".json")
+        with open(f"{info_path}.tmp", "w") as f:
+            json.dump({"length": length, "owner": owner, "created_at": time.time()}, f)
+        os.replace(f"{info_path}.tmp", info_path)
+        self.created += 1
+        return upload_id
+
+    def info(self, upload_id, owner=None):
+        # {"length", "offset", "owner", ...}; 404 for another owner's upload
+        try:
+            with open(self._path(upload_id, ".json")) as f:
+                info = json.load(f)
+            info["offset"] = os.path.getsize(self._path(upload_id, ".part"))
+        except FileNotFoundError:
+            raise UploadError(404, "Upload not found")
+        if owner is not None and info["owner"] != owner:
+            raise UploadError(404, "Upload not found")
+        return info
+
+    def owner_usage(self, owner):
+        # (unfinished uploads, bytes they declared) of `owner`; a finished
+        # upload counts until it is deleted, as it still takes up the space
+        uploads = declared = 0
+        if not os.path.isdir(self.root):
+            return uploads, declared
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name)) as f:
+                    info = json.load(f)
+            except (FileNotFoundError, ValueError):
+                # Deleted meanwhile, or being replaced
+                continue
+            if info.get("owner") == owner:
+                uploads += 1
+                declared += info["length"]
+        return uploads, declared
+
+    def set_info(self, upload_id, **values):
+        info_path = self._path(upload_id, ".json")
+        with open(info_path) as f:
+            info = json.load(f)
+        info.update(values)
+        with open(f"{info_path}.tmp", "w") as f:
+            json.dump(info, f)
+        os.replace(f"{info_path}.tmp", info_path)
+
+    async def append(self, upload_id, offset, chunks, checksum=None, owner=None):
+        # Write the body `chunks` (an async iterator of bytes) at `offset`;
+        # returns the new offset. checksum is the Upload-Checksum header.
+        info = self.info(upload_id, owner)
+        expected = parse_checksum(checksum)
+        f = open(self._path(upload_id, ".part"), "r+b")
+        # One writer per upload, across requests and worker processes
+        if not try_lock(f):
+            f.close()
+            raise UploadError(423, "Another request is writing this upload")
+        try:
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                self.offset_conflicts += 1
+                raise UploadError(409, f"Upload is at offset {current}", tus_headers(Upload_Offset=current))
+
+            f.seek(current)
+            sha = hashlib.sha256()
+            written = 0
+            # Received but not yet written; written a megabyte at a time in
+            # the threadpool, so disk writes don't block the event loop
+            pending, pending_size = [], 0
+            try:
+                async for chunk in chunks:
+                    written += len(chunk)
+                    if written > self.max_chunk or current + written > info["length"]:
+                        raise UploadError(413, "Chunk is larger than allowed or runs past the upload's length")
+                    sha.update(chunk)
+                    pending.append(chunk)
+                    pending_size += len(chunk)
+                    if pending_size >= UPLOAD_WRITE_BUFFER:
+                        data, pending, pending_size = b"".join(pending), [], 0
+                        await run_in_threadpool(f.write, data)
+                data, pending = b"".join(pending), []
+                await run_in_threadpool(f.write, data)
+                if expected is not None and sha.digest() != expected:
+                    self.checksum_failures += 1
+                    raise UploadError(460, "Checksum mismatch")
+            except BaseException as e:
+                # Drop the chunk, except the part received before an
+                # interruption when there was no checksum to check it against
+                if expected is not None or isinstance(e, UploadError):
+                    f.flush()
+                    f.truncate(current)
+                else:
+                    f.write(b"".join(pending))
+                if isinstance(e, ClientDisconnect):
+                    raise UploadError(400, "Client disconnected during the chunk") from e
+                raise
+            finally:
+                f.flush()
+                await run_in_threadpool(os.fsync, f.fileno())
+                os.utime(self._path(upload_id, ".json"))
+        finally:
+            unlock(f)
+            f.close()
+
+        self.chunks += 1
+        self.bytes_received += written
+        return current + written
+
+    def completed_path(self, upload_id, owner=None):
+        # Path of the assembled file; 409 while bytes are missing
+        info = self.info(upload_id, owner)
+        if info["offset"] != info["length"]:
+            raise UploadError(409, f"Upload is incomplete ({info['offset']} of {info['length']} bytes)",
+                              tus_headers(Upload_Offset=info["offset"]))
+        return self._path(upload_id, ".part")
+
+    def delete(self, upload_id):
+        for suffix in (".json", ".part"):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self):
+        # Remove uploads without a chunk for expiry_hours; runs at most every minute
+        now = time.time()
+        if now < self._next_purge or not os.path.isdir(self.root):
+            return
+        self._next_purge = now + 60
+        for name in os.listdir(self.root):
+            if name.endswith(".json"):
+                path = os.path.join(self.root, name)
+                try:
+                    if os.path.getmtime(path) < now - self.expiry_seconds:
+                        self.delete(name[:-len(".json")])
+                except (FileNotFoundError, UploadError):
+                    pass
+
+    def stats(self):
+        return {
+            "max_size": self.max_size,
+            "max_chunk": self.max_chunk,
+            "created": self.created,
+            "chunks": self.chunks,
+            "bytes_received": self.bytes_received,
+            "checksum_failures": self.checksum_failures,
+            "offset_conflicts": self.offset_conflicts,
+            "quota_rejections": self.quota_rejections,
+        }
+
+
+def read_chunk(path, offset, size):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+async def create_upload(client, length, owner=None):
+    # Start an upload of `length` bytes on the peer behind `client` (a
+    # ServiceClient), counted against `owner`'s quota there; returns its URL
+    headers = tus_headers(Upload_Length=length)
+    if owner is not None:
+        headers["Upload-Metadata"] = metadata_header(owner=owner)
+    response = await client.post("/uploads", headers=headers)
+    if response.status_code != 201:
+        raise UploadError(response.status_code, f"Creating the upload failed: {response.text}")
+    return response.headers["location"]
+
+
+async def send_file(client, path, upload_url, chunk_size=UPLOAD_CHUNK_SIZE, attempts=UPLOAD_SEND_ATTEMPTS):
+    # Send the file at `path` to the upload at `upload_url`, from the offset
+    # the peer already has, until the peer has every byte. Only one chunk is
+    # in memory at a time.
+    length = os.path.getsize(path)
+    response = await client.request("HEAD", upload_url, headers=tus_headers())
+    if response.status_code != 200:
+        raise UploadError(response.status_code, f"Upload {upload_url} is gone")
+    offset = int(response.headers["upload-offset"])
+
+    failures = 0
+    while offset < length:
+        chunk = await run_in_threadpool(read_chunk, path, offset, chunk_size)
+        try:
+            response = await client.request(
+                "PATCH", upload_url, content=chunk,
+                headers=tus_headers(
+                    Content_Type="application/offset+octet-stream",
+                    Upload_Offset=offset,
+                    Upload_Checksum=checksum_header(chunk),
+                )
+            )
+            if response.status_code == 204:
+                offset = int(response.headers["upload-offset"])
+                failures = 0
+                continue
+            if response.status_code not in (409, 423, 460) and response.status_code < 500:
+                raise UploadError(response.status_code, f"Chunk at {offset} was refused: {response.text}")
+            reason = f"status {response.status_code}"
+        except httpx.TransportError as e:
+            reason = repr(e)
+
+        # Ask the peer what it has, and carry on from there
+        failures += 1
+        if failures >= attempts:
+            raise UploadError(502, f"Sending {upload_url} failed {failures} times, last: {reason}")
+        logging.warning(f"Chunk at {offset} of {upload_url} failed ({reason}); resuming")
+        await asyncio.sleep(min(2.0, 0.1 * 2 ** failures))
+        try:
+            response = await client.request("HEAD", upload_url, headers=tus_headers())
+            offset = int(response.headers["upload-offset"])
+        except (httpx.TransportError, KeyError, ValueError):
+            pass
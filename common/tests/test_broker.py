@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from starlette.requests import Request
+
+from parkinson_common.broker import STREAM_RETRY_MS, LocalBroker, format_event, last_event_id
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def parse(message):
+    # {"id", "event", "data"} of one formatted event
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return {"id": int(fields["id"]), "event": fields["event"], "data": json.loads(fields["data"])}
+
+
+async def opened(broker, channel, replay=None):
+    # A stream past its retry line, subscribed and ready for events
+    stream = broker.stream(channel, replay)
+    assert await stream.__anext__() == f"retry: {STREAM_RETRY_MS}\n\n"
+    return stream
+
+
+def test_format_event():
+    assert parse(format_event(3, "notification", {"id": 3, "name": "Akhil"})) == {
+        "id": 3, "event": "notification", "data": {"id": 3, "name": "Akhil"}
+    }
+
+
+@pytest.mark.parametrize("header, fallback, expected", [
+    (None, 0, 0), (None, 7, 7), ("12", 7, 12), ("junk", 7, 0), ("-5", 0, 0), (None, None, 0),
+])
+def test_last_event_id(header, fallback, expected):
+    headers = [(b"last-event-id", header.encode())] if header is not None else []
+    assert last_event_id(Request({"type": "http", "headers": headers}), fallback) == expected
+
+
+def test_live_events():
+    async def scenario():
+        broker = LocalBroker()
+        stream = await opened(broker, "doctor:1")
+        broker.publish("doctor:1", 1, "notification", {"id": 1})
+        broker.publish("doctor:2", 2, "notification", {"id": 2})
+        broker.publish("doctor:1", 3, "notification", {"id": 3})
+        received = [parse(await stream.__anext__()) for _ in range(2)]
+        await stream.aclose()
+        return broker, received
+
+    broker, received = run(scenario())
+    assert [event["id"] for event in received] == [1, 3]
+    assert broker.stats()["open_streams"] == 0
+    assert broker.stats()["published"] == 3
+    assert broker.stats()["delivered"] == 2
+
+
+def test_replay_then_live_without_duplicates():
+    async def scenario():
+        broker = LocalBroker()
+
+        async def replay():
+            # Rows the client missed, including one also published live meanwhile
+            broker.publish("doctor:1", 5, "notification", {"id": 5})
+            return [(4, "notification", {"id": 4}), (5, "notification", {"id": 5})]
+
+        stream = broker.stream("doctor:1", replay)
+        await stream.__anext__()
+        received = [parse(await stream.__anext__()) for _ in range(2)]
+        broker.publish("doctor:1", 6, "notification", {"id": 6})
+        received.append(parse(await stream.__anext__()))
+        await stream.aclose()
+        return received
+
+    assert [event["id"] for event in run(scenario())] == [4, 5, 6]
+
+
+def test_keepalive():
+    async def scenario():
+        broker = LocalBroker(keepalive=0.01)
+        stream = await opened(broker, "doctor:1")
+        message = await stream.__anext__()
+        await stream.aclose()
+        return message
+
+    assert run(scenario()) == ": keep-alive\n\n"
+
+
+def test_publish_from_another_thread():
+    async def scenario():
+        broker = LocalBroker()
+        stream = await opened(broker, "doctor:1")
+        next_message = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        thread = threading.Thread(target=broker.publish, args=("doctor:1", 9, "notification", {"id": 9}))
+        thread.start()
+        thread.join()
+        message = parse(await next_message)
+        await stream.aclose()
+        return message
+
+    assert run(scenario())["id"] == 9
+
+
+def test_slow_subscriber_closed():
+    async def scenario():
+        broker = LocalBroker(queue_size=2)
+        stream = await opened(broker, "doctor:1")
+        for event_id in range(1, 4):
+            broker.publish("doctor:1", event_id, "notification", {"id": event_id})
+        # The queue was emptied; the stream ends instead of sending stale events
+        remaining = [message async for message in stream]
+        return broker, remaining
+
+    broker, remaining = run(scenario())
+    assert remaining == []
+    assert broker.stats()["dropped_slow_subscribers"] == 1
+    assert broker.stats()["open_streams"] == 0
+
+
+def test_publish_without_subscribers():
+    broker = LocalBroker()
+    broker.publish("doctor:1", 1, "notification", {})
+    assert broker.stats()["delivered"] == 0
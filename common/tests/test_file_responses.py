@@ -0,0 +1,141 @@
+import hashlib
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from parkinson_common.file_responses import ConditionalStaticFiles, _content_etag, file_response
+
+CONTENT = bytes(range(256)) * 4
+ETAG = '"report-etag"'
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / "report.pdf").write_bytes(CONTENT)
+    return tmp_path
+
+
+@pytest.fixture
+def client(static_dir):
+    def report(request):
+        return file_response(request, str(static_dir / "report.pdf"), ETAG, "application/pdf")
+
+    app = Starlette(routes=[
+        Route("/report", report),
+        Mount("/static", ConditionalStaticFiles(directory=str(static_dir))),
+    ])
+    return TestClient(app)
+
+
+def test_full_response(client):
+    response = client.get("/report")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == ETAG
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(CONTENT))
+
+
+@pytest.mark.parametrize("header", [ETAG, f"W/{ETAG}", f'"other", {ETAG}', "*"])
+def test_if_none_match_revalidates(client, header):
+    response = client.get("/report", headers={"If-None-Match": header})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == ETAG
+
+
+def test_if_none_match_stale(client):
+    response = client.get("/report", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-0", 0, 0),
+    ("bytes=10-19", 10, 19),
+    ("bytes=1000-", 1000, len(CONTENT) - 1),
+    ("bytes=-24", len(CONTENT) - 24, len(CONTENT) - 1),
+    ("bytes=1020-5000", 1020, len(CONTENT) - 1),
+    ("bytes=-5000", 0, len(CONTENT) - 1),
+])
+def test_range(client, header, start, end):
+    response = client.get("/report", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+    assert response.headers["etag"] == ETAG
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=5000-6000", "bytes=-0"])
+def test_range_not_satisfiable(client, header):
+    response = client.get("/report", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "bytes=9-3", "items=0-1", "bytes=-"])
+def test_unsupported_range_sends_whole_file(client, header):
+    response = client.get("/report", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range_current(client):
+    response = client.get("/report", headers={"Range": "bytes=0-9", "If-Range": ETAG})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+def test_if_range_stale_sends_whole_file(client):
+    response = client.get("/report", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match_wins_over_range(client):
+    response = client.get("/report", headers={"Range": "bytes=0-9", "If-None-Match": ETAG})
+    assert response.status_code == 304
+
+
+def test_static_content_etag(client):
+    response = client.get("/static/report.pdf")
+    etag = f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == etag
+    assert client.get("/static/report.pdf", headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get("/static/report.pdf", headers={"Range": "bytes=-4", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-4:]
+
+
+def test_static_etag_changes_with_file(client, static_dir):
+    old = client.get("/static/report.pdf").headers["etag"]
+    path = static_dir / "report.pdf"
+    path.write_bytes(b"edited")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    response = client.get("/static/report.pdf", headers={"If-None-Match": old})
+    assert response.status_code == 200
+    assert response.content == b"edited"
+    assert response.headers["etag"] == f'"{hashlib.sha256(b"edited").hexdigest()}"'
+
+
+def test_static_etag_hashed_in_lookup(static_dir):
+    # The hash is computed in lookup_path, which StaticFiles runs in a worker
+    # thread; file_response only reads it from the cache
+    static = ConditionalStaticFiles(directory=str(static_dir))
+    full_path, stat_result = static.lookup_path("report.pdf")
+    before = _content_etag.cache_info().hits
+    static.file_response(full_path, stat_result, {"type": "http", "method": "GET", "headers": []})
+    assert _content_etag.cache_info().hits == before + 1
+
+
+def test_static_missing_file(client):
+    assert client.get("/static/missing.pdf").status_code == 404
@@ -0,0 +1,20 @@
+import pytest
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+from parkinson_common.service_auth import ServiceAuth, service_headers
+
+
+def request(headers):
+    return Request({"type": "http", "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]})
+
+
+def test_token_accepted():
+    ServiceAuth("secret")(request(service_headers("secret")))
+
+
+@pytest.mark.parametrize("headers", [{}, service_headers("wrong"), {"Authorization": "Basic secret"}, {"Authorization": "secret"}])
+def test_token_refused(headers):
+    with pytest.raises(HTTPException) as error:
+        ServiceAuth("secret")(request(headers))
+    assert error.value.status_code == 403
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from io import BytesIO
+
+import httpx
+import pytest
+
+from parkinson_common.service_client import CircuitBreaker, CircuitOpen, ServiceClient
+
+
+def client_for(handler, **kwargs):
+    # A ServiceClient whose calls go to handler(request) instead of the network
+    client = ServiceClient("http://peer", backoff=0, **kwargs)
+    client._client = httpx.AsyncClient(base_url="http://peer", headers=client.headers,
+                                       transport=httpx.MockTransport(handler))
+    return client
+
+
+def statuses(*codes):
+    # Handler answering with each status in turn, and the requests it got
+    codes, seen = list(codes), []
+
+    async def handler(request):
+        seen.append(request)
+        await request.aread()
+        return httpx.Response(codes.pop(0))
+    return handler, seen
+
+
+def call(client, method="GET", path="/x", **kwargs):
+    async def run():
+        try:
+            response = await client.request(method, path, **kwargs)
+            return response.status_code
+        except CircuitOpen:
+            return "open"
+    return asyncio.run(run())
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=3, reset_after=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_count():
+    breaker = CircuitBreaker(threshold=2, reset_after=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker(threshold=5, reset_after=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_released_trial():
+    breaker = CircuitBreaker(threshold=1, reset_after=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.release_trial()
+    breaker.before_call()
+
+
+@pytest.mark.parametrize("status", [500, 501, 503])
+def test_server_errors_open_circuit(status):
+    handler, seen = statuses(*[status] * 10)
+    client = client_for(handler, retries=0, breaker=CircuitBreaker(threshold=3, reset_after=60))
+    assert [call(client, "POST") for _ in range(4)] == [status] * 3 + ["open"]
+    assert len(seen) == 3
+    assert client.stats()["failures"] == 3
+    assert client.stats()["rejected_by_circuit"] == 1
+
+
+@pytest.mark.parametrize("status", [200, 404, 409])
+def test_other_statuses_are_successes(status):
+    handler, _ = statuses(*[status] * 10)
+    client = client_for(handler, retries=0, breaker=CircuitBreaker(threshold=2, reset_after=60))
+    assert [call(client) for _ in range(5)] == [status] * 5
+    assert client.breaker.state == "closed"
+
+
+def test_idempotent_retry():
+    handler, seen = statuses(503, 502, 200)
+    client = client_for(handler, retries=2)
+    assert call(client) == 200
+    assert len(seen) == 3
+    assert client.stats()["retries"] == 2
+    assert client.breaker.failures == 0
+
+
+def test_post_not_retried_on_server_error():
+    handler, seen = statuses(503, 200)
+    client = client_for(handler, retries=2)
+    assert call(client, "POST") == 503
+    assert len(seen) == 1
+
+
+def test_half_open_trial_closes_circuit():
+    handler, _ = statuses(500, 200, 200)
+    client = client_for(handler, retries=0, breaker=CircuitBreaker(threshold=1, reset_after=0.05))
+    assert call(client) == 500
+    assert call(client) == "open"
+    time.sleep(0.06)
+    assert call(client) == 200
+    assert client.breaker.state == "closed"
+
+
+class ThreadRecordingFile(BytesIO):
+    # Records the threads that read it
+    def __init__(self, data):
+        super().__init__(data)
+        self.threads = set()
+
+    def read(self, *args):
+        self.threads.add(threading.get_ident())
+        return super().read(*args)
+
+
+def test_multipart_files_read_off_event_loop():
+    bodies = []
+
+    async def handler(request):
+        bodies.append(await request.aread())
+        return httpx.Response(200)
+
+    report = ThreadRecordingFile(b"%PDF-1.4 report" * 1000)
+    client = client_for(handler)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await client.post("/receive-report", data={"doctor_id": 1}, files={"report": ("report", report, "application/pdf")})
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert report.threads and loop_thread not in report.threads
+    assert b'name="doctor_id"' in bodies[0]
+    assert b"%PDF-1.4 report" * 1000 in bodies[0]
+
+
+def test_multipart_retry_resends_whole_file():
+    bodies, attempts = [], []
+
+    async def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused")
+        bodies.append(await request.aread())
+        return httpx.Response(200)
+
+    client = client_for(handler, retries=1)
+    report = BytesIO(b"report bytes")
+    assert call(client, "POST", "/receive-report", files={"report": ("report", report, "application/pdf")}) == 200
+    assert len(attempts) == 2
+    assert b"report bytes" in bodies[0]
+    assert attempts[1].headers["content-length"] == str(len(bodies[0]))
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from parkinson_common import uploads as uploads_module
+from parkinson_common.uploads import (
+    UploadError, UploadStore, checksum_header, metadata_header, parse_checksum, parse_metadata
+)
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path), max_size=len(DATA) * 4, max_chunk=len(DATA))
+
+
+async def body(*chunks, error=None):
+    for chunk in chunks:
+        yield chunk
+    if error is not None:
+        raise error
+
+
+def append(store, upload_id, offset, *chunks, checksum=None, owner=None, error=None):
+    return asyncio.run(store.append(upload_id, offset, body(*chunks, error=error), checksum, owner))
+
+
+def part(store, upload_id):
+    with open(store._path(upload_id, ".part"), "rb") as f:
+        return f.read()
+
+
+def test_chunks_assemble(store):
+    upload_id = store.create(len(DATA))
+    assert store.info(upload_id)["offset"] == 0
+    assert append(store, upload_id, 0, DATA[:100], DATA[100:1000]) == 1000
+    assert store.info(upload_id)["offset"] == 1000
+    assert append(store, upload_id, 1000, DATA[1000:], checksum=checksum_header(DATA[1000:])) == len(DATA)
+    with open(store.completed_path(upload_id), "rb") as f:
+        assert f.read() == DATA
+    assert store.stats()["chunks"] == 2
+    assert store.stats()["bytes_received"] == len(DATA)
+
+
+def test_large_chunk_written_in_parts(store, monkeypatch):
+    monkeypatch.setattr(uploads_module, "UPLOAD_WRITE_BUFFER", 1000)
+    upload_id = store.create(len(DATA))
+    pieces = [DATA[i:i + 300] for i in range(0, len(DATA), 300)]
+    assert append(store, upload_id, 0, *pieces) == len(DATA)
+    assert part(store, upload_id) == DATA
+
+
+@pytest.mark.parametrize("offset", [0, 50, 200])
+def test_offset_mismatch(store, offset):
+    upload_id = store.create(len(DATA))
+    append(store, upload_id, 0, DATA[:100])
+    with pytest.raises(UploadError) as error:
+        append(store, upload_id, offset, DATA[offset:offset + 10])
+    assert error.value.status_code == 409
+    assert error.value.headers["Upload-Offset"] == "100"
+    assert part(store, upload_id) == DATA[:100]
+    assert store.stats()["offset_conflicts"] == 1
+
+
+def test_checksum_mismatch_drops_chunk(store):
+    upload_id = store.create(len(DATA))
+    append(store, upload_id, 0, DATA[:100])
+    with pytest.raises(UploadError) as error:
+        append(store, upload_id, 100, DATA[100:200], checksum=checksum_header(b"other"))
+    assert error.value.status_code == 460
+    assert store.info(upload_id)["offset"] == 100
+    assert store.stats()["checksum_failures"] == 1
+    assert append(store, upload_id, 100, DATA[100:200], checksum=checksum_header(DATA[100:200])) == 200
+
+
+def test_interrupted_chunk_keeps_received_part(store):
+    upload_id = store.create(len(DATA))
+    with pytest.raises(UploadError) as error:
+        append(store, upload_id, 0, DATA[:300], error=ClientDisconnect())
+    assert error.value.status_code == 400
+    assert part(store, upload_id) == DATA[:300]
+
+
+def test_interrupted_chunk_with_checksum_dropped(store):
+    upload_id = store.create(len(DATA))
+    with pytest.raises(UploadError):
+        append(store, upload_id, 0, DATA[:300], checksum=checksum_header(DATA[:600]), error=ClientDisconnect())
+    assert store.info(upload_id)["offset"] == 0
+
+
+def test_chunk_past_length(store):
+    upload_id = store.create(100)
+    with pytest.raises(UploadError) as error:
+        append(store, upload_id, 0, DATA[:101])
+    assert error.value.status_code == 413
+    assert store.info(upload_id)["offset"] == 0
+
+
+@pytest.mark.parametrize("length", [0, len(DATA) * 4 + 1])
+def test_create_size_limits(store, length):
+    with pytest.raises(UploadError) as error:
+        store.create(length)
+    assert error.value.status_code == 413
+
+
+def test_incomplete_upload(store):
+    upload_id = store.create(len(DATA))
+    append(store, upload_id, 0, DATA[:10])
+    with pytest.raises(UploadError) as error:
+        store.completed_path(upload_id)
+    assert error.value.status_code == 409
+
+
+def test_other_owner_and_unknown_ids(store):
+    upload_id = store.create(len(DATA), owner=1)
+    assert store.info(upload_id, owner=1)["owner"] == 1
+    for call in (lambda: store.info(upload_id, owner=2), lambda: store.info("x" * 22), lambda: store.info("../etc")):
+        with pytest.raises(UploadError) as error:
+            call()
+        assert error.value.status_code == 404
+
+
+def test_delete(store):
+    upload_id = store.create(len(DATA))
+    store.delete(upload_id)
+    with pytest.raises(UploadError):
+        store.info(upload_id)
+    store.delete(upload_id)
+
+
+def test_expiry(store):
+    old, fresh = store.create(len(DATA)), store.create(len(DATA))
+    past = time.time() - store.expiry_seconds - 1
+    os.utime(store._path(old, ".json"), (past, past))
+    store._next_purge = 0.0
+    store.purge_expired()
+    with pytest.raises(UploadError):
+        store.info(old)
+    assert store.info(fresh)["offset"] == 0
+
+
+def test_chunk_renews_expiry(store):
+    upload_id = store.create(len(DATA))
+    past = time.time() - store.expiry_seconds - 1
+    os.utime(store._path(upload_id, ".json"), (past, past))
+    append(store, upload_id, 0, DATA[:10])
+    store._next_purge = 0.0
+    store.purge_expired()
+    assert store.info(upload_id)["offset"] == 10
+
+
+def test_owner_quota(tmp_path):
+    store = UploadStore(str(tmp_path), max_size=1000, owner_max_uploads=2, owner_max_bytes=1500)
+    first = store.create(500, owner="a")
+    store.create(500, owner="a")
+    with pytest.raises(UploadError) as error:
+        store.create(10, owner="a")
+    assert error.value.status_code == 429
+    store.create(1000, owner="b")
+    with pytest.raises(UploadError):
+        store.create(600, owner="b")
+    store.delete(first)
+    store.create(10, owner="a")
+    assert store.stats()["quota_rejections"] == 2
+
+
+def test_locked_upload(store):
+    upload_id = store.create(len(DATA))
+    with open(store._path(upload_id, ".part"), "r+b") as f:
+        assert uploads_module.try_lock(f)
+        with pytest.raises(UploadError) as error:
+            append(store, upload_id, 0, DATA[:10])
+        assert error.value.status_code == 423
+        uploads_module.unlock(f)
+    assert append(store, upload_id, 0, DATA[:10]) == 10
+
+
+def test_checksum_header():
+    assert parse_checksum(checksum_header(DATA)) == hashlib.sha256(DATA).digest()
+    assert parse_checksum(None) is None
+    for header in ("md5 abc", "sha256 not-base64!"):
+        with pytest.raises(UploadError):
+            parse_checksum(header)
+
+
+def test_metadata():
+    assert parse_metadata(metadata_header(owner=5, name="report 1.pdf")) == {"owner": "5", "name": "report 1.pdf"}
+    assert parse_metadata(None) == {}
+    with pytest.raises(UploadError):
+        parse_metadata("owner !!!")